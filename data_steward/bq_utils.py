@@ -6,11 +6,12 @@ import socket
 import time
 import warnings
 from datetime import datetime
-from io import open
+from io import BytesIO, open
 
 # Third party imports
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 
 # Project imports
 import app_identity
@@ -18,6 +19,7 @@ import common
 import gcs_utils
 import resources
 from constants import bq_utils as bq_consts
+from utils import client_cache
 
 socket.setdefaulttimeout(bq_consts.SOCKET_TIMEOUT)
 
@@ -36,6 +38,7 @@ class BigQueryJobWaitError(RuntimeError):
     BigQueryJobWaitErrorMsg = 'The following BigQuery jobs failed to complete: %s.'
 
     def __init__(self, job_ids, reason=''):
+        self.job_ids = job_ids
         msg = self.BigQueryJobWaitErrorMsg % job_ids
         if reason:
             msg += ' Reason: %s' % reason
@@ -130,7 +133,15 @@ def get_validation_results_dataset_id():
 
 
 def create_service():
-    return build('bigquery', 'v2', cache={})
+    """
+    Get the BigQuery discovery service, built once per thread
+
+    :return: the BigQuery v2 discovery service
+    """
+    client_cache.check_allowed('bigquery_service')
+    return client_cache.get_or_build('bigquery_service',
+                                     (build, 'bigquery', 'v2'),
+                                     lambda: build('bigquery', 'v2', cache={}))
 
 
 def get_table_id(hpo_id, table_name):
@@ -388,6 +399,27 @@ def get_job_details(job_id):
         jobId=job_id).execute(num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
 
 
+def cancel_job(job_id):
+    """
+    Cancel a job and wait for it to stop
+
+    :param job_id: id of the job to cancel
+    :return: the job resource once the job is done, which has no errorResult
+             if the job completed before it could be cancelled
+    :raises BigQueryJobWaitError: if the job does not stop
+    """
+    bq_service = create_service()
+    app_id = app_identity.get_application_id()
+    bq_service.jobs().cancel(
+        projectId=app_id,
+        jobId=job_id).execute(num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
+    incomplete_jobs = wait_on_jobs([job_id])
+    if incomplete_jobs:
+        raise BigQueryJobWaitError(incomplete_jobs,
+                                   'the job did not stop once cancelled')
+    return get_job_details(job_id)
+
+
 def query(q,
           use_legacy_sql=False,
           destination_table_id=None,
@@ -808,10 +840,11 @@ def csv_line_to_sql_row_expr(row: dict, fields: list):
     >>> csv_line_to_sql_row_expr({'int_col': '1234', 'date_col': '2019-01-01', 'str_col': ''}, fields)
     "(1234, '2019-01-01', NULL)"
     """
+    fields_by_name = {field['name']: field for field in fields}
     val_exprs = []
     # TODO refactor for all other types or use external library
     for field_name, val in row.items():
-        field = next(filter(lambda f: f['name'] == field_name, fields), None)
+        field = fields_by_name.get(field_name)
         if field is None:
             raise InvalidOperationError(
                 f'Unable to marshal {val}: field "{field_name}" was not found')
@@ -832,6 +865,104 @@ def csv_line_to_sql_row_expr(row: dict, fields: list):
     return f'({cols})'
 
 
+def _to_bool(val):
+    if val.lower() in [bq_consts.TRUE, '1']:
+        return True
+    if val.lower() in [bq_consts.FALSE, '0']:
+        return False
+    raise ValueError(f'{val} is not a boolean')
+
+
+CSV_VALUE_PARSERS = {
+    'integer': int,
+    'float': float,
+    'boolean': _to_bool,
+}
+
+
+def csv_line_to_json_row(row: dict, fields_by_name: dict):
+    """
+    Translate a dict of strings to a json row typed according to a fields spec
+
+    :param row: dict whose values are all strings
+    :param fields_by_name: dict mapping each field name to its bigquery field
+        spec with keys {name, type, mode, description}
+    :return: dict whose values are None or typed according to the field spec
+    :example:
+    >>> fields_by_name = {'int_col': { 'name': 'int_col', 'type': 'integer', 'mode': 'required', 'description': ''},
+    >>>                   'str_col': { 'name': 'str_col', 'type': 'string',  'mode': 'nullable', 'description': ''}}
+    >>> csv_line_to_json_row({'int_col': '1234', 'str_col': ''}, fields_by_name)
+    {'int_col': 1234, 'str_col': None}
+    """
+    json_row = {}
+    for field_name, val in row.items():
+        field = fields_by_name.get(field_name)
+        if field is None:
+            raise InvalidOperationError(
+                f'Unable to marshal {val}: field "{field_name}" was not found')
+        field_type = field['type'].lower()
+        if not val:
+            if field['mode'].lower() == 'nullable':
+                json_row[field_name] = None
+            elif field_type == 'string':
+                json_row[field_name] = ''
+            else:
+                raise InvalidOperationError(
+                    f'Value not provided for required field {field_name}')
+            continue
+        parser = CSV_VALUE_PARSERS.get(field_type, str)
+        try:
+            json_row[field_name] = parser(val)
+        except ValueError:
+            raise InvalidOperationError(
+                f'Unable to marshal {val}: field "{field_name}" is {field_type}'
+            )
+    return json_row
+
+
+def load_rows(project_id, dataset_id, table_name, rows, fields):
+    """
+    Load rows into a table with a load job whose data is uploaded from memory
+
+    :param project_id: project containing the dataset
+    :param dataset_id: dataset containing the table
+    :param table_name: name of the table to load
+    :param rows: list of dicts of strings as read from a csv file
+    :param fields: fields in list of dicts format
+    :return: the load job resource once the job is done
+    :raises BigQueryJobWaitError: if the load job does not complete
+    """
+    fields_by_name = {field['name']: field for field in fields}
+    data = '\n'.join(
+        json.dumps(csv_line_to_json_row(row, fields_by_name)) for row in rows)
+    load = {
+        bq_consts.SCHEMA: {
+            bq_consts.FIELDS: fields
+        },
+        'destinationTable': {
+            'projectId': project_id,
+            'datasetId': dataset_id,
+            'tableId': table_name
+        },
+        'writeDisposition': bq_consts.WRITE_TRUNCATE,
+        'sourceFormat': bq_consts.NEWLINE_DELIMITED_JSON
+    }
+    job_body = {'configuration': {'load': load}}
+    media = MediaIoBaseUpload(BytesIO(data.encode('utf-8')),
+                              mimetype='application/octet-stream',
+                              resumable=True)
+    bq_service = create_service()
+    insert_result = bq_service.jobs().insert(
+        projectId=app_identity.get_application_id(),
+        body=job_body,
+        media_body=media).execute(num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
+    job_id = insert_result[bq_consts.JOB_REFERENCE][bq_consts.JOB_ID]
+    incomplete_jobs = wait_on_jobs([job_id])
+    if incomplete_jobs:
+        raise BigQueryJobWaitError(incomplete_jobs)
+    return get_job_details(job_id)
+
+
 def load_table_from_csv(project_id,
                         dataset_id,
                         table_name,
@@ -840,6 +971,12 @@ def load_table_from_csv(project_id,
     """
     Loads BQ table from a csv file without making use of GCS buckets
 
+    The csv rows are typed according to fields and loaded with a load job.
+    If the load job cannot be submitted, fails or the rows cannot be
+    marshalled to json, the rows are inserted using a query instead.  A load
+    job which does not complete in time is cancelled first, and its result
+    returned if it completed after all.
+
     :param project_id: project containing the dataset
     :param dataset_id: dataset where the table needs to be created
     :param table_name: name of the table to be created
@@ -847,7 +984,10 @@ def load_table_from_csv(project_id,
                      If None, assumes that the file exists in the resource_files folder with the name table_name.csv
     :param fields: fields in list of dicts format. If set to None, assumes that
                    the fields are stored in a json file in resource_files/fields named table_name.json
-    :return: BQ response for the load query
+    :return: BQ response for the load job, or for the insert query if the
+             load job could not be run
+    :raises BigQueryJobWaitError: if a load job which did not complete does
+             not stop once cancelled
     """
     if csv_path is None:
         csv_path = os.path.join(resources.resource_files_path,
@@ -856,15 +996,34 @@ def load_table_from_csv(project_id,
 
     if fields is None:
         fields = resources.fields_for(table_name)
-    field_names = ', '.join([field['name'] for field in fields])
-    row_exprs = [csv_line_to_sql_row_expr(t, fields) for t in table_list]
-    formatted_mapping_list = ', '.join(row_exprs)
 
     create_table(table_id=table_name,
                  fields=fields,
                  drop_existing=True,
                  dataset_id=dataset_id)
 
+    result = None
+    try:
+        result = load_rows(project_id, dataset_id, table_name, table_list,
+                           fields)
+    except BigQueryJobWaitError as e:
+        # the load job must not commit after the rows are inserted
+        logging.warning(f'Load job for {table_name} did not complete, '
+                        f'cancelling it')
+        result = cancel_job(e.job_ids[0])
+    except (HttpError, InvalidOperationError) as e:
+        logging.warning(f'Unable to run load job for {table_name}: {e}')
+    if result is not None:
+        if 'errorResult' not in result['status']:
+            return result
+        logging.warning(f'Load job for {table_name} failed: '
+                        f"{result['status']['errorResult']['message']}")
+
+    logging.warning(f'Inserting rows into {table_name} using a query instead')
+    field_names = ', '.join([field['name'] for field in fields])
+    row_exprs = [csv_line_to_sql_row_expr(t, fields) for t in table_list]
+    formatted_mapping_list = ', '.join(row_exprs)
+
     table_populate_query = bq_consts.INSERT_QUERY.format(
         project_id=project_id,
         dataset_id=dataset_id,
@@ -6,9 +6,13 @@ to the query engine.
 """
 # Python imports
 import logging
+import os
+from contextlib import nullcontext
+from datetime import datetime
 
 # Project imports
 import cdr_cleaner.clean_cdr_engine as clean_engine
+from cdr_cleaner import duckdb_backend, rule_profiler
 import cdr_cleaner.cleaning_rules.backfill_pmi_skip_codes as back_fill_pmi_skip
 import cdr_cleaner.cleaning_rules.clean_years as clean_years
 import cdr_cleaner.cleaning_rules.domain_alignment as domain_alignment
@@ -108,6 +112,7 @@ from cdr_cleaner.cleaning_rules.section_participation_concept_suppression import
 from cdr_cleaner.cleaning_rules.covid_ehr_vaccine_concept_suppression import CovidEHRVaccineConceptSuppression
 from constants.cdr_cleaner import clean_cdr_engine as ce_consts
 from constants.cdr_cleaner.clean_cdr import DataStage
+from utils import client_cache, pipeline_logging
 
 # Third party imports
 
@@ -368,9 +373,77 @@ def get_parser():
         type=DataStage,
         choices=list([s for s in DataStage if s is not DataStage.UNSPECIFIED]),
         help='Specify the dataset')
+    engine_parser.add_argument(
+        '--profile',
+        dest='profile',
+        action='store',
+        choices=rule_profiler.PROFILE_MODES,
+        help=('Profile the validation, setup and query generation of each '
+              'rule with cProfile (cpu) or tracemalloc (memory) and write a '
+              'report per rule'))
+    engine_parser.add_argument(
+        '--profile_dir',
+        dest='profile_dir',
+        action='store',
+        default=ce_consts.PROFILE_DIR,
+        help='Directory the profile reports of each run are written in')
+    engine_parser.add_argument(
+        '--backend',
+        dest='backend',
+        action='store',
+        choices=ce_consts.BACKENDS,
+        default=ce_consts.BIGQUERY_BACKEND,
+        help=('Run the rules in BigQuery or in a local DuckDB database, '
+              'whose tables are named after the datasets'))
+    engine_parser.add_argument(
+        '--duckdb_database',
+        dest='duckdb_database',
+        action='store',
+        help=('DuckDB database file the duckdb backend runs the rules in, '
+              'required with --backend duckdb'))
     return engine_parser
 
 
+def get_profiler(args):
+    """
+    Create a rule profiler if profiling was requested
+
+    :param args: parsed arguments
+    :return: RuleProfiler writing to a new directory for this run, or None
+    """
+    if not args.profile:
+        return None
+    run_name = (f'{args.data_stage.value}_{args.profile}_'
+                f'{datetime.now().strftime("%Y%m%d_%H%M%S")}')
+    return rule_profiler.RuleProfiler(args.profile,
+                                      os.path.join(args.profile_dir, run_name))
+
+
+def get_client(args):
+    """
+    Create the client of the requested execution backend
+
+    :param args: parsed arguments
+    :return: DuckDBClient for the duckdb backend, or None for the engine to
+        use a BigQuery client
+    :raises RuntimeError: if the DuckDB database file or the dataset to clean
+        does not exist
+    """
+    if args.backend != ce_consts.DUCKDB_BACKEND:
+        return None
+    # connecting would create an empty database
+    if not os.path.isfile(args.duckdb_database):
+        raise RuntimeError(
+            f'DuckDB database {args.duckdb_database} does not exist')
+    client = duckdb_backend.DuckDBClient(args.duckdb_database,
+                                         project=args.project_id)
+    if not client.dataset_exists(args.dataset_id):
+        client.close()
+        raise RuntimeError(f'Dataset {args.dataset_id} does not exist in '
+                           f'DuckDB database {args.duckdb_database}')
+    return client
+
+
 PARSING_ERROR_MESSAGE_FORMAT = (
     'Error parsing %(arg)s. Please use "--key value" to specify custom arguments. '
     'Custom arguments need an associated keyword to store their value.')
@@ -473,29 +546,55 @@ def main(args=None):
     """
     parser = get_parser()
     args, kwargs = fetch_args_kwargs(parser, args)
+    if args.backend == ce_consts.DUCKDB_BACKEND and not args.duckdb_database:
+        parser.error('--duckdb_database is required with --backend duckdb')
 
     rules = DATA_STAGE_RULES_MAPPING[args.data_stage.value]
     validate_custom_params(rules, **kwargs)
 
-    if args.list_queries:
-        clean_engine.add_console_logging()
-        query_list = clean_engine.get_query_list(
-            project_id=args.project_id,
-            dataset_id=args.dataset_id,
-            sandbox_dataset_id=args.sandbox_dataset_id,
-            rules=rules,
-            table_namer=args.data_stage.value,
-            **kwargs)
-        for query in query_list:
-            LOGGER.info(query)
-    else:
-        clean_engine.add_console_logging(args.console_log)
-        clean_engine.clean_dataset(project_id=args.project_id,
-                                   dataset_id=args.dataset_id,
-                                   sandbox_dataset_id=args.sandbox_dataset_id,
-                                   rules=rules,
-                                   table_namer=args.data_stage.value,
-                                   **kwargs)
+    profiler = get_profiler(args)
+    try:
+        if args.list_queries:
+            clean_engine.add_console_logging()
+            query_list = clean_engine.get_query_list(
+                project_id=args.project_id,
+                dataset_id=args.dataset_id,
+                sandbox_dataset_id=args.sandbox_dataset_id,
+                rules=rules,
+                table_namer=args.data_stage.value,
+                profiler=profiler,
+                **kwargs)
+            for query in query_list:
+                LOGGER.info(query)
+        else:
+            clean_engine.add_console_logging(args.console_log)
+            client = get_client(args)
+            # rules run against duckdb must not reach BigQuery
+            local_only = (duckdb_backend.local_only()
+                          if client else nullcontext())
+            pipeline_logging.configure_tracing(ce_consts.TRACE_FILENAME)
+            try:
+                with pipeline_logging.span(f'clean_cdr_{args.data_stage.value}',
+                                           dataset_id=args.dataset_id,
+                                           rules=len(rules),
+                                           backend=args.backend), local_only:
+                    clean_engine.clean_dataset(
+                        project_id=args.project_id,
+                        dataset_id=args.dataset_id,
+                        sandbox_dataset_id=args.sandbox_dataset_id,
+                        rules=rules,
+                        table_namer=args.data_stage.value,
+                        profiler=profiler,
+                        client=client,
+                        **kwargs)
+            finally:
+                if client:
+                    client.close()
+    finally:
+        # reports of the rules which ran are useful when a later rule fails
+        if profiler:
+            profiler.write_reports()
+        client_cache.log_stats()
 
 
 if __name__ == '__main__':
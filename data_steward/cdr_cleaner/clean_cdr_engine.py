@@ -2,14 +2,17 @@
 import inspect
 import logging
 from concurrent.futures import TimeoutError as TOError
+from functools import partial
 
 # Third party imports
 import google.cloud.bigquery as gbq
 from google.cloud.exceptions import GoogleCloudError
 
 # Project imports
-from utils import bq
+from utils import bq, pipeline_logging
 from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from cdr_cleaner.rule_profiler import (profiled, VALIDATION, SETUP,
+                                       QUERY_GENERATION, BIGQUERY)
 from constants import bq_utils as bq_consts
 from constants.cdr_cleaner import clean_cdr as cdr_consts
 from constants.cdr_cleaner import clean_cdr_engine as ce_consts
@@ -44,6 +47,8 @@ def clean_dataset(project_id,
                   sandbox_dataset_id,
                   rules,
                   table_namer='',
+                  profiler=None,
+                  client=None,
                   **kwargs):
     """
     Run the assigned cleaning rules and return list of BQ job objects
@@ -53,25 +58,39 @@ def clean_dataset(project_id,
     :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
     :param rules: a list of cleaning rule objects/functions as tuples
     :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param profiler: if set, a RuleProfiler which profiles the validation, setup
+        and query generation of each rule
+    :param client: client the rules are set up and their queries run with,
+        e.g. a duckdb_backend.DuckDBClient.  By default a BigQuery client.
     :param kwargs: keyword arguments a cleaning rule may require
     :return all_jobs: List of BigQuery job objects
     """
     # Set up client
-    client = bq.get_client(project_id=project_id)
+    if client is None:
+        client = bq.get_client(project_id=project_id)
 
     all_jobs = []
     for rule_index, rule in enumerate(rules):
         clazz = rule[0]
-        query_function, setup_function, rule_info = infer_rule(
-            clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
-            **kwargs)
+        rule_phase = partial(profiled, profiler, rule_index + 1, clazz.__name__)
+        with rule_phase(VALIDATION):
+            query_function, setup_function, rule_info = infer_rule(
+                clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
+                **kwargs)
 
         LOGGER.info(
             f"Applying cleaning rule {rule_info[cdr_consts.MODULE_NAME]} "
             f"{rule_index+1}/{len(rules)}")
-        setup_function(client)
-        query_list = query_function()
-        jobs = run_queries(client, query_list, rule_info)
+        with pipeline_logging.span(rule_info[cdr_consts.MODULE_NAME],
+                                   rule_index=rule_index + 1,
+                                   dataset_id=dataset_id) as rule_span:
+            with rule_phase(SETUP):
+                setup_function(client)
+            with rule_phase(QUERY_GENERATION):
+                query_list = query_function()
+            with rule_phase(BIGQUERY):
+                jobs = run_queries(client, query_list, rule_info)
+            rule_span.set_attribute('queries', len(query_list))
         LOGGER.info(
             f"For clean rule {rule_info[cdr_consts.MODULE_NAME]}, {len(jobs)} jobs "
             f"were run successfully for {len(query_list)} queries")
@@ -261,6 +280,7 @@ def get_query_list(project_id,
                    sandbox_dataset_id,
                    rules,
                    table_namer='',
+                   profiler=None,
                    **kwargs):
     """
     Generates list of all query_dicts that will be run on the dataset
@@ -270,15 +290,21 @@ def get_query_list(project_id,
     :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
     :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
     :param rules: a list of cleaning rule objects/functions as tuples
+    :param profiler: if set, a RuleProfiler which profiles the validation and
+        query generation of each rule
     :param kwargs: keyword arguments a cleaning rule may require
     :return list of all query_dicts that will be run on the dataset
     """
     all_queries_list = []
-    for rule in rules:
+    for rule_index, rule in enumerate(rules):
         clazz = rule[0]
-        query_function, _, rule_info = infer_rule(clazz, project_id, dataset_id,
-                                                  sandbox_dataset_id,
-                                                  table_namer, **kwargs)
-        query_list = query_function()
+        rule_phase = partial(profiled, profiler, rule_index + 1, clazz.__name__)
+        with rule_phase(VALIDATION):
+            query_function, _, rule_info = infer_rule(clazz, project_id,
+                                                      dataset_id,
+                                                      sandbox_dataset_id,
+                                                      table_namer, **kwargs)
+        with rule_phase(QUERY_GENERATION):
+            query_list = query_function()
         all_queries_list.extend(query_list)
     return all_queries_list
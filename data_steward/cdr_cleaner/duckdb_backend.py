@@ -0,0 +1,612 @@
+"""
+Runs cleaning rules against a local DuckDB database instead of BigQuery
+
+DuckDBClient implements the part of bigquery.Client the clean engine and the
+cleaning rules' setup use, so clean_engine.clean_dataset can run a whole stage
+on sample data in seconds.  The rendered BigQuery standard SQL is transpiled
+to DuckDB with sqlglot.  Datasets are DuckDB schemas and projects are ignored,
+so `project.dataset.table` refers to the table `dataset.table`.
+
+Supported:
+  * SELECT, DML and DDL statements, including CREATE TABLE ... AS SELECT
+  * query destinations with WRITE_TRUNCATE, WRITE_APPEND and WRITE_EMPTY
+  * `dataset.__TABLES__` lookups, served by a table of the dataset's row counts
+    which is refreshed before each query that reads it
+
+Scripting (DECLARE, LOOP, EXECUTE IMMEDIATE ...) is not supported and fails the
+job, as do BigQuery functions sqlglot cannot translate.  Within local_only,
+rules which build their own client with utils.bq.get_client or use the
+bq_utils or gcs_utils services fail with client_cache.ServiceRefusedError
+instead of reaching BigQuery or Cloud Storage.
+
+duckdb and sqlglot are optional dependencies, only needed for this backend.
+"""
+# Python imports
+import logging
+import threading
+import uuid
+
+# Third party imports
+import pandas as pd
+from google.api_core.exceptions import BadRequest, Conflict, NotFound
+from google.cloud import bigquery
+
+try:
+    import duckdb
+    import sqlglot
+    from sqlglot import expressions as sql_exp
+except ImportError:
+    duckdb = None
+    sqlglot = None
+    sql_exp = None
+
+# Project imports
+import resources
+from constants import bq_utils as bq_consts
+from utils import client_cache
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DATABASE = ':memory:'
+"""An in-memory database, discarded when the client is closed"""
+TABLES_SHIM = '__TABLES__'
+"""Name of the table holding the row counts of a dataset's tables"""
+TABLE_TYPE = 1
+"""__TABLES__ type of a table, as opposed to a view"""
+
+BQ_TO_DUCKDB_TYPES = {
+    'STRING': 'VARCHAR',
+    'INTEGER': 'BIGINT',
+    'INT64': 'BIGINT',
+    'FLOAT': 'DOUBLE',
+    'FLOAT64': 'DOUBLE',
+    'NUMERIC': 'DECIMAL(38, 9)',
+    'BOOLEAN': 'BOOLEAN',
+    'BOOL': 'BOOLEAN',
+    'DATE': 'DATE',
+    'DATETIME': 'TIMESTAMP',
+    # the connection's time zone is UTC, as BigQuery's is
+    'TIMESTAMP': 'TIMESTAMPTZ',
+    'TIME': 'TIME',
+    'BYTES': 'BLOB',
+}
+DUCKDB_TO_BQ_TYPES = {
+    'VARCHAR': 'STRING',
+    'BIGINT': 'INTEGER',
+    'INTEGER': 'INTEGER',
+    'SMALLINT': 'INTEGER',
+    'TINYINT': 'INTEGER',
+    'HUGEINT': 'INTEGER',
+    'DOUBLE': 'FLOAT',
+    'FLOAT': 'FLOAT',
+    'BOOLEAN': 'BOOLEAN',
+    'DATE': 'DATE',
+    'TIMESTAMP': 'DATETIME',
+    'TIMESTAMP WITH TIME ZONE': 'TIMESTAMP',
+    'TIME': 'TIME',
+    'BLOB': 'BYTES',
+}
+
+
+def local_only():
+    """
+    Refuse BigQuery clients and the bq_utils and gcs_utils services
+
+    Rules run by the duckdb backend within this context cannot read from or
+    write to BigQuery behind the DuckDB client's back.
+
+    :return: context manager raising client_cache.ServiceRefusedError from
+        the entry points of those clients and services
+    """
+    return client_cache.refuse_services(
+        'rules run by the duckdb backend must only use the client they are '
+        'given')
+
+
+def _require_backend():
+    if duckdb is None or sqlglot is None:
+        raise ImportError('The duckdb backend requires the duckdb and sqlglot '
+                          'packages: pip install duckdb sqlglot')
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _qualified(dataset_id, table_id):
+    return f'{_quote(dataset_id)}.{_quote(table_id)}'
+
+
+def _table_parts(table):
+    """
+    Get the dataset and table ids of a table
+
+    :param table: a Table, TableReference, TableListItem or a string of the
+        form project.dataset.table or dataset.table
+    :return: tuple of dataset id and table id
+    """
+    if isinstance(table, str):
+        parts = table.replace(':', '.').split('.')
+        if len(parts) < 2:
+            raise ValueError(f'Table {table} must be qualified by its dataset')
+        return parts[-2], parts[-1]
+    return table.dataset_id, table.table_id
+
+
+def _dataset_id(dataset):
+    if isinstance(dataset, str):
+        return dataset.replace(':', '.').split('.')[-1]
+    return dataset.dataset_id
+
+
+def column_definition(field):
+    """
+    Get the DuckDB column definition of a BigQuery field
+
+    :param field: a bigquery.SchemaField
+    :return: the column definition, e.g. "person_id" BIGINT NOT NULL
+    """
+    field_type = field.field_type.upper()
+    if field_type not in BQ_TO_DUCKDB_TYPES:
+        raise ValueError(f'Field {field.name} of type {field_type} is not '
+                         f'supported by the duckdb backend')
+    definition = f'{_quote(field.name)} {BQ_TO_DUCKDB_TYPES[field_type]}'
+    if field.mode == 'REPEATED':
+        definition += '[]'
+    elif field.mode == 'REQUIRED':
+        definition += ' NOT NULL'
+    return definition
+
+
+def _to_duckdb_expression(node):
+    """
+    Rewrite BigQuery constructs sqlglot translates into SQL duckdb rejects
+
+    :param node: a node of a parsed BigQuery statement
+    :return: the node or its replacement
+    """
+    # EXTRACT(DATE FROM ts) and EXTRACT(TIME FROM ts) are casts in duckdb
+    if isinstance(node,
+                  sql_exp.Extract) and node.name.upper() in ('DATE', 'TIME'):
+        return sql_exp.cast(node.expression, node.name.upper())
+    # duckdb does not allow the columns set by an UPDATE to be qualified
+    if isinstance(node, sql_exp.Update):
+        for assignment in node.expressions:
+            if isinstance(assignment, sql_exp.EQ) and isinstance(
+                    assignment.this, sql_exp.Column):
+                assignment.this.set('table', None)
+    return node
+
+
+def transpile(query):
+    """
+    Translate BigQuery standard SQL to DuckDB statements
+
+    Projects are dropped from table names, so tables are looked up in the
+    DuckDB schema named after their dataset.
+
+    :param query: BigQuery standard SQL, one or more statements
+    :return: list of tuples of a DuckDB statement, whether it is a query, and
+        the sets of datasets it refers to and whose __TABLES__ it reads
+    :raises ValueError: if the SQL cannot be translated
+    """
+    _require_backend()
+    try:
+        statements = sqlglot.parse(query,
+                                   read='bigquery',
+                                   error_level=sqlglot.ErrorLevel.RAISE)
+    except sqlglot.errors.SqlglotError as exc:
+        raise ValueError(f'Cannot translate query to duckdb: {exc}') from exc
+
+    transpiled = []
+    for statement in statements:
+        if statement is None:
+            continue
+        if isinstance(statement, (sql_exp.Command, sql_exp.Declare)):
+            raise ValueError(f'BigQuery scripting is not supported by the '
+                             f'duckdb backend: {statement.sql()[:80]}')
+        datasets = set()
+        shimmed = set()
+        statement = statement.transform(_to_duckdb_expression)
+        for table in statement.find_all(sql_exp.Table):
+            table.set('catalog', None)
+            if table.db:
+                datasets.add(table.db)
+                if table.name == TABLES_SHIM:
+                    shimmed.add(table.db)
+        is_query = isinstance(statement, sql_exp.Query)
+        select = statement.expression if isinstance(statement,
+                                                    sql_exp.Create) else None
+        if select is not None and isinstance(statement.this, sql_exp.Schema):
+            # duckdb does not take a column list with CREATE TABLE ... AS, so
+            # the table is created and the results inserted by position
+            statement.set('expression', None)
+            transpiled.append(
+                (statement.sql(dialect='duckdb'), False, datasets, shimmed))
+            statement = sql_exp.insert(select, statement.this.this)
+        transpiled.append(
+            (statement.sql(dialect='duckdb'), is_query, datasets, shimmed))
+    return transpiled
+
+
+class DuckDBRowIterator(object):
+    """
+    Rows of a finished query, in the manner of bigquery.table.RowIterator
+    """
+
+    def __init__(self, columns=None, rows=None):
+        """
+        :param columns: list of tuples of column name and DuckDB type
+        :param rows: list of tuples of values
+        """
+        self.columns = columns or []
+        self.rows = rows or []
+        self.schema = [
+            bigquery.SchemaField(
+                name,
+                DUCKDB_TO_BQ_TYPES.get(str(column_type).upper(), 'STRING'))
+            for name, column_type in self.columns
+        ]
+        self._field_to_index = {
+            name: index for index, (name, _) in enumerate(self.columns)
+        }
+
+    @property
+    def total_rows(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return (bigquery.Row(row, self._field_to_index) for row in self.rows)
+
+    def to_dataframe(self, *args, **kwargs):
+        return pd.DataFrame.from_records(
+            self.rows, columns=[name for name, _ in self.columns])
+
+
+class DuckDBJob(object):
+    """
+    A finished query, copy or load job, in the manner of bigquery.QueryJob
+    """
+
+    def __init__(self, job_id, query=None, destination=None):
+        self.job_id = job_id
+        self.query = query
+        self.destination = destination
+        self.state = 'DONE'
+        self.errors = None
+        self.error_result = None
+        self.num_dml_affected_rows = None
+        self._rows = DuckDBRowIterator()
+
+    def _fail(self, exc):
+        self.error_result = {'reason': 'invalidQuery', 'message': str(exc)}
+        self.errors = [self.error_result]
+
+    def done(self, *args, **kwargs):
+        return True
+
+    def result(self, *args, **kwargs):
+        """
+        Get the rows of the job
+
+        :raises BadRequest: if the job failed, as BigQuery jobs do
+        """
+        if self.errors:
+            raise BadRequest(self.error_result['message'], errors=self.errors)
+        return self._rows
+
+    def to_dataframe(self, *args, **kwargs):
+        return self.result().to_dataframe()
+
+
+class DuckDBClient(object):
+    """
+    Runs the queries of cleaning rules against a DuckDB database
+
+    Can be passed to clean_engine.clean_dataset in place of a BigQuery client.
+
+    :example:
+    >>> client = DuckDBClient()
+    >>> client.create_tables('ehr', resources.CDM_TABLES)
+    >>> client.load_table_from_dataframe(person_df, 'ehr.person')
+    >>> clean_engine.clean_dataset('local', 'ehr', 'ehr_sandbox', rules,
+    ...                            client=client)
+    """
+
+    def __init__(self, database=DEFAULT_DATABASE, project='local'):
+        """
+        :param database: path of the DuckDB database file, by default an
+            in-memory database
+        :param project: project id reported to the rules, which is otherwise
+            ignored
+        """
+        _require_backend()
+        self.project = project
+        self.database = database
+        self.connection = duckdb.connect(database)
+        self.connection.execute("SET TimeZone = 'UTC'")
+        # a duckdb connection must not be used by several threads at once
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.connection.close()
+
+    def _new_job(self, job_id_prefix=None, query=None, destination=None):
+        return DuckDBJob(f'{job_id_prefix or "duckdb_"}{uuid.uuid4().hex}',
+                         query=query,
+                         destination=destination)
+
+    def _execute(self, statement, parameters=None):
+        LOGGER.debug(f'Executing on duckdb: {statement}')
+        return self.connection.execute(statement, parameters)
+
+    def _table_exists(self, dataset_id, table_id):
+        return self._execute(
+            'SELECT COUNT(*) FROM information_schema.tables '
+            'WHERE table_schema = ? AND table_name = ?',
+            [dataset_id, table_id]).fetchone()[0] > 0
+
+    def _row_count(self, dataset_id, table_id):
+        return self._execute(
+            f'SELECT COUNT(*) FROM {_qualified(dataset_id, table_id)}'
+        ).fetchone()[0]
+
+    def _table_ids(self, dataset_id):
+        return [
+            row[0] for row in self._execute(
+                'SELECT table_name FROM information_schema.tables '
+                'WHERE table_schema = ? ORDER BY table_name',
+                [dataset_id]).fetchall() if row[0] != TABLES_SHIM
+        ]
+
+    def dataset_exists(self, dataset):
+        """
+        Check whether a dataset, i.e. a DuckDB schema, exists
+
+        :param dataset: dataset id, reference or bigquery.Dataset
+        :return: True if the dataset exists
+        """
+        with self._lock:
+            return self._execute(
+                'SELECT COUNT(*) FROM information_schema.schemata '
+                'WHERE schema_name = ?',
+                [_dataset_id(dataset)]).fetchone()[0] > 0
+
+    def _create_schema(self, dataset_id):
+        self._execute(f'CREATE SCHEMA IF NOT EXISTS {_quote(dataset_id)}')
+
+    def _refresh_tables_shim(self, dataset_id):
+        """
+        Store the row counts of the dataset's tables in its __TABLES__ table
+        """
+        rows = [(self.project, dataset_id, table_id, 0, 0,
+                 self._row_count(dataset_id, table_id), 0, TABLE_TYPE)
+                for table_id in self._table_ids(dataset_id)]
+        shim = _qualified(dataset_id, TABLES_SHIM)
+        self._execute(f'CREATE OR REPLACE TABLE {shim} ('
+                      'project_id VARCHAR, dataset_id VARCHAR, '
+                      'table_id VARCHAR, creation_time BIGINT, '
+                      'last_modified_time BIGINT, row_count BIGINT, '
+                      'size_bytes BIGINT, type BIGINT)')
+        if rows:
+            self.connection.executemany(
+                f'INSERT INTO {shim} VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def _write_destination(self, select, destination, write_disposition):
+        """
+        Write the results of a select statement to a table
+
+        :param select: DuckDB select statement
+        :param destination: tuple of dataset id and table id
+        :param write_disposition: one of the bigquery write dispositions
+        """
+        dataset_id, table_id = destination
+        self._create_schema(dataset_id)
+        table = _qualified(dataset_id, table_id)
+        exists = self._table_exists(dataset_id, table_id)
+        if exists and write_disposition == bq_consts.WRITE_APPEND:
+            self._execute(f'INSERT INTO {table} BY NAME {select}')
+            return
+        if (exists and write_disposition in (None, bq_consts.WRITE_EMPTY) and
+                self._row_count(dataset_id, table_id)):
+            raise Conflict(f'Table {dataset_id}.{table_id} already contains '
+                           f'data and the write disposition is WRITE_EMPTY')
+        # queries may read the table they replace
+        self._execute(f'CREATE OR REPLACE TABLE {table} AS {select}')
+
+    def query(self, query, job_config=None, job_id_prefix=None, **kwargs):
+        """
+        Run a query
+
+        Failures do not raise here but when the job's result is read, as with
+        BigQuery.
+
+        :param query: BigQuery standard SQL
+        :param job_config: optional bigquery.QueryJobConfig, whose destination
+            and write disposition are used
+        :param job_id_prefix: prefix of the job id
+        :return: a finished DuckDBJob
+        """
+        destination = getattr(job_config, 'destination', None)
+        job = self._new_job(job_id_prefix, query, destination)
+        if getattr(job_config, 'use_legacy_sql', False):
+            job._fail(
+                ValueError('Legacy SQL is not supported by the duckdb '
+                           'backend'))
+            return job
+        try:
+            statements = transpile(query)
+            if destination is not None and (len(statements) != 1 or
+                                            not statements[0][1]):
+                raise ValueError('A query with a destination table must be a '
+                                 'single select statement')
+            with self._lock:
+                cursor = None
+                for statement, _, datasets, shimmed in statements:
+                    for dataset_id in datasets:
+                        self._create_schema(dataset_id)
+                    for dataset_id in shimmed:
+                        self._refresh_tables_shim(dataset_id)
+                    if destination is None:
+                        cursor = self._execute(statement)
+                    else:
+                        self._write_destination(
+                            statement, _table_parts(destination),
+                            getattr(job_config, 'write_disposition', None))
+                if cursor is not None and cursor.description:
+                    job._rows = DuckDBRowIterator([
+                        (column[0], column[1]) for column in cursor.description
+                    ], cursor.fetchall())
+        except (ValueError, Conflict, duckdb.Error) as exc:
+            LOGGER.debug(f'Job {job.job_id} failed: {exc}')
+            job._fail(exc)
+        return job
+
+    def create_dataset(self, dataset, exists_ok=False, **kwargs):
+        dataset_id = _dataset_id(dataset)
+        with self._lock:
+            if not exists_ok and self._execute(
+                    'SELECT COUNT(*) FROM information_schema.schemata '
+                    'WHERE schema_name = ?', [dataset_id]).fetchone()[0]:
+                raise Conflict(f'Dataset {dataset_id} already exists')
+            self._create_schema(dataset_id)
+        return bigquery.Dataset(f'{self.project}.{dataset_id}')
+
+    def create_table(self, table, exists_ok=False, **kwargs):
+        """
+        Create an empty table with the table's schema
+
+        :param table: a bigquery.Table with a schema
+        :param exists_ok: if False, raise Conflict if the table exists
+        :return: the table
+        """
+        dataset_id, table_id = _table_parts(table)
+        columns = ', '.join(column_definition(field) for field in table.schema)
+        with self._lock:
+            self._create_schema(dataset_id)
+            if self._table_exists(dataset_id, table_id):
+                if not exists_ok:
+                    raise Conflict(
+                        f'Table {dataset_id}.{table_id} already exists')
+                return self._get_table(dataset_id, table_id)
+            self._execute(
+                f'CREATE TABLE {_qualified(dataset_id, table_id)} ({columns})')
+            return self._get_table(dataset_id, table_id)
+
+    def create_tables(self, dataset_id, table_names, exists_ok=True):
+        """
+        Create empty tables from their schemas in resources
+
+        :param dataset_id: dataset to create the tables in
+        :param table_names: names of tables with schema files, e.g. CDM_TABLES
+        :param exists_ok: if False, raise Conflict if a table exists
+        :return: list of the tables
+        """
+        return [
+            self.create_table(bigquery.Table(
+                f'{self.project}.{dataset_id}.{table_name}',
+                schema=resources.schema_for(table_name).bq_fields),
+                              exists_ok=exists_ok) for table_name in table_names
+        ]
+
+    def _get_table(self, dataset_id, table_id):
+        if not self._table_exists(dataset_id, table_id):
+            raise NotFound(f'Table {dataset_id}.{table_id} was not found')
+        columns = self._execute(
+            'SELECT column_name, data_type, is_nullable '
+            'FROM information_schema.columns '
+            'WHERE table_schema = ? AND table_name = ? '
+            'ORDER BY ordinal_position', [dataset_id, table_id]).fetchall()
+        table = bigquery.Table(
+            f'{self.project}.{dataset_id}.{table_id}',
+            schema=[
+                bigquery.SchemaField(
+                    name,
+                    DUCKDB_TO_BQ_TYPES.get(data_type.upper(), 'STRING'),
+                    mode='NULLABLE' if is_nullable == 'YES' else 'REQUIRED')
+                for name, data_type, is_nullable in columns
+            ])
+        table._properties['numRows'] = str(self._row_count(
+            dataset_id, table_id))
+        return table
+
+    def get_table(self, table, **kwargs):
+        dataset_id, table_id = _table_parts(table)
+        with self._lock:
+            return self._get_table(dataset_id, table_id)
+
+    def list_tables(self, dataset, **kwargs):
+        dataset_id = _dataset_id(dataset)
+        with self._lock:
+            table_ids = self._table_ids(dataset_id)
+        return [
+            bigquery.table.TableListItem({
+                'tableReference': {
+                    'projectId': self.project,
+                    'datasetId': dataset_id,
+                    'tableId': table_id
+                },
+                'type': 'TABLE'
+            }) for table_id in table_ids
+        ]
+
+    def delete_table(self, table, not_found_ok=False, **kwargs):
+        dataset_id, table_id = _table_parts(table)
+        with self._lock:
+            if not self._table_exists(dataset_id, table_id):
+                if not_found_ok:
+                    return
+                raise NotFound(f'Table {dataset_id}.{table_id} was not found')
+            self._execute(f'DROP TABLE {_qualified(dataset_id, table_id)}')
+
+    def copy_table(self, sources, destination, job_config=None, **kwargs):
+        """
+        Copy one or more tables to a destination table
+
+        :return: a finished DuckDBJob
+        """
+        if not isinstance(sources, (list, tuple)):
+            sources = [sources]
+        select = ' UNION ALL BY NAME '.join(
+            f'SELECT * FROM {_qualified(*_table_parts(source))}'
+            for source in sources)
+        job = self._new_job(kwargs.get('job_id_prefix'),
+                            destination=destination)
+        try:
+            with self._lock:
+                self._write_destination(
+                    select, _table_parts(destination),
+                    getattr(job_config, 'write_disposition', None))
+        except (Conflict, duckdb.Error) as exc:
+            job._fail(exc)
+        return job
+
+    def load_table_from_dataframe(self,
+                                  dataframe,
+                                  destination,
+                                  job_config=None,
+                                  **kwargs):
+        """
+        Load the rows of a dataframe into a table
+
+        As with BigQuery load jobs, rows are appended by default
+
+        :return: a finished DuckDBJob
+        """
+        job = self._new_job(kwargs.get('job_id_prefix'),
+                            destination=destination)
+        write_disposition = getattr(job_config, 'write_disposition',
+                                    None) or bq_consts.WRITE_APPEND
+        view_name = f'load_{uuid.uuid4().hex}'
+        try:
+            with self._lock:
+                self.connection.register(view_name, dataframe)
+                try:
+                    self._write_destination(f'SELECT * FROM {view_name}',
+                                            _table_parts(destination),
+                                            write_disposition)
+                finally:
+                    self.connection.unregister(view_name)
+        except (Conflict, duckdb.Error) as exc:
+            job._fail(exc)
+        return job
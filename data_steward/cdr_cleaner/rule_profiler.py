@@ -0,0 +1,229 @@
+"""
+Profiles the python work of each cleaning rule
+
+Rules can spend a long time in python before any BigQuery job runs, e.g. building
+lookup data in setup_rule or rendering queries for wide tables.  The profiler
+profiles the validation, setup and query generation of each rule separately, with
+cProfile (cpu) or tracemalloc (memory), and writes a hotspot report per rule.
+Time spent waiting on the rule's BigQuery jobs is timed but not profiled, so it
+does not hide the python hotspots.
+"""
+# Python imports
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+LOGGER = logging.getLogger(__name__)
+
+CPU = 'cpu'
+MEMORY = 'memory'
+PROFILE_MODES = [CPU, MEMORY]
+
+VALIDATION = 'validation'
+"""Selects the custom parameters of a rule, instantiates it and inspects it"""
+SETUP = 'setup'
+QUERY_GENERATION = 'query_generation'
+PYTHON_PHASES = [VALIDATION, SETUP, QUERY_GENERATION]
+BIGQUERY = 'bigquery'
+"""Running the rule's queries, timed but not profiled"""
+
+DEFAULT_TOP = 25
+"""Number of hotspots reported for each phase of a rule"""
+SUMMARY_FILENAME = 'summary.txt'
+
+
+class RuleProfiler(object):
+    """
+    Collects profiles of the phases of each cleaning rule and writes reports
+
+    :example:
+    >>> profiler = RuleProfiler(CPU, '/tmp/profile')
+    >>> with profiler.phase(1, 'CleanYears', SETUP):
+    >>>     rule.setup_rule(client)
+    >>> profiler.write_reports()
+    """
+
+    def __init__(self, mode, output_dir, top=DEFAULT_TOP):
+        """
+        :param mode: one of PROFILE_MODES
+        :param output_dir: directory to write the reports to
+        :param top: number of hotspots to report for each phase of a rule
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                f'Profile mode must be one of {PROFILE_MODES}, not {mode}')
+        self.mode = mode
+        self.output_dir = output_dir
+        self.top = top
+        # rule key to dict of phase to seconds
+        self.seconds = {}
+        # rule key to dict of phase to cProfile.Profile or a tuple of
+        # peak bytes and tracemalloc statistics
+        self.profiles = {}
+
+    @contextmanager
+    def phase(self, rule_index, rule_name, phase):
+        """
+        Time and profile a phase of a rule
+
+        Phases other than PYTHON_PHASES are timed but not profiled.  Memory
+        profiles report the peak and the allocations still held at the end of
+        the phase, and restart tracemalloc if it was already tracing.
+
+        :param rule_index: position of the rule in the stage, from 1
+        :param rule_name: name of the rule class or function
+        :param phase: name of the phase, e.g. SETUP
+        """
+        key = (rule_index, rule_name)
+        phase_seconds = self.seconds.setdefault(key, {})
+        phase_profiles = self.profiles.setdefault(key, {})
+        start = time.perf_counter()
+        if phase not in PYTHON_PHASES:
+            try:
+                yield
+            finally:
+                phase_seconds[phase] = phase_seconds.get(
+                    phase, 0.0) + time.perf_counter() - start
+            return
+
+        if self.mode == CPU:
+            profile = phase_profiles.setdefault(phase, cProfile.Profile())
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                phase_seconds[phase] = phase_seconds.get(
+                    phase, 0.0) + time.perf_counter() - start
+        else:
+            # tracemalloc is restarted so its peak covers this phase alone,
+            # reset_peak is not available before python 3.9
+            traceback_limit = (tracemalloc.get_traceback_limit()
+                               if tracemalloc.is_tracing() else None)
+            tracemalloc.stop()
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                peak = tracemalloc.get_traced_memory()[1]
+                after = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                if traceback_limit is not None:
+                    tracemalloc.start(traceback_limit)
+                phase_seconds[phase] = phase_seconds.get(
+                    phase, 0.0) + time.perf_counter() - start
+                phase_profiles[phase] = (peak, after.statistics('lineno'))
+
+    def python_seconds(self, key):
+        """
+        Get the seconds a rule spent in its python phases
+
+        :param key: tuple of rule index and rule name
+        :return: total seconds of the rule's PYTHON_PHASES
+        """
+        return sum(self.seconds[key].get(phase, 0.0) for phase in PYTHON_PHASES)
+
+    def rule_report(self, key):
+        """
+        Format the timings and hotspots of a rule
+
+        :param key: tuple of rule index and rule name
+        :return: the report as a string
+        """
+        rule_index, rule_name = key
+        lines = [f'Rule {rule_index}: {rule_name} ({self.mode} profile)', '']
+        for phase in PYTHON_PHASES + [BIGQUERY]:
+            if phase in self.seconds[key]:
+                note = '' if phase in PYTHON_PHASES else '  (not profiled)'
+                lines.append(
+                    f'{phase:<20}{self.seconds[key][phase]:>10.3f}s{note}')
+        for phase in PYTHON_PHASES:
+            profile = self.profiles[key].get(phase)
+            if profile is None:
+                continue
+            lines.append('')
+            if self.mode == CPU:
+                lines.append(
+                    f'== {phase}: top {self.top} functions by cumulative time =='
+                )
+                stream = io.StringIO()
+                pstats.Stats(profile, stream=stream).sort_stats(
+                    pstats.SortKey.CUMULATIVE).print_stats(self.top)
+                lines.append(stream.getvalue().strip())
+            else:
+                peak, statistics = profile
+                lines.append(f'== {phase}: peak {peak / 1024:.1f} KiB, '
+                             f'top {self.top} lines by allocated size ==')
+                lines.extend(str(stat) for stat in statistics[:self.top])
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        Format the timings of every rule, slowest python first
+
+        :return: the summary as a string
+        """
+        phases = PYTHON_PHASES + [BIGQUERY]
+        header = f'{"rule":<50}' + ''.join(
+            f'{phase:>18}' for phase in phases) + f'{"python":>12}'
+        lines = [header]
+        for key in sorted(self.seconds, key=self.python_seconds, reverse=True):
+            rule_index, rule_name = key
+            lines.append(f'{rule_index:>3} {rule_name:<46}' +
+                         ''.join(f'{self.seconds[key].get(phase, 0.0):>17.3f}s'
+                                 for phase in phases) +
+                         f'{self.python_seconds(key):>11.3f}s')
+        return '\n'.join(lines) + '\n'
+
+    def write_reports(self):
+        """
+        Write a report for each rule and a summary of all rules
+
+        With cpu profiles, each rule's python phases are also dumped to a .prof
+        file, which tools such as snakeviz read
+
+        :return: list of the paths written
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = []
+        for key in sorted(self.seconds):
+            rule_index, rule_name = key
+            base_path = os.path.join(self.output_dir,
+                                     f'{rule_index:03d}_{rule_name}')
+            with open(f'{base_path}.txt', 'w') as report_file:
+                report_file.write(self.rule_report(key))
+            paths.append(f'{base_path}.txt')
+            profiles = [
+                profile for profile in self.profiles[key].values()
+                if isinstance(profile, cProfile.Profile)
+            ]
+            if profiles:
+                stats = pstats.Stats(*profiles)
+                stats.dump_stats(f'{base_path}.prof')
+                paths.append(f'{base_path}.prof')
+        summary_path = os.path.join(self.output_dir, SUMMARY_FILENAME)
+        with open(summary_path, 'w') as summary_file:
+            summary_file.write(self.summary())
+        paths.append(summary_path)
+        LOGGER.info(f'Wrote rule profiles to {self.output_dir}')
+        return paths
+
+
+def profiled(profiler, rule_index, rule_name, phase):
+    """
+    Profile a phase of a rule if a profiler is set
+
+    :param profiler: RuleProfiler or None
+    :param rule_index: position of the rule in the stage, from 1
+    :param rule_name: name of the rule class or function
+    :param phase: name of the phase
+    :return: context manager
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(rule_index, rule_name, phase)
@@ -23,6 +23,7 @@ PRIORITY_TAG = 'priority'
 WRITE_TRUNCATE = 'WRITE_TRUNCATE'
 WRITE_EMPTY = 'WRITE_EMPTY'
 WRITE_APPEND = 'WRITE_APPEND'
+NEWLINE_DELIMITED_JSON = 'NEWLINE_DELIMITED_JSON'
 
 # Query response fields
 PAGE_TOKEN = 'pageToken'
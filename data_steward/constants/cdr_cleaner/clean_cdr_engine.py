@@ -6,6 +6,11 @@ import tempfile
 from common import JINJA_ENV
 
 FILENAME = os.path.join(tempfile.gettempdir(), 'cleaner.log')
+TRACE_FILENAME = os.path.join(tempfile.gettempdir(), 'cleaner-trace.jsonl')
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'cleaner_profiles')
+BIGQUERY_BACKEND = 'bigquery'
+DUCKDB_BACKEND = 'duckdb'
+BACKENDS = [BIGQUERY_BACKEND, DUCKDB_BACKEND]
 PROJECT_ID = 'project_id'
 DATASET_ID = 'dataset_id'
 SANDBOX_DATASET_ID = 'sandbox_dataset_id'
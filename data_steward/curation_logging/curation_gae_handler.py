@@ -2,12 +2,16 @@
 https://github.com/all-of-us/raw-data-repository/blob/1.60.6/rdr_service/services/gcp_logging.py. This custom handler
 groups all the log messages generated within the same http request into an operation, this grouping mechanism allows
 us to quickly navigate to the relevant log message. """
+import atexit
 import collections
 import json
 import logging
 import os
+import queue
 import string
+import sys
 import threading
+import time
 import app_identity
 from datetime import datetime, timezone
 from enum import IntEnum
@@ -31,6 +35,15 @@ import curation_logging.gcp_request_log_pb2  # pylint: disable=unused-import
 
 # How many log lines should be batched before pushing them to StackDriver.
 _LOG_BUFFER_SIZE = 100
+# How often, in seconds, the background flusher sends the log entries it holds.
+_LOG_FLUSH_INTERVAL_SECONDS = 2.0
+# How many log entries the background flusher sends in one write request.
+_LOG_FLUSH_BATCH_SIZE = 50
+# How many log entries may wait for the background flusher before log entries
+# are written in the request thread instead.
+_LOG_FLUSH_QUEUE_SIZE = 1000
+# How long to wait for pending log entries to be sent when shutting down.
+_LOG_FLUSH_TIMEOUT_SECONDS = 30
 
 GAE_LOGGING_MODULE_ID = 'app-' + os.environ.get('GAE_SERVICE', 'default')
 GAE_LOGGING_VERSION_ID = os.environ.get('GAE_VERSION', 'devel')
@@ -40,6 +53,13 @@ REQUEST_LOG_TYPE = 'type.googleapis.com/google.appengine.logging.v1.RequestLog'
 # This is where we save all data that is tied to a specific execution thread.
 _thread_store = threading.local()
 
+# The background flusher shared by all threads, see get_log_flusher().
+_log_flusher = None
+_log_flusher_lock = threading.Lock()
+# Queue markers asking the background flusher to send what it holds, or to stop.
+_FLUSH = object()
+_CLOSE = object()
+
 
 class LogCompletionStatusEnum(IntEnum):
     """
@@ -215,21 +235,210 @@ def update_long_operation(request_log_id, op_status):
     return operation_pb2
 
 
+class FakeLoggingClient(object):
+    """
+    Stand-in for LoggingServiceV2Client which keeps written log entries in memory.
+    Use it to exercise or load test the loggers without GCP credentials.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        :param latency: seconds each write_log_entries call takes, to simulate the RPC
+        """
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def write_log_entries(self, entries, log_name=None, **kwargs):
+        """
+        Record a write request.
+        :param entries: list of LogEntry pb2 objects
+        :param log_name: name of the log the entries are written to
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls.append((log_name, list(entries)))
+
+    @property
+    def entries(self):
+        """
+        All log entries written so far, in the order they were written.
+        """
+        with self._lock:
+            return [entry for _, entries in self.calls for entry in entries]
+
+
+class LogEntryFlusher(object):
+    """
+    Sends log entries to StackDriver from a background thread.  Thread safe.
+    Entries are sent in the order they were submitted, in batches of up to `batch_size`
+    entries, at least every `flush_interval` seconds.
+    """
+
+    def __init__(self,
+                 logging_client=None,
+                 flush_interval=_LOG_FLUSH_INTERVAL_SECONDS,
+                 batch_size=_LOG_FLUSH_BATCH_SIZE,
+                 max_queued=_LOG_FLUSH_QUEUE_SIZE):
+        """
+        :param logging_client: client to write log entries with, defaults to a
+            LoggingServiceV2Client
+        :param flush_interval: seconds to hold log entries before sending them
+        :param batch_size: maximum number of log entries sent in one write request
+        :param max_queued: maximum number of log entries waiting to be sent
+        """
+        if logging_client is None:
+            logging_client = gcp_logging_v2.LoggingServiceV2Client()
+        self.logging_client = logging_client
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._closed = False
+        self._worker = threading.Thread(target=self._run,
+                                        name='gcp-log-flusher',
+                                        daemon=True)
+        self._worker.start()
+
+    def submit(self, log_entry_pb2, log_name):
+        """
+        Queue a log entry to be sent.  If the queue is full or the flusher is closed
+        the log entry is sent in the calling thread.
+        :param log_entry_pb2: LogEntry pb2 object
+        :param log_name: name of the log to write the entry to
+        """
+        if not self._closed:
+            try:
+                self._queue.put_nowait((log_name, log_entry_pb2))
+                return
+            except queue.Full:
+                pass
+        self._write(log_name, [log_entry_pb2])
+
+    def flush(self, timeout=None):
+        """
+        Wait until all log entries submitted so far have been sent.
+        :param timeout: maximum seconds to wait, None waits indefinitely
+        :return: True if all log entries were sent, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            # Ask the worker to send what it holds without waiting for the interval.
+            self._queue.put(_FLUSH, timeout=timeout)
+        except queue.Full:
+            return False
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic(
+                )
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=_LOG_FLUSH_TIMEOUT_SECONDS):
+        """
+        Send any pending log entries and stop the background thread.
+        :param timeout: maximum seconds to wait for pending log entries
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._worker.join(timeout)
+
+    def _write(self, log_name, entries):
+        try:
+            self.logging_client.write_log_entries(entries, log_name=log_name)
+        # pylint: disable=broad-except
+        except Exception as exc:
+            # Logging the failure could end up back in this flusher.
+            self.failed += len(entries)
+            print(
+                f'Failed to send {len(entries)} log entries to {log_name}: {exc}',
+                file=sys.stderr)
+
+    def _send(self, batch):
+        # Group consecutive entries per log name so their order is kept.
+        start = 0
+        for end in range(1, len(batch) + 1):
+            if end == len(batch) or batch[end][0] != batch[start][0]:
+                self._write(batch[start][0],
+                            [entry for _, entry in batch[start:end]])
+                start = end
+
+    def _run(self):
+        batch = []
+        done = False
+        while not done:
+            deadline = time.monotonic() + self.flush_interval
+            markers = 0
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    break
+                if item is _FLUSH or item is _CLOSE:
+                    markers += 1
+                    done = item is _CLOSE
+                    break
+                batch.append(item)
+            if batch:
+                self._send(batch)
+            for _ in range(len(batch) + markers):
+                self._queue.task_done()
+            batch = []
+
+
+def get_log_flusher() -> LogEntryFlusher:
+    """
+    Return the background flusher shared by all threads, starting it if needed.
+    Pending log entries are sent when the interpreter exits.
+    :return: LogEntryFlusher object
+    """
+    global _log_flusher
+    with _log_flusher_lock:
+        if _log_flusher is None:
+            _log_flusher = LogEntryFlusher()
+            atexit.register(_log_flusher.close)
+        return _log_flusher
+
+
 class GCPStackDriverLogger(object):
     """
     Sends log records to google stack driver logging.  Each thread needs its own copy of this object.
     Buffers up to `buffer_size` log records into one ProtoBuffer to be submitted.
+    Log entries are built in the calling thread, so the operation status of each entry
+    follows the order of the log records, and are sent by `flusher` if one is given.
     """
 
-    def __init__(self, buffer_size=_LOG_BUFFER_SIZE):
+    def __init__(self,
+                 buffer_size=_LOG_BUFFER_SIZE,
+                 logging_client=None,
+                 flusher=None):
+        """
+        :param buffer_size: number of log records per log entry
+        :param logging_client: client used to send log entries without a flusher,
+            defaults to a LoggingServiceV2Client
+        :param flusher: LogEntryFlusher sending the log entries in the background,
+            if None log entries are sent in the calling thread
+        """
 
         self._buffer_size = buffer_size
         self._buffer = collections.deque()
 
         self._reset()
 
-        self._logging_client = gcp_logging_v2.LoggingServiceV2Client()
+        self._flusher = flusher
+        if logging_client is None and flusher is None:
+            logging_client = gcp_logging_v2.LoggingServiceV2Client()
+        self._logging_client = logging_client
         self._operation_pb2 = None
+        # The zone lookup is an http request, so the resource is only set up once.
+        self._resource_pb2 = None
 
         # Used to determine how long a request took.
         self._first_log_ts = None
@@ -347,6 +556,11 @@ class GCPStackDriverLogger(object):
         self.publish_to_stackdriver()
         self._reset()
 
+    def _logging_resource(self):
+        if self._resource_pb2 is None:
+            self._resource_pb2 = setup_logging_resource()
+        return self._resource_pb2
+
     def publish_to_stackdriver(self):
         """
         Send a set of log entries to StackDriver.
@@ -366,7 +580,7 @@ class GCPStackDriverLogger(object):
         self._end_time = datetime.now(timezone.utc).isoformat()
 
         log_entry_pb2_args = {
-            'resource': setup_logging_resource(),
+            'resource': self._logging_resource(),
             'severity': get_highest_severity_level_from_lines(lines),
             'trace': self._trace,
             'insert_id': insert_id,
@@ -429,10 +643,13 @@ class GCPStackDriverLogger(object):
         log_entry_pb2 = gcp_logging_v2.types.log_entry_pb2.LogEntry(
             **log_entry_pb2_args)
 
-        self._logging_client.write_log_entries(
-            [log_entry_pb2],
-            log_name=LOG_NAME_TEMPLATE.format(
-                project_id=app_identity.get_application_id()))
+        log_name = LOG_NAME_TEMPLATE.format(
+            project_id=app_identity.get_application_id())
+        if self._flusher:
+            self._flusher.submit(log_entry_pb2, log_name)
+        else:
+            self._logging_client.write_log_entries([log_entry_pb2],
+                                                   log_name=log_name)
 
 
 def get_gcp_logger() -> GCPStackDriverLogger:
@@ -446,7 +663,7 @@ def get_gcp_logger() -> GCPStackDriverLogger:
 
     # We may need to initialize the logger for this thread.
     if 'GAE_ENV' in os.environ:
-        _logger = GCPStackDriverLogger()
+        _logger = GCPStackDriverLogger(flusher=get_log_flusher())
         setattr(_thread_store, 'logger', _logger)
         return _logger
 
@@ -8,13 +8,31 @@ and also checking that the channel name is valid. The `is_channel_available` fun
 This helper functions checks to make sure the both the token and channel names are valid. This was important to add since the
 `initialize_slack_logging` is called in `validation.main.py` and if the channel names and token are not valid, this will cause
 all unit tests that import `validation.main.py` to fail the CircleCI unit test check.
+
+`AsyncSlackLoggingHandler` queues messages and posts them from a background thread so logging
+never waits on Slack. Duplicate messages are coalesced and posts to a channel are rate limited.
 """
 
 # Python imports
 import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
 
 # Project imports
-from utils.slack_alerts import post_message, is_channel_available, SlackConfigurationError
+from utils.slack_alerts import (post_message, is_channel_available,
+                                SlackConfigurationError, SLACK_CHANNEL)
+
+COALESCE_WINDOW_SECONDS = 60
+"""Duplicate messages within this many seconds of a post are only counted"""
+MIN_POST_INTERVAL_SECONDS = 1.0
+"""Minimum seconds between posts to the same channel"""
+MAX_QUEUED_MESSAGES = 1000
+"""Messages logged while this many are waiting to be posted are dropped"""
+FLUSH_TIMEOUT_SECONDS = 30
+"""Maximum seconds to wait for queued messages to be posted when flushing"""
 
 
 class SlackLoggingHandler(logging.Handler):
@@ -41,6 +59,151 @@ class SlackLoggingHandler(logging.Handler):
         return record.module in self.__module__
 
 
+class AsyncSlackLoggingHandler(SlackLoggingHandler):
+    """
+     Logging handler which posts messages to a Slack Channel from a background thread.
+
+     A message logged again within coalesce_window seconds of being posted is
+     not posted again.  How often it repeated is added to its next post, or
+     posted once its window has passed and another message is posted, or
+     when the handler is closed.  Posts to a channel are at least
+     min_post_interval seconds apart.
+    """
+
+    def __init__(self,
+                 coalesce_window=COALESCE_WINDOW_SECONDS,
+                 min_post_interval=MIN_POST_INTERVAL_SECONDS,
+                 max_queued=MAX_QUEUED_MESSAGES):
+        super().__init__()
+        self.coalesce_window = coalesce_window
+        self.min_post_interval = min_post_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._last_posted = {}
+        self._repeats = Counter()
+        self._next_post_time = {}
+        self._worker = threading.Thread(target=self._run,
+                                        name='slack-logging',
+                                        daemon=True)
+        self._worker.start()
+
+    def emit(self, record):
+        # this is added for preventing the infinite loop from happening
+        if self._is_raised_from_itself(record):
+            return
+        try:
+            self._queue.put_nowait(record.getMessage())
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            text = self._queue.get()
+            try:
+                if text is None:
+                    self._post_repeats()
+                    return
+                self._post(text)
+            # keep the worker running whatever goes wrong with a post
+            # pylint: disable=broad-except
+            except Exception:
+                logging.exception('Unable to post message to Slack.')
+            finally:
+                self._queue.task_done()
+
+    def _post(self, text):
+        """
+        Post a message unless it was posted within the coalesce window
+
+        :param text: the message to post
+        """
+        now = time.monotonic()
+        last_posted = self._last_posted.get(text)
+        if last_posted is not None and now - last_posted < self.coalesce_window:
+            self._repeats[text] += 1
+            return
+        repeats = self._repeats.pop(text, 0)
+        if repeats:
+            text_to_post = f'{text} (repeated {repeats} more time(s))'
+        else:
+            text_to_post = text
+        self._rate_limited_post(text_to_post)
+        self._last_posted[text] = time.monotonic()
+        self._forget_expired(self._last_posted[text])
+
+    def _forget_expired(self, now):
+        """
+        Forget messages posted before the coalesce window, posting their repeats
+
+        :param now: monotonic time the coalesce window ends at
+        """
+        expired = [
+            text for text, last_posted in self._last_posted.items()
+            if now - last_posted >= self.coalesce_window
+        ]
+        for text in expired:
+            del self._last_posted[text]
+            repeats = self._repeats.pop(text, 0)
+            if repeats:
+                self._rate_limited_post(
+                    f'{text} (repeated {repeats} more time(s))')
+
+    def _post_repeats(self):
+        """
+        Post how often coalesced messages repeated since they were last posted
+        """
+        while self._repeats:
+            text, repeats = self._repeats.popitem()
+            self._rate_limited_post(f'{text} (repeated {repeats} more time(s))')
+
+    def _rate_limited_post(self, text):
+        """
+        Post a message once the channel's minimum post interval has passed
+
+        :param text: the message to post
+        """
+        channel = os.environ.get(SLACK_CHANNEL)
+        wait = self._next_post_time.get(channel, 0) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            post_message(text)
+        finally:
+            self._next_post_time[channel] = (time.monotonic() +
+                                             self.min_post_interval)
+
+    def flush(self, timeout=FLUSH_TIMEOUT_SECONDS):
+        """
+        Wait for queued messages to be posted
+
+        :param timeout: maximum seconds to wait
+        """
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks and self._worker.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # wake up regularly in case the worker stopped
+                self._queue.all_tasks_done.wait(min(remaining, 1))
+
+    def close(self):
+        """
+        Post queued messages and how often coalesced messages repeated, then stop
+        """
+        if self._worker.is_alive():
+            try:
+                self._queue.put(None, timeout=FLUSH_TIMEOUT_SECONDS)
+            except queue.Full:
+                pass
+            self._worker.join(FLUSH_TIMEOUT_SECONDS)
+        if self.dropped:
+            logging.warning(
+                f'{self.dropped} message(s) were not posted to Slack because '
+                f'the queue was full.')
+        super().close()
+
+
 def initialize_slack_logging():
     """
     Setup Slack logging
@@ -49,7 +212,7 @@ def initialize_slack_logging():
         # Configure root logger
         root_logger = logging.getLogger()
         # Configure slack logging handler
-        log_handler = SlackLoggingHandler()
+        log_handler = AsyncSlackLoggingHandler()
         log_handler.setLevel(logging.WARNING)
         # Add slack logging handler to root logger.
         root_logger.addHandler(log_handler)
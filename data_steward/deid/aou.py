@@ -76,13 +76,14 @@ DESIGN:
 import json
 import logging
 import os
-import time
-from copy import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from datetime import datetime
 
 # Third party imports
-import numpy as np
 import pandas as pd
+from google.api_core.exceptions import GoogleAPIError
 from google.cloud import bigquery as bq
 from google.oauth2 import service_account
 
@@ -97,6 +98,15 @@ from tools.concept_ids_suppression import get_all_concept_ids
 
 LOGGER = logging.getLogger(__name__)
 
+MAX_DRY_RUNS = 10
+"""Maximum number of statements dry-run concurrently for a table"""
+
+_CLIENTS = {}
+_DATASETS = set()
+_CACHE_LOCK = threading.Lock()
+# one lock per client or dataset, so threads only wait on the same key
+_KEY_LOCKS = {}
+
 
 def milliseconds_since_epoch():
     """
@@ -108,6 +118,58 @@ def milliseconds_since_epoch():
         (datetime.utcnow() - datetime(1970, 1, 1)).total_seconds() * 1000)
 
 
+def get_client(private_key):
+    """
+    Get the BigQuery client for a service account, creating it only once per run.
+
+    :param private_key:  service account file location
+
+    :return: a cached BigQuery client object
+    """
+    with _CACHE_LOCK:
+        if private_key in _CLIENTS:
+            return _CLIENTS[private_key]
+        key_lock = _KEY_LOCKS.setdefault(('client', private_key),
+                                         threading.Lock())
+
+    with key_lock:
+        with _CACHE_LOCK:
+            if private_key in _CLIENTS:
+                return _CLIENTS[private_key]
+        client = bq.Client.from_service_account_json(private_key)
+        with _CACHE_LOCK:
+            _CLIENTS[private_key] = client
+        return client
+
+
+def ensure_dataset(client, dataset_id):
+    """
+    Create the dataset if it does not exist.
+
+    The existence of a dataset is only checked the first time it is seen
+    during a run.  Only threads ensuring the same dataset wait on the check.
+
+    :param client:  The BigQuery client object.
+    :param dataset_id:  name of the dataset that must exist
+    """
+    key = (client.project, dataset_id)
+    with _CACHE_LOCK:
+        if key in _DATASETS:
+            return
+        key_lock = _KEY_LOCKS.setdefault(('dataset',) + key, threading.Lock())
+
+    with key_lock:
+        with _CACHE_LOCK:
+            if key in _DATASETS:
+                return
+        datasets = [dataset.dataset_id for dataset in client.list_datasets()]
+        if dataset_id not in datasets:
+            dataset = bq.Dataset(client.dataset(dataset_id))
+            client.create_dataset(dataset, exists_ok=True)
+        with _CACHE_LOCK:
+            _DATASETS.add(key)
+
+
 def create_person_id_src_hpo_map(input_dataset, credentials):
     """
     Create a table containing person_ids and src_hpo_ids
@@ -225,6 +287,7 @@ class AOU(Press):
             self.private_key)
         self.partition = args.get('cluster', False)
         self.priority = args.get('interactive', 'BATCH')
+        self.pipelined_jobs = args.get('pipelined_jobs', False)
 
         if 'shift' in self.deid_rules:
             #
@@ -238,6 +301,15 @@ class AOU(Press):
                     ":SHIFT", shift_days))
 
     def initialize(self, **args):
+        """
+        Create the lookup tables deid needs and verify the mapping table.
+
+        :param age_limit: maximum allowable participant age.  Defaults to MAX_AGE.
+        :param create_lookup_tables: set to False if the concept_id suppression
+            lookup table was already created for this run.  Defaults to True.
+
+        :return: True if the mapping table contains only age eligible participants
+        """
         Press.initialize(self, **args)
         LOGGER.info(f"BEGINNING de-identification on table:\t{self.tablename}")
 
@@ -250,7 +322,8 @@ class AOU(Press):
         map_table = pd.DataFrame()
 
         # Create concept_id lookup table for suppressions
-        create_concept_id_lookup_table(self.idataset, self.credentials)
+        if args.get('create_lookup_tables', True):
+            create_concept_id_lookup_table(self.idataset, self.credentials)
 
         # only need to create these tables deidentifying the observation table
         if 'observation' in self.get_tablename().lower().split('.'):
@@ -471,44 +544,30 @@ class AOU(Press):
         self._add_compute_rules(columns)
         self._add_dml_statements_rules(columns)
 
-    def submit(self, sql, create, dml=None):
+    def _create_output_table(self):
         """
-        Submit the sql query to create a de-identified table.
+        Create (or re-create) the empty output table.
+        """
+        LOGGER.info(f"creating new table:\t{self.tablename}")
+        bq_utils.create_standard_table(self.tablename,
+                                       self.tablename,
+                                       drop_existing=True,
+                                       dataset_id=self.odataset)
 
-        :param sql:  The sql to send.
-        :param create: a flag to identify if this query should create a new
-            table or append to an existing table.
-        :param dml:  boolean flag identifying if a statement is a dml statement
+    def _get_job_config(self, client, write_disposition, dml=False):
         """
-        dml = False if dml is None else dml
-        table_name = self.get_tablename()
-        client = bq.Client.from_service_account_json(self.private_key)
-        #
-        # Let's make sure the out dataset exists
-        datasets = list(client.list_datasets())
-        found = np.sum(
-            [1 for dataset in datasets if dataset.dataset_id == self.odataset])
-        if not found:
-            dataset = bq.Dataset(client.dataset(self.odataset))
-            client.create_dataset(dataset)
+        Get the job configuration used to dry-run and execute a statement.
 
-        # create the output table
-        if create:
-            LOGGER.info(f"creating new table:\t{self.tablename}")
-            bq_utils.create_standard_table(self.tablename,
-                                           self.tablename,
-                                           drop_existing=True,
-                                           dataset_id=self.odataset)
-            write_disposition = bq_consts.WRITE_EMPTY
-        else:
-            write_disposition = bq_consts.WRITE_APPEND
-            LOGGER.info(f"appending results to table:\t{self.tablename}")
+        :param client:  The BigQuery client object.
+        :param write_disposition:  write disposition for select statements
+        :param dml:  boolean flag identifying if a statement is a dml statement
 
+        :return: a QueryJobConfig with dry_run set to False
+        """
         job = bq.QueryJobConfig()
         job.priority = self.priority
-        job.dry_run = True
+        job.dry_run = False
 
-        dml_job = None
         if not dml:
             job.destination = client.dataset(self.odataset).table(
                 self.tablename)
@@ -518,78 +577,204 @@ class AOU(Press):
             if self.partition:
                 job._properties['timePartitioning'] = {'type': 'DAY'}
                 job._properties['clustering'] = {'field': 'person_id'}
-        else:
-            # create a copy of the job config to use if the dry-run passes
-            dml_job = copy(job)
+
+        return job
+
+    def dry_run(self, client, sql, job_config):
+        """
+        Dry-run a statement to validate it before execution.
+
+        :param client:  The BigQuery client object.
+        :param sql:  The sql to validate.
+        :param job_config:  the job configuration the statement will execute with
+
+        :return: True if the dry-run passed, False otherwise
+        """
+        dry_run_config = deepcopy(job_config)
+        dry_run_config.dry_run = True
 
         LOGGER.info(
             f"submitting a dry-run for:\t{self.get_tablename()}\t\tpriority:\t%s\t\tpartition:\t%s",
             self.priority, self.partition)
 
-        logpath = os.path.join(self.logpath, self.idataset)
         try:
-            os.makedirs(logpath)
-        except OSError:
-            # log path already exists and we don't care
-            pass
-
-        try:
-            response = client.query(sql, location='US', job_config=job)
+            response = client.query(sql,
+                                    location='US',
+                                    job_config=dry_run_config)
         except Exception:
             LOGGER.exception(
                 f"dry run query failed for:\t{self.get_tablename()}\n"
                 f"\t\tSQL:\t{sql}\n"
-                f"\t\tjob config:\t{job}")
+                f"\t\tjob config:\t{dry_run_config}")
+            return False
+
+        return response.state == 'DONE'
+
+    def execute(self, client, sql, job_config):
+        """
+        Submit a statement for execution without waiting for it to finish.
+
+        :param client:  The BigQuery client object.
+        :param sql:  The sql to execute.
+        :param job_config:  the job configuration to execute with
+
+        :return: the QueryJob future for the statement
+        """
+        response = client.query(sql, location='US', job_config=job_config)
+        LOGGER.info(f"submitted a bigquery job for table:\t"
+                    f"{self.get_tablename()}\t\tstatus:\t'pending'\t\t"
+                    f"value:\t{response.job_id}")
+        return response
+
+    def submit(self, sql, create, dml=None):
+        """
+        Submit the sql query to create a de-identified table.
+
+        :param sql:  The sql to send.
+        :param create: a flag to identify if this query should create a new
+            table or append to an existing table.
+        :param dml:  boolean flag identifying if a statement is a dml statement
+        """
+        dml = False if dml is None else dml
+        client = get_client(self.private_key)
+        ensure_dataset(client, self.odataset)
+        self._make_log_path()
+
+        # create the output table
+        if create:
+            self._create_output_table()
+            write_disposition = bq_consts.WRITE_EMPTY
         else:
+            write_disposition = bq_consts.WRITE_APPEND
+            LOGGER.info(f"appending results to table:\t{self.tablename}")
 
-            if response.state == 'DONE':
-                if dml_job:
-                    job = dml_job
+        job_config = self._get_job_config(client, write_disposition, dml)
 
-                job.dry_run = False
+        if self.dry_run(client, sql, job_config):
+            LOGGER.info('dry-run passed.  submitting query for execution.')
+            self.wait(self.execute(client, sql, job_config))
 
-                LOGGER.info('dry-run passed.  submitting query for execution.')
+    def submit_statements(self, sql, dml_sql):
+        """
+        Submit all statements for the table.
 
-                response = client.query(sql, location='US', job_config=job)
-                LOGGER.info(
-                    f"submitted a bigquery job for table:\t{table_name}\t\t"
-                    f"status:\t'pending'\t\tvalue:\t{response.job_id}")
-                self.wait(client, response.job_id)
+        When pipelined jobs are enabled, every statement is dry-run
+        concurrently before any is executed.  The statement creating the
+        output table runs first, the appending statements then run
+        concurrently, and the dml statements run last, one at a time.
 
-    def wait(self, client, job_id):
+        :param sql:  list of select statements.  The first creates the output
+            table and the rest append to it.
+        :param dml_sql:  list of dml statements to run on the output table
+        """
+        if not self.pipelined_jobs:
+            Press.submit_statements(self, sql, dml_sql)
+            return
+
+        client = get_client(self.private_key)
+        ensure_dataset(client, self.odataset)
+        self._make_log_path()
+        self._create_output_table()
+
+        write_dispositions = [bq_consts.WRITE_EMPTY
+                             ] + [bq_consts.WRITE_APPEND] * (len(sql) - 1)
+        select_jobs = [
+            (statement, self._get_job_config(client, write_disposition))
+            for statement, write_disposition in zip(sql, write_dispositions)
+        ]
+        dml_jobs = [(statement, self._get_job_config(client, None, dml=True))
+                    for statement in dml_sql]
+
+        with ThreadPoolExecutor(max_workers=MAX_DRY_RUNS) as executor:
+            passed = list(
+                executor.map(lambda job: self.dry_run(client, *job),
+                             select_jobs + dml_jobs))
+        select_passed = passed[:len(select_jobs)]
+        dml_passed = passed[len(select_jobs):]
+        LOGGER.info(f"{sum(passed)} of {len(passed)} dry-runs passed for:\t"
+                    f"{self.get_tablename()}")
+
+        # the first statement writes to the empty table, so it must finish
+        # before the appending statements are executed
+        if select_passed and select_passed[0]:
+            self.wait(self.execute(client, *select_jobs[0]))
+
+        self.wait_all([
+            self.execute(client, *job)
+            for job, ok in zip(select_jobs[1:], select_passed[1:])
+            if ok
+        ])
+
+        for job, ok in zip(dml_jobs, dml_passed):
+            if ok:
+                self.wait(self.execute(client, *job))
+
+    def _make_log_path(self):
+        """
+        Create the log directory for the input dataset, if needed.
+        """
+        logpath = os.path.join(self.logpath, self.idataset)
+        try:
+            os.makedirs(logpath)
+        except OSError:
+            # log path already exists and we don't care
+            pass
+
+    def wait(self, job):
         """
         Wait for the query to finish executing.
 
-        :param client:  The BigQuery client object.
-        :param job_id:  job_id to verify finishes.
+        :param job:  QueryJob future to wait on.
+
+        :raises GoogleAPIError: if the job failed
         """
-        LOGGER.info(
-            f"sleeping for table:\t{self.get_tablename()}\t\tjob_id:\t{job_id}")
-        status = 'NONE'
+        LOGGER.info(f"waiting for table:\t{self.get_tablename()}\t\t"
+                    f"job_id:\t{job.job_id}")
+        job.result()
+        LOGGER.info(f"finished.  status is:\t{job.state}")
 
-        while True:
-            status = client.get_job(job_id).state
+    def wait_all(self, jobs):
+        """
+        Wait for all queries to finish executing.
 
-            if status == 'DONE':
-                break
-            else:
-                time.sleep(5)
+        Every job is waited on before the first error, if any, is raised.
+
+        :param jobs:  list of QueryJob futures to wait on.
 
-        LOGGER.info(f"awake.  status is:\t{status}")
+        :raises GoogleAPIError: if any job failed
+        """
+        errors = []
+        for job in jobs:
+            try:
+                self.wait(job)
+            except GoogleAPIError as exc:
+                LOGGER.exception(f"job {job.job_id} failed for table:\t"
+                                 f"{self.get_tablename()}")
+                errors.append(exc)
 
+        if errors:
+            raise errors[0]
 
-def main(raw_args=None):
+
+def main(raw_args=None, deid_rules=None, create_lookup_tables=True):
     """
     Run the de-identifying software.
 
     Entry point for de-identification.  Setting the main this way allows the
     module to run as a stand alone script or as part of the pipeline.
+
+    :param raw_args: command line arguments for a single table
+    :param deid_rules: rules already read by deid.press.load_rules.  If not
+        provided, the rules are read from the --rules file.
+    :param create_lookup_tables: set to False if the shared lookup tables
+        were already created for this run
     """
     sys_args = parse_args(raw_args)
 
-    handle = AOU(**sys_args)
+    handle = AOU(deid_rules=deid_rules, **sys_args)
 
-    if handle.initialize(age_limit=sys_args.get('age_limit')):
+    if handle.initialize(age_limit=sys_args.get('age_limit'),
+                         create_lookup_tables=create_lookup_tables):
         handle.do()
     else:
         LOGGER.error(
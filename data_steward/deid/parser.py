@@ -201,6 +201,40 @@ def parse_args(raw_args=None):
         type=query_priority,
         const='INTERACTIVE',
         help='Run the query in interactive mode.  Default is batch mode.')
+    parser.add_argument(
+        '--pipelined-jobs',
+        dest='pipelined_jobs',
+        action='store_true',
+        help=('Dry-run all statements for the table before executing any, '
+              'and execute appending statements concurrently.'))
+    parser.add_argument(
+        '--batched-simulation',
+        dest='batched_simulation',
+        action='store_true',
+        help=('Simulate all transformations of the table with a single '
+              'query.  Only used with the simulate action.'))
+    parser.add_argument(
+        '--simulation-sample',
+        dest='simulation_sample',
+        action='store',
+        type=float,
+        default=None,
+        help=('Percent of the table sampled with TABLESAMPLE when simulating '
+              'shift rules with --batched-simulation.  Defaults to reading '
+              'the whole table.'))
+    parser.add_argument(
+        '--plan-cache',
+        dest='plan_cache',
+        action='store_true',
+        help=('Reuse statements compiled from the same rules, table '
+              'configuration and schema.  Compiled plans are stored under '
+              'the log path.'))
+    parser.add_argument(
+        '--fuse-segments',
+        dest='fuse_segments',
+        action='store_true',
+        help=('Combine the statements of a meta table, such as observation, '
+              'into a single UNION ALL statement written by one job.'))
     parser.add_argument('--version', action='version', version='deid-02')
     # normally, the parsed arguments are returned as a namespace object.  To avoid
     # rewriting a lot of existing code, the namespace elements will be turned into
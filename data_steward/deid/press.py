@@ -3,10 +3,14 @@ This class applies rules and meta data to yield a certain output
 """
 # Python imports
 import codecs
+import hashlib
 import json
 import logging
 import os
+import re
+import threading
 from abc import ABC, abstractmethod
+from copy import deepcopy
 from datetime import datetime
 
 # Third party imports
@@ -20,6 +24,15 @@ from deid.rules import Deid, create_on_string
 
 LOGGER = logging.getLogger(__name__)
 
+SIMULATION_SHIFT_LIMIT = 5
+"""Number of sampled rows used to simulate a shift rule"""
+ROW_SUPPRESSION_ATTRIBUTE = '__row_suppression__'
+"""Attribute identifying row suppression counts in batched simulation results"""
+PLANS_DIRECTORY = 'plans'
+"""Directory under the log path storing compiled plans"""
+ALIAS_SUFFIX = re.compile(r'\s+AS\s+`?\w+`?\s*$', re.IGNORECASE)
+"""Trailing column alias of an apply expression, e.g. ' AS person_id'"""
+
 
 def set_up_logging(log_path, idataset):
     """
@@ -58,6 +71,31 @@ def set_up_logging(log_path, idataset):
                             format=file_format)
 
 
+def load_rules(rules_path):
+    """
+    Read the deid rules configuration file into a dictionary.
+
+    The configuration file is a list of rule groups.  Each group is keyed by
+    its `_id` in the returned dictionary.  Reading the rules once allows them
+    to be shared by every table de-identified in a run.
+
+    :param rules_path: path to the JSON file containing the rules
+
+    :return: a dictionary of rule groups keyed by the rule group id
+    """
+    with codecs.open(rules_path, 'r') as config:
+        deid_rules = json.loads(config.read())
+
+    if isinstance(deid_rules, list):
+        cache = {}
+        for row in deid_rules:
+            _id = row['_id']
+            cache[_id] = row
+        deid_rules = cache
+
+    return deid_rules
+
+
 class Press(ABC):
 
     def __init__(self, **args):
@@ -65,6 +103,8 @@ class Press(ABC):
         :rules_path  to the rule configuration file
         :info_path   path to the configuration of how the rules get applied
         :pipeline   operations and associated sequence in which they should be performed
+        :deid_rules optional rules already read by load_rules.  a copy is used,
+                    so the same rules can be shared across tables.
         """
         self.idataset = args.get('idataset', '')
         self.odataset = args.get('odataset', '')
@@ -75,8 +115,10 @@ class Press(ABC):
         self.logpath = args.get('logs', 'logs')
         set_up_logging(self.logpath, self.idataset)
 
-        with codecs.open(args.get('rules'), 'r') as config:
-            self.deid_rules = json.loads(config.read())
+        if args.get('deid_rules') is not None:
+            self.deid_rules = deepcopy(args.get('deid_rules'))
+        else:
+            self.deid_rules = load_rules(args.get('rules'))
 
         self.pipeline = args.get('pipeline',
                                  ['generalize', 'suppress', 'shift', 'compute'])
@@ -89,13 +131,6 @@ class Press(ABC):
             #   Date Shifting
             self.table_info = {}
 
-        if isinstance(self.deid_rules, list):
-            cache = {}
-            for row in self.deid_rules:
-                _id = row['_id']
-                cache[_id] = row
-            self.deid_rules = cache
-
         self.store = args.get('store', 'sqlite')
 
         if 'suppress' not in self.deid_rules:
@@ -107,6 +142,11 @@ class Press(ABC):
         self.action = [term.strip() for term in args['action'].split(',')
                       ] if 'action' in args else ['submit']
 
+        self.batched_simulation = args.get('batched_simulation', False)
+        self.simulation_sample = args.get('simulation_sample')
+        self.plan_cache = args.get('plan_cache', False)
+        self.fuse_segments = args.get('fuse_segments', False)
+
     def meta(self, data_frame):
         return pd.DataFrame({
             "names": list(data_frame.dtypes.to_dict().keys()),
@@ -159,9 +199,13 @@ class Press(ABC):
         """
         pass
 
-    def do(self):
+    def compile(self):
         """
-        This function actually runs deid and using both rule specifications and application of the rules
+        Compile the rules and their application into statements for the table.
+
+        :return: a plan dictionary containing the applied rules, `info`, the
+            select statements, `sql`, the dml statements, `dml_sql`, and the
+            final `pipeline` and suppression `filters` the statements depend on
         """
         self.update_rules()
         d = Deid(pipeline=self.pipeline, rules=self.deid_rules, parent=self)
@@ -212,6 +256,111 @@ class Press(ABC):
                 sql[index] = formatted.replace(':join_tablename',
                                                self.tablename)
 
+            if self.fuse_segments and len(sql) > 1:
+                sql = [self.union_segments(sql)]
+
+        return {
+            'info': p,
+            'sql': sql,
+            'dml_sql': dml_sql,
+            'pipeline': self.pipeline,
+            'filters': self.deid_rules['suppress']['FILTERS']
+        }
+
+    def union_segments(self, segments):
+        """
+        Combine the statements of a meta table into a single statement.
+
+        Every segment selects the table's columns in the same order, so the
+        segments can be combined with UNION ALL.  The output table is then
+        written by a single job instead of one creating job followed by a job
+        appending each remaining segment.
+
+        :param segments: list of select statements for the table
+
+        :return: a single UNION ALL select statement
+        """
+        LOGGER.info(f"fusing {len(segments)} statements for table:\t"
+                    f"{self.get_tablename()}")
+        return '\nUNION ALL\n'.join(
+            f'SELECT * FROM ({segment})' for segment in segments)
+
+    def get_plan_key(self):
+        """
+        Get the key identifying a compiled plan.
+
+        The key is a hash of the rules, the table specification, the pipeline,
+        the table schema and the datasets the statements refer to.
+
+        :return: a hexadecimal digest string
+        """
+        info = bq_utils.get_table_info(self.tablename, dataset_id=self.idataset)
+        components = {
+            'rules': self.deid_rules,
+            'table_info': self.table_info,
+            'pipeline': self.pipeline,
+            'schema': info.get('schema', {}).get('fields', []),
+            'tablename': self.tablename,
+            'idataset': self.idataset,
+            'odataset': self.odataset,
+            'fuse_segments': self.fuse_segments
+        }
+        serialized = json.dumps(components, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    def get_plan(self):
+        """
+        Get the compiled plan for the table.
+
+        If the plan cache is enabled, a plan previously compiled from the same
+        rules, table specification and schema is read from the plans directory
+        under the log path instead of being compiled again.  Newly compiled
+        plans are stored there as JSON so plans can be reused and compared.
+
+        :return: a plan dictionary.  see compile.
+        """
+        if not self.plan_cache:
+            return self.compile()
+
+        key = self.get_plan_key()
+        plan_dir = os.path.join(self.logpath, PLANS_DIRECTORY)
+        plan_path = os.path.join(plan_dir, f'{self.tablename}-{key}.json')
+
+        if os.path.exists(plan_path):
+            with open(plan_path, 'r') as plan_file:
+                plan = json.load(plan_file)
+            self.pipeline = plan['pipeline']
+            self.deid_rules['suppress']['FILTERS'] = plan['filters']
+            LOGGER.info(f"using compiled plan for table:\t"
+                        f"{self.get_tablename()}\t\tplan:\t{plan_path}")
+            return plan
+
+        plan = self.compile()
+        try:
+            os.makedirs(plan_dir)
+        except OSError:
+            # directory already exists.  move on.
+            pass
+
+        # write to a temporary file first so a concurrent reader never sees
+        # a partially written plan
+        tmp_path = f'{plan_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as plan_file:
+            json.dump(plan, plan_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, plan_path)
+        LOGGER.info(f"stored compiled plan for table:\t"
+                    f"{self.get_tablename()}\t\tplan:\t{plan_path}")
+        return plan
+
+    def do(self):
+        """
+        This function actually runs deid and using both rule specifications and application of the rules
+        """
+        plan = self.get_plan()
+        p = plan['info']
+        sql = plan['sql']
+        dml_sql = plan['dml_sql']
+
         if 'debug' in self.action:
             self.debug(p)
         else:
@@ -232,11 +381,7 @@ class Press(ABC):
                     sql_file.write(final_sql)
 
             if 'submit' in self.action:
-                for index, statement in enumerate(sql):
-                    self.submit(statement, not index)
-
-                for statement in dml_sql:
-                    self.submit(statement, False, dml=True)
+                self.submit_statements(sql, dml_sql)
 
             if 'simulate' in self.action:
                 #
@@ -245,6 +390,20 @@ class Press(ABC):
 
         LOGGER.info(f"FINISHED de-identification on table:\t{self.tablename}")
 
+    def submit_statements(self, sql, dml_sql):
+        """
+        Submit all statements for the table, one at a time.
+
+        :param sql:  list of select statements.  The first creates the output
+            table and the rest append to it.
+        :param dml_sql:  list of dml statements to run on the output table
+        """
+        for index, statement in enumerate(sql):
+            self.submit(statement, not index)
+
+        for statement in dml_sql:
+            self.submit(statement, False, dml=True)
+
     def get_tablename(self):
         return self.idataset + "." + self.tablename if self.idataset else self.tablename
 
@@ -254,22 +413,18 @@ class Press(ABC):
             print(row['label'], not row['apply'])
             print()
 
-    def simulate(self, info):
+    def _simulation_items(self, info):
         """
-        This function will attempt to log the various transformations on every field.
+        Select the transformations to simulate and count the operations.
 
-        This will simulate and provide output on possible transformations.
-        :info   payload of that has all the transformations applied to a given table as follows
-                [{apply, label, name}] where
-                    - apply is the SQL to be applied
-                    - label is the flag for the operation (generalize, suppress, compute, shift)
-                    - name  is the attribute name on which the rule gets applied
+        :info   payload of that has all the transformations applied to a given table
+
+        :return: a tuple of the list of items to simulate, a dictionary of
+            operation counts, and a list of meta table filters
         """
         table_name = self.idataset + "." + self.tablename
-        suppression_filters = self.deid_rules['suppress']['FILTERS']
-        out = pd.DataFrame()
+        items = []
         counts = {}
-        dirty_date = False
         filters = []
 
         for item in info:
@@ -286,33 +441,133 @@ class Press(ABC):
 
             counts[labels[0].strip()] += 1
 
-            if 'suppress' in labels or item['name'] == 'person_id' or dirty_date:
+            if 'suppress' in labels or item['name'] == 'person_id':
                 continue
 
+            if 'on' in item:
+                # This applies to meta tables
+                filters.append(item['on'])
+
+            items.append(item)
+
+        return items, counts, filters
+
+    def _simulation_conditions(self, item):
+        """
+        Get the WHERE clause tokens used to simulate a single transformation.
+
+        :param item:  the transformation being simulated
+
+        :return: a list of SQL tokens.  empty if there are no conditions.
+        """
+        suppression_filters = self.deid_rules['suppress']['FILTERS']
+        sql_list = []
+
+        if suppression_filters:
+            sql_list.append('WHERE')
+
+            for row in suppression_filters:
+                sql_list.append(row['filter'])
+
+                if suppression_filters.index(
+                        row) < len(suppression_filters) - 1:
+                    sql_list.append('AND')
+
+        if 'on' in item:
+            if suppression_filters:
+                sql_list.extend(['AND', item['on']])
+            else:
+                sql_list.extend(['WHERE ', item['on']])
+
+        return sql_list
+
+    def _row_suppression_sql(self, filters):
+        """
+        Get the query counting original and row suppressed records.
+
+        :param filters: list of meta table filters used by the simulation
+
+        :return: the query as a string with columns original and transformed
+        """
+        table_name = self.idataset + "." + self.tablename
+        original_sql = ' (SELECT COUNT(*) as original FROM :table) AS ORIGINAL_TABLE ,'
+        original_sql = original_sql.replace(':table', table_name)
+        transformed_sql = '(SELECT COUNT(*) AS transformed FROM :table WHERE :filter) AS TRANSF_TABLE'
+        transformed_sql = transformed_sql.replace(':table', table_name)
+        transformed_sql = transformed_sql.replace(':filter',
+                                                  " OR ".join(filters))
+        sql_list = ['SELECT * FROM ', original_sql, transformed_sql]
+        return " ".join(sql_list).replace(":idataset", self.idataset)
+
+    def _write_simulation(self, out, counts, suppressed_counts):
+        """
+        Write the simulation samples and statistics to the log path.
+
+        :param out:  data frame of sampled transformations
+        :param counts:  dictionary of operation counts
+        :param suppressed_counts:  list of row suppression counts
+        """
+        table_name = self.idataset + "." + self.tablename
+        now = datetime.now()
+        flag = "-".join(
+            np.array([now.year, now.month, now.day,
+                      now.hour]).astype(str).tolist())
+
+        root = os.path.join(self.logpath, self.idataset, flag)
+        try:
+            os.makedirs(root)
+        except OSError:
+            # directory already exists.  move on.
+            pass
+
+        stats = pd.DataFrame({
+            "operation":
+                list(counts.keys()) +
+                ["row-suppression"] * len(suppressed_counts),
+            "count":
+                list(counts.values()) + list(suppressed_counts)
+        })
+
+        _map = {
+            os.path.join(root, 'samples-' + self.tablename + '.csv'): out,
+            os.path.join(root, 'stats-' + self.tablename + '.csv'): stats
+        }
+        for path in _map:
+            _data_frame = _map[path]
+            _data_frame.to_csv(path)
+
+        LOGGER.info(
+            f"simulation completed for table:\t{table_name}\t\tvalue:\t{root}")
+
+    def simulate(self, info):
+        """
+        This function will attempt to log the various transformations on every field.
+
+        This will simulate and provide output on possible transformations.
+        :info   payload of that has all the transformations applied to a given table as follows
+                [{apply, label, name}] where
+                    - apply is the SQL to be applied
+                    - label is the flag for the operation (generalize, suppress, compute, shift)
+                    - name  is the attribute name on which the rule gets applied
+        """
+        if self.batched_simulation:
+            self.simulate_batched(info)
+            return
+
+        table_name = self.idataset + "." + self.tablename
+        suppression_filters = self.deid_rules['suppress']['FILTERS']
+        items, counts, filters = self._simulation_items(info)
+        frames = []
+
+        for item in items:
+            labels = item['label'].split('.')
             field = item['name']
             alias = 'original_' + field
             sql_list = [
                 "SELECT DISTINCT ", field, 'AS ', alias, ",", item['apply'],
                 " FROM ", table_name
             ]
-
-            if suppression_filters:
-                sql_list.append('WHERE')
-
-                for row in suppression_filters:
-                    sql_list.append(row['filter'])
-
-                    if suppression_filters.index(
-                            row) < len(suppression_filters) - 1:
-                        sql_list.append('AND')
-
-            if 'on' in item:
-                # This applies to meta tables
-                filters.append(item['on'])
-                if suppression_filters:
-                    sql_list.extend(['AND', item['on']])
-                else:
-                    sql_list.extend(['WHERE ', item['on']])
+            sql_list.extend(self._simulation_conditions(item))
 
             if 'shift' in labels:
                 data_frame = self.get_dataframe(sql=" ".join(sql_list).replace(
@@ -331,64 +586,93 @@ class Press(ABC):
             data_frame.columns = ['original', 'transformed']
             data_frame['attribute'] = field
             data_frame['task'] = item['label'].upper().replace('.', ' ')
-            out = out.append(data_frame)
+            frames.append(data_frame)
         #-- Let's evaluate row suppression here
         #
-        out.index = range(out.shape[0])
-        rdf = pd.DataFrame()
+        out = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        suppressed_counts = []
         if suppression_filters:
             filters += [
                 item['filter']
                 for item in suppression_filters
                 if 'filter' in item
             ]
-            original_sql = ' (SELECT COUNT(*) as original FROM :table) AS ORIGINAL_TABLE ,'
-            original_sql = original_sql.replace(':table', table_name)
-            transformed_sql = '(SELECT COUNT(*) AS transformed FROM :table WHERE :filter) AS TRANSF_TABLE'
-            transformed_sql = transformed_sql.replace(':table', table_name)
-            transformed_sql = transformed_sql.replace(':filter',
-                                                      " OR ".join(filters))
-            sql_list = ['SELECT * FROM ', original_sql, transformed_sql]
-
-            r = self.get_dataframe(
-                sql=" ".join(sql_list).replace(":idataset", self.idataset))
-            table_name = self.idataset + "." + self.tablename
-
-            rdf = pd.DataFrame({
-                "operation": ["row-suppression"],
-                "count": r.transformed.tolist()
-            })
+            r = self.get_dataframe(sql=self._row_suppression_sql(filters))
+            suppressed_counts = r.transformed.tolist()
 
-        now = datetime.now()
-        flag = "-".join(
-            np.array([now.year, now.month, now.day,
-                      now.hour]).astype(str).tolist())
+        self._write_simulation(out, counts, suppressed_counts)
 
-        root = os.path.join(self.logpath, self.idataset, flag)
-        try:
-            os.makedirs(root)
-        except OSError:
-            # directory already exists.  move on.
-            pass
+    def simulate_batched(self, info):
+        """
+        Simulate every transformation for the table with a single query.
 
-        stats = pd.DataFrame({
-            "operation": counts.keys(),
-            "count": counts.values()
-        })
-        stats = stats.append(rdf)
-        stats.index = range(stats.shape[0])
-        stats.reset_index()
+        Each transformation becomes one branch of a UNION ALL query, cast to
+        strings so the branches share a schema.  The alias the rules give
+        their apply expressions is replaced by the branch's own.  Shift rules read at most
+        SIMULATION_SHIFT_LIMIT rows, sampled with TABLESAMPLE if a sample
+        percent is configured.  The row suppression counts are gathered by
+        the same query.
 
-        _map = {
-            os.path.join(root, 'samples-' + self.tablename + '.csv'): out,
-            os.path.join(root, 'stats-' + self.tablename + '.csv'): stats
-        }
-        for path in _map:
-            _data_frame = _map[path]
-            _data_frame.to_csv(path)
+        :info   payload of that has all the transformations applied to a given
+                table.  see simulate.
+        """
+        table_name = self.idataset + "." + self.tablename
+        suppression_filters = self.deid_rules['suppress']['FILTERS']
+        items, counts, filters = self._simulation_items(info)
 
-        LOGGER.info(
-            f"simulation completed for table:\t{table_name}\t\tvalue:\t{root}")
+        branches = []
+        for item in items:
+            labels = item['label'].split('.')
+            from_clause = table_name
+            limit = ''
+            if 'shift' in labels:
+                if self.simulation_sample:
+                    from_clause += (f' TABLESAMPLE SYSTEM '
+                                    f'({self.simulation_sample} PERCENT)')
+                limit = f' LIMIT {SIMULATION_SHIFT_LIMIT}'
+
+            branch = [
+                "SELECT DISTINCT", f"'{item['name']}' AS attribute,",
+                f"'{item['label'].upper().replace('.', ' ')}' AS task,",
+                f"CAST({item['name']} AS STRING) AS original,",
+                f"CAST({ALIAS_SUFFIX.sub('', item['apply'])} AS STRING) "
+                f"AS transformed", "FROM", from_clause
+            ]
+            branch.extend(self._simulation_conditions(item))
+            branches.append(f"SELECT * FROM ({' '.join(branch)}{limit})")
+
+        if suppression_filters:
+            filters += [
+                item['filter']
+                for item in suppression_filters
+                if 'filter' in item
+            ]
+            branches.append(
+                f"SELECT '{ROW_SUPPRESSION_ATTRIBUTE}' AS attribute, "
+                f"'ROW SUPPRESSION' AS task, "
+                f"CAST(original AS STRING) AS original, "
+                f"CAST(transformed AS STRING) AS transformed "
+                f"FROM ({self._row_suppression_sql(filters)})")
+
+        result = pd.DataFrame()
+        if branches:
+            sql = "\nUNION ALL\n".join(branches).replace(
+                ':idataset', self.idataset)
+            result = self.get_dataframe(sql=sql)
+
+        suppressed_counts = []
+        if result.shape[0]:
+            is_row_count = result['attribute'] == ROW_SUPPRESSION_ATTRIBUTE
+            suppressed_counts = result[is_row_count]['transformed'].astype(
+                int).tolist()
+            out = result[~is_row_count][[
+                'original', 'transformed', 'attribute', 'task'
+            ]].reset_index(drop=True)
+        else:
+            LOGGER.info(f"no data-found for simulation of table:\t{table_name}")
+            out = pd.DataFrame()
+
+        self._write_simulation(out, counts, suppressed_counts)
 
     def to_sql(self, info):
         """
@@ -8,6 +8,8 @@ from io import BytesIO
 
 import googleapiclient.discovery
 
+from utils import client_cache
+
 MIMETYPES = {
     'json': 'application/json',
     'woff': 'application/font-woff',
@@ -51,7 +53,15 @@ def hpo_gcs_path(hpo_id):
 
 
 def create_service():
-    return googleapiclient.discovery.build('storage', 'v1', cache={})
+    """
+    Get the Cloud Storage discovery service, built once per thread
+
+    :return: the Cloud Storage v1 discovery service
+    """
+    client_cache.check_allowed('storage_service')
+    return client_cache.get_or_build(
+        'storage_service', (googleapiclient.discovery.build, 'storage', 'v1'),
+        lambda: googleapiclient.discovery.build('storage', 'v1', cache={}))
 
 
 def list_bucket_dir(gcs_path):
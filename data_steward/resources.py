@@ -4,10 +4,13 @@ import inspect
 import json
 import logging
 import os
+import threading
 from io import open
-from typing import List
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Tuple
 
 import cachetools
+from google.cloud import bigquery
 
 from common import (VOCABULARY, ACHILLES, PROCESSED_TXT, RESULTS_HTML,
                     FITBIT_TABLES, PID_RID_MAPPING, COPE_SURVEY_MAP)
@@ -32,6 +35,7 @@ internal_fields_path = os.path.join(fields_path, 'internal')
 mapping_fields_path = os.path.join(internal_fields_path, 'mapping_tables')
 extension_fields_path = os.path.join(fields_path, 'extension_tables')
 aou_files_path = os.path.join(resource_files_path, 'schemas')
+SCHEMA_INDEX_PATH = os.path.join(resource_files_path, 'schema_index.json')
 hpo_site_mappings_path = os.path.join(config_path, 'hpo_site_mappings.csv')
 achilles_index_path = os.path.join(resource_files_path, 'curation_report')
 AOU_VOCAB_PATH = os.path.join(resource_files_path, 'aou_vocab')
@@ -118,44 +122,251 @@ def achilles_index_files():
     return achilles_index_files
 
 
-def fields_for(table, sub_path=None):
+class TableSchema(NamedTuple):
     """
-    Return the json schema for any table identified in the schemas directory.
+    An immutable schema for a table defined in resource_files/schemas
 
-    Uses os.walk to traverse subdirectories
+    name: the table name
+    sub_path: directory of the schema file relative to resource_files/schemas
+    fields: read-only json field definitions
+    bq_fields: bigquery SchemaField objects for the fields
+    """
+    name: str
+    sub_path: str
+    fields: Tuple[Mapping[str, str], ...]
+    bq_fields: Tuple[bigquery.SchemaField, ...]
 
-    :param table: The table to get a schema for
-    :param sub_path: A string identifying a sub-directory in resource_files/schemas.
-        If provided, this directory will be searched.
-    :returns: a json object representing the schemas for the named table
+    @classmethod
+    def from_json(cls, name, sub_path, fields):
+        """
+        Create a schema from json field definitions
+
+        :param name: the table name
+        :param sub_path: directory of the schema file relative to
+            resource_files/schemas
+        :param fields: list of json field definitions
+        :return: a TableSchema
+        """
+        return cls(
+            name, sub_path,
+            tuple(MappingProxyType(dict(field)) for field in fields),
+            tuple(
+                bigquery.SchemaField(field.get('name'), field.get(
+                    'type'), field.get('mode'), field.get('description'))
+                for field in fields))
+
+    def to_json(self):
+        """
+        Get a copy of the json field definitions which callers may modify
+
+        :return: list of dicts
+        """
+        return [dict(field) for field in self.fields]
+
+
+class SchemaRegistry:
+    """
+    Index of all table schemas defined in resource_files/schemas
+
+    Schema files are read once when the registry is built.  Tables whose
+    schemas are defined in more than one directory are detected then and can
+    only be looked up using the sub-directory of the wanted schema.
     """
-    path = os.path.join(fields_path, sub_path if sub_path else '')
 
-    # default setting
-    json_path = os.path.join(path, table + '.json')
+    def __init__(self, schemas, path=fields_path):
+        """
+        :param schemas: list of TableSchema in the order they were found
+        :param path: root directory of the schema files
+        """
+        self.path = path
+        self._schemas = list(schemas)
+        self._by_name: Dict[str, List[TableSchema]] = {}
+        for schema in self._schemas:
+            self._by_name.setdefault(schema.name, []).append(schema)
+        self.duplicates = sorted(
+            name for name, schemas in self._by_name.items() if len(schemas) > 1)
+        if self.duplicates:
+            LOGGER.warning(
+                f'Multiple schemas exist for tables {self.duplicates} in path '
+                f'{path}')
+
+    @staticmethod
+    def _schema_files(path):
+        """
+        Get the schema files in a directory tree
 
-    unique_count = 0
-    for dirpath, _, files in os.walk(path):
-        if sub_path and os.path.basename(sub_path) != os.path.basename(dirpath):
-            continue
+        :param path: root directory of the schema files
+        :return: list of tuples of table name, sub-directory relative to
+            path and file path
+        """
+        schema_files = []
+        for dirpath, _, files in os.walk(path):
+            sub_path = os.path.relpath(dirpath, path)
+            sub_path = '' if sub_path == os.curdir else sub_path
+            for filename in files:
+                if filename.endswith('.json'):
+                    schema_files.append((filename[:-len('.json')], sub_path,
+                                         os.path.join(dirpath, filename)))
+        return schema_files
+
+    @staticmethod
+    def _signature(schema_files):
+        """
+        Get a signature identifying the current state of schema files
 
-        for filename in files:
-            if filename[:-5] == table:
-                json_path = os.path.join(dirpath, filename)
-                unique_count = unique_count + 1
+        :param schema_files: list of tuples as returned by _schema_files
+        :return: list of [relative path, size, modified time] lists
+        """
+        signature = []
+        for name, sub_path, file_path in schema_files:
+            stat = os.stat(file_path)
+            signature.append(
+                [os.path.join(sub_path, name), stat.st_size, stat.st_mtime_ns])
+        return signature
+
+    @classmethod
+    def from_files(cls, path=fields_path):
+        """
+        Build a registry by reading every schema file under path
 
-    if unique_count > 1:
-        raise RuntimeError(
-            f"Unable to read schema file because multiple schemas exist for:\t"
-            f"{table} in path {path}")
-    elif unique_count == 0:
-        raise RuntimeError(
-            f"Unable to find schema file for {table} in path {path}")
+        :param path: root directory of the schema files
+        :return: a SchemaRegistry
+        """
+        schemas = []
+        for name, sub_path, file_path in cls._schema_files(path):
+            with open(file_path, 'r', encoding='utf-8') as fp:
+                schemas.append(
+                    TableSchema.from_json(name, sub_path, json.load(fp)))
+        return cls(schemas, path)
 
-    with open(json_path, 'r') as fp:
-        fields = json.load(fp)
+    @classmethod
+    def from_index(cls, index_path=SCHEMA_INDEX_PATH, path=fields_path):
+        """
+        Build a registry from a precompiled index written by write_index
+
+        :param index_path: path of the index file
+        :param path: root directory of the schema files
+        :return: a SchemaRegistry, or None if the index is missing or any
+            schema file changed since the index was written
+        """
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, 'r', encoding='utf-8') as fp:
+            index = json.load(fp)
+        if index.get('signature') != cls._signature(cls._schema_files(path)):
+            LOGGER.info(f'Ignoring out of date schema index {index_path}')
+            return None
+        return cls([
+            TableSchema.from_json(schema['name'], schema['sub_path'],
+                                  schema['fields'])
+            for schema in index['schemas']
+        ], path)
+
+    def write_index(self, index_path=SCHEMA_INDEX_PATH):
+        """
+        Save the registry so later processes can load it with from_index
 
-    return fields
+        :param index_path: path of the index file
+        """
+        index = {
+            'signature':
+                self._signature(self._schema_files(self.path)),
+            'schemas': [{
+                'name': schema.name,
+                'sub_path': schema.sub_path,
+                'fields': schema.to_json()
+            } for schema in self._schemas]
+        }
+        with open(index_path, 'w', encoding='utf-8') as fp:
+            json.dump(index, fp)
+
+    def get(self, table, sub_path=None):
+        """
+        Get the schema for a table
+
+        :param table: the table to get a schema for
+        :param sub_path: sub-directory of resource_files/schemas containing
+            the schema.  Required if multiple schemas exist for the table.
+        :return: a TableSchema
+        :raises RuntimeError: if no schema or multiple schemas are found
+        """
+        path = os.path.join(self.path, sub_path if sub_path else '')
+        schemas = self._by_name.get(table, [])
+        if sub_path:
+            schemas = [
+                schema for schema in schemas if os.path.normpath(
+                    schema.sub_path) == os.path.normpath(sub_path)
+            ]
+        if len(schemas) > 1:
+            raise RuntimeError(
+                f"Unable to read schema file because multiple schemas exist for:\t"
+                f"{table} in path {path}")
+        elif not schemas:
+            raise RuntimeError(
+                f"Unable to find schema file for {table} in path {path}")
+        return schemas[0]
+
+    def schemas_in(self, sub_path, exclude_directories=None):
+        """
+        Get the schemas found under a sub-directory
+
+        :param sub_path: sub-directory of resource_files/schemas to search
+        :param exclude_directories: names of directories to skip
+        :return: list of TableSchema in the order they were found
+        """
+        exclude_directories = set(exclude_directories or [])
+        sub_parts = os.path.normpath(sub_path).split(os.sep)
+        result = []
+        for schema in self._schemas:
+            parts = os.path.normpath(schema.sub_path).split(os.sep)
+            if parts[:len(sub_parts)] != sub_parts:
+                continue
+            if exclude_directories.intersection(parts[len(sub_parts):]):
+                continue
+            result.append(schema)
+        return result
+
+
+@cachetools.cached(cache={}, lock=threading.Lock())
+def schema_registry():
+    """
+    Get the registry of all table schemas, built once per process
+
+    Loads the precompiled index at SCHEMA_INDEX_PATH if it is up to date,
+    otherwise reads the schema files.
+
+    :return: a SchemaRegistry
+    """
+    registry = SchemaRegistry.from_index()
+    if registry is None:
+        registry = SchemaRegistry.from_files()
+    return registry
+
+
+def schema_for(table, sub_path=None):
+    """
+    Return the immutable schema for any table identified in the schemas directory.
+
+    :param table: The table to get a schema for
+    :param sub_path: A string identifying a sub-directory in resource_files/schemas.
+        If provided, only this directory will be searched.
+    :returns: a TableSchema with json and bigquery field definitions
+    """
+    return schema_registry().get(table, sub_path)
+
+
+def fields_for(table, sub_path=None):
+    """
+    Return the json schema for any table identified in the schemas directory.
+
+    Served from the schema registry so schema files are only read once
+
+    :param table: The table to get a schema for
+    :param sub_path: A string identifying a sub-directory in resource_files/schemas.
+        If provided, this directory will be searched.
+    :returns: a json object representing the schemas for the named table
+    """
+    return schema_for(table, sub_path).to_json()
 
 
 def is_internal_table(table_id):
@@ -253,24 +464,17 @@ def cdm_schemas(include_achilles=False, include_vocabulary=False):
     :param include_vocabulary:
     :return:
     """
-    result = dict()
     # TODO:  update this code as part of DC-1015 and remove this comment
     exclude_directories = list()
     if not include_achilles:
         exclude_directories.append(ACHILLES)
     if not include_vocabulary:
         exclude_directories.append(VOCABULARY)
-    for dir_path, dirs, files in os.walk(cdm_fields_path, topdown=True):
-        # The following line updates the dirs list gathered by os.walk to exclude directories in exclude_directories[]
-        dirs[:] = [d for d in dirs if d not in set(exclude_directories)]
-        for f in files:
-            file_path = os.path.join(dir_path, f)
-            with open(file_path, 'r', encoding='utf-8') as fp:
-                file_name = os.path.basename(f)
-                table_name = file_name.split('.')[0]
-                schema = json.load(fp)
-                result[table_name] = schema
-    return result
+    return {
+        schema.name: schema.to_json()
+        for schema in schema_registry().schemas_in(
+            os.path.relpath(cdm_fields_path, fields_path), exclude_directories)
+    }
 
 
 def rdr_specific_schemas():
@@ -279,17 +483,11 @@ def rdr_specific_schemas():
 
     :return:
     """
-    result = dict()
-    for dir_path, _, files in os.walk(rdr_fields_path):
-        for f in files:
-            file_path = os.path.join(dir_path, f)
-            with open(file_path, 'r', encoding='utf-8') as fp:
-                file_name = os.path.basename(f)
-                table_name = file_name.split('.')[0]
-                schema = json.load(fp)
-                result[table_name] = schema
-
-    return result
+    return {
+        schema.name: schema.to_json()
+        for schema in schema_registry().schemas_in(
+            os.path.relpath(rdr_fields_path, fields_path))
+    }
 
 
 def get_person_id_tables(domain_tables):
@@ -308,17 +506,12 @@ def get_person_id_tables(domain_tables):
 
 
 def mapping_schemas():
-    result = dict()
-    for f in os.listdir(mapping_fields_path):
-        file_path = os.path.join(mapping_fields_path, f)
-        table_name = f.split('.')[0]
-
-        if is_mapping_table(table_name):
-            # only open and load mapping tables, instead of all tables
-            with open(file_path, 'r') as fp:
-                result[table_name] = json.load(fp)
-
-    return result
+    return {
+        schema.name: schema.to_json()
+        for schema in schema_registry().schemas_in(
+            os.path.relpath(mapping_fields_path, fields_path))
+        if is_mapping_table(schema.name)
+    }
 
 
 def hash_dir(in_dir):
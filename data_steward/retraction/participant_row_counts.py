@@ -14,6 +14,8 @@
 
 # Python imports
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
 # Third party imports
 from google.api_core.exceptions import BadRequest
@@ -27,6 +29,13 @@ from retraction import retract_utils as ru
 from constants.retraction import retract_utils as ru_consts
 from constants.retraction import participant_row_counts as consts
 
+DATASET_ID = 'dataset_id'
+MAX_WORKERS = 16
+
+# INFORMATION_SCHEMA.COLUMNS dataframes keyed on (project_id, dataset_id)
+_TABLE_DFS = {}
+_TABLE_DFS_LOCK = Lock()
+
 
 def get_combined_deid_query(project_id,
                             dataset_id,
@@ -160,7 +169,32 @@ def get_ehr_query(project_id, dataset_id, pid_source, hpo_id, table_df):
     return query
 
 
-def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
+def get_table_df(client, project_id, dataset_id):
+    """
+    Returns the INFORMATION_SCHEMA.COLUMNS dataframe for the dataset
+
+    The metadata is only queried the first time a dataset is seen
+
+    :param client: BigQuery client
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset
+    :return: dataframe from BQ INFORMATION_SCHEMA.COLUMNS
+    """
+    key = (project_id, dataset_id)
+    with _TABLE_DFS_LOCK:
+        if key in _TABLE_DFS:
+            return _TABLE_DFS[key]
+    cols_query = bq.dataset_columns_query(project_id, dataset_id)
+    table_df = client.query(cols_query).to_dataframe()
+    with _TABLE_DFS_LOCK:
+        return _TABLE_DFS.setdefault(key, table_df)
+
+
+def count_pid_rows_in_dataset(project_id,
+                              dataset_id,
+                              hpo_id,
+                              pid_source,
+                              client=None):
     """
     Returns df containing tables and counts of participant rows for pids in pids_source
 
@@ -168,6 +202,7 @@ def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
     :param dataset_id: identifies the dataset
     :param hpo_id: Identifies the hpo site that submitted the pids
     :param pid_source: string containing query or list containing pids
+    :param client: BigQuery client, created for project_id if not specified
     :return: df with headers table_id, all_counts, all_ehr_counts, and map_ehr_counts
     """
     dataset_type = ru.get_dataset_type(dataset_id)
@@ -175,9 +210,8 @@ def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
         ru_consts.TABLE_ID, consts.ALL_COUNT, consts.ALL_EHR_COUNT,
         consts.MAP_EHR_COUNT
     ])
-    bq_client = bq.get_client(project_id)
-    cols_query = bq.dataset_columns_query(project_id, dataset_id)
-    table_df = bq_client.query(cols_query).to_dataframe()
+    bq_client = client if client else bq.get_client(project_id)
+    table_df = get_table_df(bq_client, project_id, dataset_id)
 
     if dataset_type == common.COMBINED:
         query = get_combined_deid_query(project_id, dataset_id, pid_source,
@@ -201,7 +235,7 @@ def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
         query = get_dataset_query(project_id, dataset_id, pid_source, table_df)
 
     if query:
-        counts_df = bq.query(query, project_id)
+        counts_df = bq_client.query(query).to_dataframe()
         # sort by count desc
         counts_df = counts_df.sort_values(by=consts.ALL_COUNT, ascending=False)
     return counts_df
@@ -215,32 +249,53 @@ def log_total_rows(df, dataset_id):
     :param dataset_id: Identifies the dataset under consideration
     :return:
     """
-    rows = df.get_values()
+    rows = df.values
     if rows.size > 0:
         for count_row in rows:
             logging.info('{}, {}, {}, {}, {}'.format(dataset_id, *count_row))
 
 
-def count_pid_rows_in_project(project_id, hpo_id, pid_source, dataset_ids=None):
+def count_pid_rows_in_project(project_id,
+                              hpo_id,
+                              pid_source,
+                              dataset_ids=None,
+                              workers=MAX_WORKERS):
     """
     Logs dataset_name, table_id, all_count, all_ehr_count and map_ehr_count to count rows pertaining to pids
 
+    Datasets are counted concurrently using a single client
+
     :param project_id: identifies the project
     :param hpo_id: Identifies the hpo site that submitted the pids
     :param pid_source: string containing query or list containing pids
     :param dataset_ids: list identifying datasets to retract from or None to retract from all datasets
-    :return:
+    :param workers: maximum number of datasets counted at a time
+    :return: df of counts for all datasets with the dataset_id as the first column
     """
     dataset_ids = ru.get_dataset_ids_to_target(project_id, dataset_ids)
-    for dataset_id in dataset_ids:
+    client = bq.get_client(project_id)
+
+    def count_dataset(dataset_id):
         try:
             # We do not fetch queries for each dataset here and union them since it exceeds BQ query length limits
             counts_df = count_pid_rows_in_dataset(project_id, dataset_id,
-                                                  hpo_id, pid_source)
-            log_total_rows(counts_df, dataset_id)
+                                                  hpo_id, pid_source, client)
         except BadRequest:
             # log non-conforming datasets and continue
             logging.exception(f'Dataset {dataset_id} could not be analyzed')
+            return None
+        log_total_rows(counts_df, dataset_id)
+        counts_df.insert(0, DATASET_ID, dataset_id)
+        return counts_df
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts_dfs = [
+            counts_df for counts_df in executor.map(count_dataset, dataset_ids)
+            if counts_df is not None
+        ]
+    if not counts_dfs:
+        return pd.DataFrame(columns=[DATASET_ID, ru_consts.TABLE_ID])
+    return pd.concat(counts_dfs, ignore_index=True)
 
 
 if __name__ == '__main__':
@@ -8,6 +8,7 @@ Retraction is performed for each dataset based on its category
 # Python imports
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # Third party imports
 
@@ -45,12 +46,27 @@ TABLES_FOR_RETRACTION = set(common.PII_TABLES + common.AOU_REQUIRED +
                             OTHER_PID_TABLES) - set(NON_PID_TABLES +
                                                     NON_EHR_TABLES)
 
+MAX_CONCURRENT_JOBS = 8
+
+RETRACTION_PID_TABLE = 'retraction_pids'
+
 PERSON_ID_QUERY = """
 SELECT
   {{person_research_id}}
 FROM `{{pid_project}}.{{sandbox_dataset_id}}.{{pid_table_id}}`
 """
 
+# Materializes the pids once per script so each DELETE avoids re-reading the pid table
+RETRACTION_PID_TABLE_QUERY = """
+CREATE TEMP TABLE {{pid_table}} AS
+SELECT DISTINCT {{person_research_id}} AS pid
+FROM `{{pid_project}}.{{sandbox_dataset_id}}.{{pid_table_id}}`;
+"""
+
+TEMP_PID_QUERY = """
+SELECT pid FROM {{pid_table}}
+"""
+
 ID_CONST_CONDITION = """
 AND {{table_id}} > {{id_constant}}"""
 
@@ -245,8 +261,207 @@ def retraction_query_runner(client, queries):
     return
 
 
-def run_bq_retraction(project_id, sandbox_dataset_id, pid_project_id,
-                      pid_table_id, hpo_id, dataset_ids_list, retraction_type):
+def get_person_id_query(dataset_id, sandbox_dataset_id, pid_project_id,
+                        pid_table_id):
+    """
+    Returns the query selecting the ids to retract from the dataset
+
+    Deid datasets are keyed on research_id, all others on person_id
+
+    :param dataset_id: identifies the dataset to retract from
+    :param sandbox_dataset_id: identifies the dataset containing the pid table
+    :param pid_project_id: identifies the project containing the sandbox dataset
+    :param pid_table_id: table containing the person_ids and research_ids
+    :return: tuple of the id column and the query selecting the ids
+    """
+    person_research_id = RESEARCH_ID if ru.is_deid_dataset(
+        dataset_id) else PERSON_ID
+    person_id_query = JINJA_ENV.from_string(PERSON_ID_QUERY).render(
+        person_research_id=person_research_id,
+        pid_project=pid_project_id,
+        sandbox_dataset_id=sandbox_dataset_id,
+        pid_table_id=pid_table_id)
+    return person_research_id, person_id_query
+
+
+def queries_to_retract(client, project_id, dataset_id, hpo_id, person_id_query,
+                       retraction_type):
+    """
+    Get list of queries to retract the supplied ids from the dataset based on its category
+
+    :param client: bigquery client
+    :param project_id: identifies associated project
+    :param dataset_id: identifies associated dataset
+    :param hpo_id: identifies the HPO site
+    :param person_id_query: query to select person_ids to retract
+    :param retraction_type: string indicating whether all data needs to be removed, including RDR,
+        or if RDR data needs to be kept intact. Can take the values 'rdr_and_ehr' or 'only_ehr'
+    :return: list of queries to run
+    """
+    if ru.is_deid_dataset(dataset_id):
+        LOGGER.info(f"Retracting from DEID dataset {dataset_id}")
+        return queries_to_retract_from_dataset(client, project_id, dataset_id,
+                                               person_id_query, retraction_type)
+    if ru.is_combined_dataset(dataset_id):
+        LOGGER.info(f"Retracting from Combined dataset {dataset_id}")
+        return queries_to_retract_from_dataset(client, project_id, dataset_id,
+                                               person_id_query)
+    if ru.is_unioned_dataset(dataset_id):
+        LOGGER.info(f"Retracting from Unioned dataset {dataset_id}")
+        return queries_to_retract_from_dataset(client, project_id, dataset_id,
+                                               person_id_query)
+    if ru.is_ehr_dataset(dataset_id):
+        if hpo_id == NONE_STR:
+            LOGGER.info(
+                f'"RETRACTION_HPO_ID" set to "{NONE_STR}", skipping retraction from {dataset_id}'
+            )
+            return []
+        LOGGER.info(f"Retracting from EHR dataset {dataset_id}")
+        return queries_to_retract_from_ehr_dataset(client, project_id,
+                                                   dataset_id, hpo_id,
+                                                   person_id_query)
+    return []
+
+
+def get_retraction_script(queries, person_research_id, sandbox_dataset_id,
+                          pid_project_id, pid_table_id):
+    """
+    Combines a dataset's retraction queries into a single BigQuery script
+
+    The pids are copied into a temp table once and every DELETE reads from it
+
+    :param queries: list of DELETE statements reading pids from the temp table
+    :param person_research_id: person_id or research_id
+    :param sandbox_dataset_id: identifies the dataset containing the pid table
+    :param pid_project_id: identifies the project containing the sandbox dataset
+    :param pid_table_id: table containing the person_ids and research_ids
+    :return: the script as str
+    """
+    pid_table_query = JINJA_ENV.from_string(RETRACTION_PID_TABLE_QUERY).render(
+        pid_table=RETRACTION_PID_TABLE,
+        person_research_id=person_research_id,
+        pid_project=pid_project_id,
+        sandbox_dataset_id=sandbox_dataset_id,
+        pid_table_id=pid_table_id)
+    statements = [pid_table_query.strip()]
+    statements.extend(f'{query.strip()};' for query in queries)
+    return '\n\n'.join(statements)
+
+
+def plan_bq_retraction(client,
+                       project_id,
+                       sandbox_dataset_id,
+                       pid_project_id,
+                       pid_table_id,
+                       hpo_id,
+                       dataset_ids,
+                       retraction_type,
+                       scripted=True):
+    """
+    Generates the retraction queries for every dataset before any of them run
+
+    :param client: bigquery client
+    :param project_id: project to retract from
+    :param sandbox_dataset_id: identifies the dataset containing the pid table
+    :param pid_project_id: identifies the project containing the sandbox dataset
+    :param pid_table_id: table containing the person_ids and research_ids
+    :param hpo_id: hpo_id of the site to retract from
+    :param dataset_ids: list of datasets to retract from
+    :param retraction_type: 'rdr_and_ehr' or 'only_ehr'
+    :param scripted: if True, each dataset's queries are combined into one script
+        reading pids from a temp table. Otherwise each table is retracted separately
+    :return: dict mapping each dataset_id to the list of queries to run
+    """
+    plan = {}
+    for dataset_id in dataset_ids:
+        person_research_id, person_id_query = get_person_id_query(
+            dataset_id, sandbox_dataset_id, pid_project_id, pid_table_id)
+        if scripted:
+            person_id_query = JINJA_ENV.from_string(TEMP_PID_QUERY).render(
+                pid_table=RETRACTION_PID_TABLE)
+        queries = queries_to_retract(client, project_id, dataset_id, hpo_id,
+                                     person_id_query, retraction_type)
+        if queries and scripted:
+            queries = [
+                get_retraction_script(queries, person_research_id,
+                                      sandbox_dataset_id, pid_project_id,
+                                      pid_table_id)
+            ]
+        plan[dataset_id] = queries
+    return plan
+
+
+def preview_retraction_plan(plan):
+    """
+    Logs the jobs that will run for each dataset
+
+    :param plan: dict mapping each dataset_id to the list of queries to run
+    :return: total number of jobs in the plan
+    """
+    total_jobs = 0
+    for dataset_id, queries in plan.items():
+        LOGGER.info(f'{dataset_id}: {len(queries)} retraction job(s)')
+        for query in queries:
+            LOGGER.debug(query)
+        total_jobs += len(queries)
+    LOGGER.info(
+        f'Retraction plan: {total_jobs} job(s) across {len(plan)} dataset(s)')
+    return total_jobs
+
+
+def run_retraction_query(client, query):
+    """
+    Runs a single retraction query or script and waits for it to finish
+
+    :param client: bigquery client
+    :param query: DELETE statement or script to run
+    :return: number of rows removed
+    """
+    job = client.query(query)
+    LOGGER.info(f'Running query for job_id {job.job_id}')
+    job.result()
+    if job.num_child_jobs:
+        removed = sum(child.num_dml_affected_rows or 0
+                      for child in client.list_jobs(parent_job=job.job_id))
+    else:
+        removed = job.num_dml_affected_rows or 0
+    LOGGER.info(f'Removed {removed} rows for job_id {job.job_id}')
+    return removed
+
+
+def run_retraction_plan(client, plan, max_concurrent_jobs=MAX_CONCURRENT_JOBS):
+    """
+    Runs the queries of every dataset in the plan concurrently
+
+    At most max_concurrent_jobs BigQuery jobs run at a time across all datasets
+
+    :param client: bigquery client
+    :param plan: dict mapping each dataset_id to the list of queries to run
+    :param max_concurrent_jobs: global cap on the number of running jobs
+    :return: dict mapping each dataset_id to the number of rows removed
+    """
+    jobs = [(dataset_id, query)
+            for dataset_id, queries in plan.items()
+            for query in queries]
+    run_query = pipeline_logging.bind_span(
+        pipeline_logging.traced()(run_retraction_query))
+    with ThreadPoolExecutor(max_workers=max_concurrent_jobs) as executor:
+        removed = executor.map(lambda job: run_query(client, job[1]), jobs)
+        rows_removed = dict.fromkeys(plan, 0)
+        for (dataset_id, _), rows in zip(jobs, removed):
+            rows_removed[dataset_id] += rows
+    return rows_removed
+
+
+@pipeline_logging.traced()
+def run_bq_retraction(project_id,
+                      sandbox_dataset_id,
+                      pid_project_id,
+                      pid_table_id,
+                      hpo_id,
+                      dataset_ids_list,
+                      retraction_type,
+                      max_concurrent_jobs=None):
     """
     Main function to perform retraction
     pid table must follow schema described above in PID_TABLE_FIELDS and must reside in sandbox_dataset_id
@@ -261,48 +476,32 @@ def run_bq_retraction(project_id, sandbox_dataset_id, pid_project_id,
         retracts from all datasets. If containing only 'none', skips retraction from BigQuery datasets
     :param retraction_type: string indicating whether all data needs to be removed, including RDR,
         or if RDR data needs to be kept intact. Can take the values 'rdr_and_ehr' or 'only_ehr'
+    :param max_concurrent_jobs: if set, every dataset is planned up front and retracted
+        with one script per dataset, running at most this many jobs at a time.
+        Otherwise queries run one at a time
     :return:
     """
     client = bq.get_client(project_id)
     dataset_ids = ru.get_datasets_list(project_id, dataset_ids_list)
 
-    queries = []
+    if max_concurrent_jobs:
+        plan = plan_bq_retraction(client, project_id, sandbox_dataset_id,
+                                  pid_project_id, pid_table_id, hpo_id,
+                                  dataset_ids, retraction_type)
+        preview_retraction_plan(plan)
+        run_retraction_plan(client, plan, max_concurrent_jobs)
+        LOGGER.info('Retraction complete')
+        return
+
     for dataset in dataset_ids:
-        if ru.is_deid_dataset(dataset):
-            LOGGER.info(f"Retracting from DEID dataset {dataset}")
-            research_id_query = JINJA_ENV.from_string(PERSON_ID_QUERY).render(
-                person_research_id=RESEARCH_ID,
-                pid_project=pid_project_id,
-                sandbox_dataset_id=sandbox_dataset_id,
-                pid_table_id=pid_table_id)
-            queries = queries_to_retract_from_dataset(client, project_id,
-                                                      dataset,
-                                                      research_id_query,
-                                                      retraction_type)
-        else:
-            person_id_query = JINJA_ENV.from_string(PERSON_ID_QUERY).render(
-                person_research_id=PERSON_ID,
-                pid_project=pid_project_id,
-                sandbox_dataset_id=sandbox_dataset_id,
-                pid_table_id=pid_table_id)
-            if ru.is_combined_dataset(dataset):
-                LOGGER.info(f"Retracting from Combined dataset {dataset}")
-                queries = queries_to_retract_from_dataset(
-                    client, project_id, dataset, person_id_query)
-            elif ru.is_unioned_dataset(dataset):
-                LOGGER.info(f"Retracting from Unioned dataset {dataset}")
-                queries = queries_to_retract_from_dataset(
-                    client, project_id, dataset, person_id_query)
-            elif ru.is_ehr_dataset(dataset):
-                if hpo_id == NONE_STR:
-                    LOGGER.info(
-                        f'"RETRACTION_HPO_ID" set to "{NONE_STR}", skipping retraction from {dataset}'
-                    )
-                else:
-                    LOGGER.info(f"Retracting from EHR dataset {dataset}")
-                    queries = queries_to_retract_from_ehr_dataset(
-                        client, project_id, dataset, hpo_id, person_id_query)
-        retraction_query_runner(client, queries)
+        with pipeline_logging.span('retract_dataset', dataset_id=dataset):
+            _, person_id_query = get_person_id_query(dataset,
+                                                     sandbox_dataset_id,
+                                                     pid_project_id,
+                                                     pid_table_id)
+            queries = queries_to_retract(client, project_id, dataset, hpo_id,
+                                         person_id_query, retraction_type)
+            retraction_query_runner(client, queries)
     LOGGER.info('Retraction complete')
     return
 
@@ -375,8 +574,19 @@ if __name__ == '__main__':
             f'or if RDR data needs to be kept intact. Can take the values '
             f'"{RETRACTION_RDR_EHR}" or "{RETRACTION_EHR}"'),
         required=True)
+    parser.add_argument(
+        '-j',
+        '--max_concurrent_jobs',
+        action='store',
+        dest='max_concurrent_jobs',
+        type=int,
+        help=('Plans all datasets up front and retracts from each with a '
+              'single script, running at most this many jobs at a time. '
+              'If not set, queries run one at a time'),
+        required=False)
     args = parser.parse_args()
 
     run_bq_retraction(args.project_id, args.sandbox_dataset_id,
                       args.pid_project_id, args.pid_table_id, args.hpo_id,
-                      args.dataset_ids, args.retraction_type)
+                      args.dataset_ids, args.retraction_type,
+                      args.max_concurrent_jobs)
@@ -7,10 +7,13 @@ The schema for the pid table is located in retract_data_bq.py as PID_TABLE_FIELD
 If the submission folder is set to 'all_folders', all the submissions from the site will be considered for retraction
 If a submission folder is specified, only that folder will be considered for retraction
 """
+import csv
+import io
 import os
-from io import BytesIO
 import argparse
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 from google.cloud import storage, bigquery
 
@@ -29,7 +32,13 @@ PID_IN_COL2 = [
     common.DEVICE_EXPOSURE, common.SPECIMEN, common.NOTE
 ]
 
+CHUNK_SIZE = 8 * 1024 * 1024
+"""Size in bytes of the chunks downloaded and uploaded.  Must be a multiple of 256 KB"""
+SPOOL_SIZE = 64 * 1024 * 1024
+"""Size in bytes of retracted file content kept in memory before spilling to disk"""
 
+
+@pipeline_logging.traced()
 def run_gcs_retraction(project_id,
                        sandbox_dataset_id,
                        pid_table_id,
@@ -37,7 +46,8 @@ def run_gcs_retraction(project_id,
                        folder,
                        force_flag,
                        bucket=None,
-                       site_bucket=None):
+                       site_bucket=None,
+                       workers=1):
     """
     Retract from a folder/folders in a GCS bucket all records associated with a pid
 
@@ -50,10 +60,13 @@ def run_gcs_retraction(project_id,
     :param force_flag: if False then prompt for each file
     :param bucket: DRC bucket maintained by curation
     :param site_bucket: Site's bucket name
+    :param workers: number of files retracted concurrently.  Only used with
+        force_flag, since prompts are answered one file at a time.
     """
 
     # extract the pids
-    pids = extract_pids_from_table(project_id, sandbox_dataset_id, pid_table_id)
+    pids = set(
+        extract_pids_from_table(project_id, sandbox_dataset_id, pid_table_id))
 
     if not bucket:
         bucket = os.environ.get('DRC_BUCKET_NAME')
@@ -96,27 +109,13 @@ def run_gcs_retraction(project_id,
         bucket + '/' + folder_prefix for folder_prefix in to_process_folder_list
     ])
 
+    if force_flag and workers > 1:
+        retract_concurrently(gcs_client, pids, bucket, to_process_folder_list,
+                             workers)
+        to_process_folder_list = []
+
     for folder_prefix in to_process_folder_list:
-        logging.info(f'Processing gs://{bucket}/{folder_prefix}')
-        # separate cdm from the unknown (unexpected) files
-        bucket_item_objs = gcs_client.list_blobs(bucket,
-                                                 prefix=folder_prefix,
-                                                 delimiter='/')
-        folder_items = [blob.name for blob in bucket_item_objs]
-        found_files = []
-        file_names = [item.split('/')[-1] for item in folder_items]
-        for item in file_names:
-            # Only retract from CDM or PII files containing PIDs
-            item = item.lower()
-            table_name = item.split('.')[0]
-            if table_name in PID_IN_COL1 + PID_IN_COL2:
-                found_files.append(item)
-
-        logging.info('Found the following files to retract data from:')
-        logging.info([
-            bucket + '/' + folder_prefix + file_name
-            for file_name in found_files
-        ])
+        found_files = get_retractable_files(gcs_client, bucket, folder_prefix)
 
         logging.info("Proceed?")
         if force_flag:
@@ -128,8 +127,9 @@ def run_gcs_retraction(project_id,
             # Make sure user types Y to proceed
             response = get_response()
         if response == "Y":
-            retract(gcs_client, pids, bucket, found_files, folder_prefix,
-                    force_flag)
+            with pipeline_logging.span('retract_folder', folder=folder_prefix):
+                retract(gcs_client, pids, bucket, found_files, folder_prefix,
+                        force_flag)
             logging.info(
                 f"Retraction completed for folder {bucket}/{folder_prefix}")
         elif response.lower() == "n":
@@ -138,6 +138,36 @@ def run_gcs_retraction(project_id,
     return
 
 
+def get_retractable_files(gcs_client, bucket, folder_prefix):
+    """
+    List the CDM and PII files in a folder that may contain person_ids
+
+    :param gcs_client: google cloud storage client
+    :param bucket: bucket containing the folder
+    :param folder_prefix: folder to list
+    :return: list of lower cased file names
+    """
+    logging.info(f'Processing gs://{bucket}/{folder_prefix}')
+    # separate cdm from the unknown (unexpected) files
+    bucket_item_objs = gcs_client.list_blobs(bucket,
+                                             prefix=folder_prefix,
+                                             delimiter='/')
+    folder_items = [blob.name for blob in bucket_item_objs]
+    found_files = []
+    file_names = [item.split('/')[-1] for item in folder_items]
+    for item in file_names:
+        # Only retract from CDM or PII files containing PIDs
+        item = item.lower()
+        table_name = item.split('.')[0]
+        if table_name in PID_IN_COL1 + PID_IN_COL2:
+            found_files.append(item)
+
+    logging.info('Found the following files to retract data from:')
+    logging.info(
+        [bucket + '/' + folder_prefix + file_name for file_name in found_files])
+    return found_files
+
+
 def retract(gcs_client, pids, bucket, found_files, folder_prefix, force_flag):
     """
     Retract from a folder in a GCS bucket all records associated with a pid
@@ -152,9 +182,8 @@ def retract(gcs_client, pids, bucket, found_files, folder_prefix, force_flag):
     :param folder_prefix: current folder being processed
     :param force_flag: if False then prompt for each file
     """
+    pids = set(pids)
     for file_name in found_files:
-        table_name = file_name.split(".")[0]
-        lines_removed = 0
         file_gcs_path = f'{bucket}/{folder_prefix}{file_name}'
         if force_flag:
             logging.info(f"Downloading file in path {file_gcs_path}")
@@ -166,67 +195,182 @@ def retract(gcs_client, pids, bucket, found_files, folder_prefix, force_flag):
             )
             response = get_response()
         if response == "Y":
-            # Output and input file content initialization
-            retracted_file_string = BytesIO()
-            gcs_bucket = gcs_client.bucket(bucket)
-            blob = gcs_bucket.blob(folder_prefix + file_name)
-            input_file_lines = blob.download_as_string().split(b'\n')
-            if len(input_file_lines) < 2:
-                continue
-            input_header = input_file_lines[0]
-            input_contents = input_file_lines[1:]
-            retracted_file_string.write(input_header + b'\n')
-            logging.info(
-                f"Checking for person_ids {pids} in path {file_gcs_path}")
-
-            # Check if file has person_id in first or second column
-            for input_line in input_contents:
-                input_line = input_line.strip()
-                # ensure line is not empty
-                if input_line:
-                    cols = input_line.split(b',')
-                    # ensure at least two columns exist
-                    if len(cols) > 1:
-                        col_1 = cols[0].replace(b'"', b'')
-                        col_2 = cols[1].replace(b'"', b'')
-                        # skip if non-integer is encountered and keep the line as is
-                        try:
-                            if ((table_name in PID_IN_COL1 and
-                                 int(col_1) in pids) or
-                                (table_name in PID_IN_COL2 and
-                                 int(col_2) in pids)):
-                                # do not write back this line since it contains a pid to retract
-                                # increment removed lines counter
-                                lines_removed += 1
-                            else:
-                                # pid not found, retain this line
-                                retracted_file_string.write(input_line + b'\n')
-                        except ValueError:
-                            # write back non-num lines
-                            retracted_file_string.write(input_line + b'\n')
-                    else:
-                        # write back ill-formed lines. Note: These lines do not make it into BigQuery
-                        retracted_file_string.write(input_line + b'\n')
-
-            # Write result back to bucket
-            if lines_removed > 0:
-                logging.info(
-                    f"{lines_removed} rows retracted from {file_gcs_path}")
-                logging.info(f"Uploading to overwrite...")
-                new_blob = gcs_bucket.blob(folder_prefix + file_name)
-                new_blob.upload_from_file(retracted_file_string,
-                                          rewind=True,
-                                          content_type='text/csv')
-                logging.info(f"Retraction successful for file {file_gcs_path}")
-            else:
-                logging.info(
-                    f"Not updating file {file_gcs_path} since pids {pids} not found"
-                )
+            retract_file(gcs_client, pids, bucket, folder_prefix, file_name)
         elif response.lower() == "n":
             logging.info(f"Skipping file {file_gcs_path}")
     return
 
 
+def retract_concurrently(gcs_client, pids, bucket, folder_prefixes, workers):
+    """
+    Retract from the files in several folders concurrently, without prompts
+
+    :param gcs_client: google cloud storage client
+    :param pids: set of person_ids to retract
+    :param bucket: bucket containing records to retract
+    :param folder_prefixes: folders to retract from
+    :param workers: number of folders listed and files retracted concurrently
+    :return: total number of rows retracted
+    """
+    retract_traced = pipeline_logging.bind_span(
+        pipeline_logging.traced()(retract_file))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        folder_files = executor.map(
+            lambda prefix: get_retractable_files(gcs_client, bucket, prefix),
+            folder_prefixes)
+        tasks = [
+            (folder_prefix, file_name)
+            for folder_prefix, found_files in zip(folder_prefixes, folder_files)
+            for file_name in found_files
+        ]
+        logging.info(
+            f"Retracting from {len(tasks)} files with {workers} workers")
+
+        removed = list(
+            executor.map(
+                lambda task: retract_traced(gcs_client, pids, bucket, *task),
+                tasks))
+
+    for folder_prefix in folder_prefixes:
+        logging.info(
+            f"Retraction completed for folder {bucket}/{folder_prefix}")
+    return sum(removed)
+
+
+class _RecordingLines:
+    """
+    Iterate over lines, keeping the raw lines read since the last reset
+
+    Allows the original text of each record parsed by csv.reader, which may
+    span several lines if quoted fields contain newlines, to be written back
+    unchanged.
+    """
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self.raw = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._lines)
+        self.raw.append(line)
+        return line
+
+    def pop_raw(self):
+        raw = ''.join(self.raw)
+        self.raw = []
+        return raw
+
+
+def _encode(record):
+    """
+    Encode a record as a line of bytes, restoring undecodable bytes
+    """
+    return (record + '\n').encode('utf-8', errors='surrogateescape')
+
+
+def retract_stream(input_file, output_file, pids, table_name):
+    """
+    Copy CSV records from input_file to output_file, skipping retracted records
+
+    Records are parsed with a CSV tokenizer, so quoted fields containing
+    commas or newlines are handled.  Records are written back as they
+    appear in the input, stripped of surrounding whitespace.  Empty records
+    are dropped.  Records whose person_id field is not an integer or that
+    have fewer than two fields are kept.
+
+    :param input_file: readable text file object
+    :param output_file: writable binary file object.  records are written
+        utf-8 encoded
+    :param pids: set of integer person_ids to retract
+    :param table_name: name of the table the file contains
+    :return: number of records retracted
+    """
+    pid_index = 0 if table_name in PID_IN_COL1 else 1
+    lines = _RecordingLines(input_file)
+    reader = csv.reader(lines)
+    lines_removed = 0
+
+    try:
+        next(reader)
+    except StopIteration:
+        return lines_removed
+    output_file.write(_encode(lines.pop_raw().strip()))
+
+    for record in reader:
+        raw_record = lines.pop_raw().strip()
+        # ensure line is not empty
+        if not raw_record:
+            continue
+
+        # ensure at least two columns exist
+        if len(record) > 1:
+            # skip if non-integer is encountered and keep the line as is
+            try:
+                pid = int(record[pid_index])
+            except ValueError:
+                pid = None
+
+            if pid is not None and pid in pids:
+                # do not write back this line since it contains a pid to retract
+                lines_removed += 1
+                continue
+
+        # write back ill-formed lines. Note: These lines do not make it into BigQuery
+        output_file.write(_encode(raw_record))
+
+    return lines_removed
+
+
+def retract_file(gcs_client, pids, bucket, folder_prefix, file_name):
+    """
+    Retract all records associated with the pids from a single file
+
+    The file is streamed in chunks and the retracted content is spooled to
+    a temporary file, so memory use does not depend on the file size.  The
+    file is only overwritten, using a resumable upload, if rows were retracted.
+
+    :param gcs_client: google cloud storage client
+    :param pids: set of person_ids to retract
+    :param bucket: bucket containing records to retract
+    :param folder_prefix: folder containing the file
+    :param file_name: name of the file to retract from
+    :return: number of rows retracted
+    """
+    table_name = file_name.split(".")[0]
+    file_gcs_path = f'{bucket}/{folder_prefix}{file_name}'
+    gcs_bucket = gcs_client.bucket(bucket)
+    blob = gcs_bucket.blob(folder_prefix + file_name)
+    logging.info(f"Checking for person_ids in path {file_gcs_path}")
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as retracted_file:
+        with blob.open('rb', chunk_size=CHUNK_SIZE) as blob_reader:
+            input_file = io.TextIOWrapper(blob_reader,
+                                          encoding='utf-8',
+                                          errors='surrogateescape',
+                                          newline='')
+            lines_removed = retract_stream(input_file, retracted_file, pids,
+                                           table_name)
+
+        # Write result back to bucket
+        if lines_removed > 0:
+            logging.info(f"{lines_removed} rows retracted from {file_gcs_path}")
+            logging.info(f"Uploading to overwrite...")
+            new_blob = gcs_bucket.blob(folder_prefix + file_name,
+                                       chunk_size=CHUNK_SIZE)
+            new_blob.upload_from_file(retracted_file,
+                                      rewind=True,
+                                      content_type='text/csv')
+            logging.info(f"Retraction successful for file {file_gcs_path}")
+        else:
+            logging.info(
+                f"Not updating file {file_gcs_path} since pids not found")
+
+    return lines_removed
+
+
 # Make sure user types Y to proceed
 def get_response():
     prompt_text = 'Please press Y/n\n'
@@ -308,9 +452,23 @@ if __name__ == '__main__':
         action='store_true',
         help='Optional. Indicates pids must be retracted without user prompts',
         required=False)
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        action='store',
+        type=int,
+        default=1,
+        help='Optional. Number of files retracted concurrently with the force '
+        'flag.  Defaults to 1',
+        required=False)
 
     args = parser.parse_args()
 
-    run_gcs_retraction(args.project_id, args.sandbox_dataset_id,
-                       args.pid_table_id, args.hpo_id, args.folder_name,
-                       args.force_flag)
+    run_gcs_retraction(args.project_id,
+                       args.sandbox_dataset_id,
+                       args.pid_table_id,
+                       args.hpo_id,
+                       args.folder_name,
+                       args.force_flag,
+                       workers=args.workers)
@@ -25,11 +25,32 @@ SELECT *
 FROM `{{project}}.{{dataset}}.INFORMATION_SCHEMA.COLUMNS`
 """)
 
-# Queries to create tables in associated sandbox with rows that will be removed per cleaning rule
-SANDBOX_QUERY = JINJA_ENV.from_string(  # language=JINJA2
+# Condition identifying rows dated on or after the deactivation date, shared by all queries
+DATE_CONDITION = JINJA_ENV.from_string(  # language=JINJA2
+    """
+{% if has_start_date %}
+(COALESCE(t.{{end_date}}, EXTRACT(DATE FROM t.{{end_datetime}}),
+    t.{{start_date}}, EXTRACT(DATE FROM t.{{start_datetime}})) >= d.deactivated_date
+{% if table_ref.table_id == 'drug_exposure' %}
+OR t.verbatim_end_date >= d.deactivated_date)
+{% else %} )
+{% endif %}
+{% elif table_ref.table_id == 'death' %}
+COALESCE(t.death_date, EXTRACT(DATE FROM t.death_datetime)) >= d.deactivated_date
+{% elif table_ref.table_id in ['activity_summary', 'heart_rate_summary'] %}
+t.date >= d.deactivated_date
+{% elif table_ref.table_id in ['heart_rate_minute_level', 'steps_intraday']  %}
+t.datetime >= PARSE_DATETIME('%F', CAST(d.deactivated_date as STRING))
+{% elif table_ref.table_id in ['drug_era', 'condition_era', 'dose_era', 'payer_plan_period']  %}
+COALESCE({{'t.' + table_ref.table_id + '_end_date'}}, {{'t.' + table_ref.table_id + '_start_date'}}) >= d.deactivated_date
+{% else %}
+COALESCE(t.{{date}}, EXTRACT(DATE FROM t.{{datetime}})) >= d.deactivated_date
+{% endif %}
+""")
+
+# Joins a table to the deactivated participants, keeping rows dated after deactivation
+DEACTIVATED_ROWS = JINJA_ENV.from_string(  # language=JINJA2
     """
-CREATE OR REPLACE TABLE `{{sandbox_ref.project}}.{{sandbox_ref.dataset_id}}.{{sandbox_ref.table_id}}` AS (
-SELECT t.*
 FROM `{{table_ref.project}}.{{table_ref.dataset_id}}.{{table_ref.table_id}}` t
 
 {% if is_deid %}
@@ -42,24 +63,41 @@ JOIN `{{deact_pids_table.project}}.{{deact_pids_table.dataset_id}}.{{deact_pids_
 USING (person_id)
 {% endif %}
 
-{% if has_start_date %}
-WHERE (COALESCE({{end_date}}, EXTRACT(DATE FROM {{end_datetime}}),
-    {{start_date}}, EXTRACT(DATE FROM {{start_datetime}})) >= d.deactivated_date
-{% if table_ref.table_id == 'drug_exposure' %}
-OR verbatim_end_date >= d.deactivated_date)
-{% else %} )
-{% endif %}
-{% elif table_ref.table_id == 'death' %}
-WHERE COALESCE(death_date, EXTRACT(DATE FROM death_datetime)) >= d.deactivated_date
-{% elif table_ref.table_id in ['activity_summary', 'heart_rate_summary'] %}
-WHERE date >= d.deactivated_date
-{% elif table_ref.table_id in ['heart_rate_minute_level', 'steps_intraday']  %}
-WHERE datetime >= PARSE_DATETIME('%F', CAST(d.deactivated_date as STRING))
-{% elif table_ref.table_id in ['drug_era', 'condition_era', 'dose_era', 'payer_plan_period']  %}
-WHERE COALESCE({{table_ref.table_id + '_end_date'}}, {{table_ref.table_id + '_start_date'}}) >= d.deactivated_date
+WHERE {{date_condition}}
+""")
+
+# Queries to create tables in associated sandbox with rows that will be removed per cleaning rule
+SANDBOX_QUERY = JINJA_ENV.from_string(  # language=JINJA2
+    """
+CREATE OR REPLACE TABLE `{{sandbox_ref.project}}.{{sandbox_ref.dataset_id}}.{{sandbox_ref.table_id}}` AS (
+SELECT t.*
+{{deactivated_rows}})
+""")
+
+# Counts the rows to remove from a table so tables without deactivated participant data can be skipped
+AFFECTED_ROWS_QUERY = JINJA_ENV.from_string(  # language=JINJA2
+    """
+SELECT '{{table_ref.table_id}}' AS table_name, COUNT(*) AS affected_rows
+{{deactivated_rows}}
+""")
+
+# Removes rows dated after deactivation in place, without rewriting the rest of the table
+DELETE_QUERY = JINJA_ENV.from_string(  # language=JINJA2
+    """
+DELETE
+FROM `{{table_ref.project}}.{{table_ref.dataset_id}}.{{table_ref.table_id}}` t
+WHERE EXISTS (
+SELECT 1
+{% if is_deid %}
+FROM `{{pid_rid_table.project}}.{{pid_rid_table.dataset_id}}.{{pid_rid_table.table_id}}` p
+JOIN `{{deact_pids_table.project}}.{{deact_pids_table.dataset_id}}.{{deact_pids_table.table_id}}` d
+ON p.person_id = d.person_id
+WHERE t.person_id = p.research_id
 {% else %}
-WHERE COALESCE({{date}}, EXTRACT(DATE FROM {{datetime}})) >= d.deactivated_date
-{% endif %})
+FROM `{{deact_pids_table.project}}.{{deact_pids_table.dataset_id}}.{{deact_pids_table.table_id}}` d
+WHERE t.person_id = d.person_id
+{% endif %}
+AND {{date_condition}})
 """)
 
 # Queries to truncate existing tables to remove deactivated EHR PIDS, two different queries for
@@ -146,12 +184,29 @@ def get_table_dates_info(table_cols_df):
     return dates_info
 
 
+def get_affected_tables(client, affected_rows_queries):
+    """
+    Returns the tables containing rows for deactivated participants
+
+    :param client: BigQuery client
+    :param affected_rows_queries: list of queries counting the affected rows of each table
+    :return: set of table names with at least one affected row
+    """
+    if not affected_rows_queries:
+        return set()
+    query = '\nUNION ALL\n'.join(affected_rows_queries)
+    affected_rows_df = client.query(query).to_dataframe()
+    affected_rows_df = affected_rows_df[affected_rows_df['affected_rows'] > 0]
+    return set(affected_rows_df['table_name'].to_list())
+
+
 def generate_queries(client,
                      project_id,
                      dataset_id,
                      sandbox_dataset_id,
                      deact_pids_table_ref,
-                     pid_rid_table_ref=None):
+                     pid_rid_table_ref=None,
+                     in_place=False):
     """
     Creates queries for sandboxing and deleting records
 
@@ -161,6 +216,8 @@ def generate_queries(client,
     :param sandbox_dataset_id: Identifies the dataset to store records to delete
     :param deact_pids_table_ref: BigQuery table reference to dataset containing deactivated participants
     :param pid_rid_table_ref: BigQuery table reference to dataset containing pid-rid mappings
+    :param in_place: If True, only tables containing rows for deactivated participants are
+        targeted and rows are removed with a DELETE instead of truncating the table
     :return: List of query dicts
     :raises:
         RuntimeError: 1. If retracting from deid dataset, pid_rid table must be specified
@@ -174,28 +231,52 @@ def generate_queries(client,
         raise RuntimeError(
             f"PID-RID mapping table must be specified for deid dataset {dataset_id}"
         )
-    sandbox_queries = []
-    clean_queries = []
+    table_params = {}
     for table in table_dates_info:
         table_ref = gbq.TableReference.from_string(
             f"{project_id}.{dataset_id}.{table}")
+        date_cols = get_date_cols_dict(table_dates_info[table])
+        has_start_date = consts.START_DATE in date_cols
+        date_condition = DATE_CONDITION.render(table_ref=table_ref,
+                                               has_start_date=has_start_date,
+                                               **date_cols)
+        table_params[table] = dict(table_ref=table_ref,
+                                   pid_rid_table=pid_rid_table_ref,
+                                   deact_pids_table=deact_pids_table_ref,
+                                   is_deid=is_deid,
+                                   date_condition=date_condition)
+        table_params[table]['deactivated_rows'] = DEACTIVATED_ROWS.render(
+            **table_params[table])
+
+    if in_place:
+        affected_tables = get_affected_tables(client, [
+            AFFECTED_ROWS_QUERY.render(**params)
+            for params in table_params.values()
+        ])
+        LOGGER.info(f"Tables in '{dataset_id}' containing deactivated "
+                    f"participant data: {sorted(affected_tables)}")
+        table_params = {
+            table: params
+            for table, params in table_params.items()
+            if table in affected_tables
+        }
+
+    sandbox_queries = []
+    clean_queries = []
+    for table, params in table_params.items():
+        table_ref = params['table_ref']
         sandbox_table = f"{'_'.join(ISSUE_NUMBERS).lower().replace('-', '_')}_{table}"
         sandbox_ref = gbq.TableReference.from_string(
             f"{project_id}.{sandbox_dataset_id}.{sandbox_table}")
-        date_cols = get_date_cols_dict(table_dates_info[table])
-        has_start_date = consts.START_DATE in date_cols
         sandbox_queries.append({
             cdr_consts.QUERY:
-                SANDBOX_QUERY.render(table_ref=table_ref,
-                                     table_id=f'{table}_id',
-                                     sandbox_ref=sandbox_ref,
-                                     pid_rid_table=pid_rid_table_ref,
-                                     deact_pids_table=deact_pids_table_ref,
-                                     is_deid=is_deid,
-                                     has_start_date=has_start_date,
-                                     **date_cols)
+                SANDBOX_QUERY.render(sandbox_ref=sandbox_ref, **params)
         })
 
+        if in_place:
+            clean_queries.append(
+                {cdr_consts.QUERY: DELETE_QUERY.render(**params)})
+            continue
         clean_queries.append({
             cdr_consts.QUERY:
                 CLEAN_QUERY.render(table_ref=table_ref,
@@ -324,14 +405,22 @@ def get_parser():
                         type=fq_table_name_verification,
                         help='Specify fully qualified pid-rid mapping table '
                         'as "project.dataset.table"')
+    parser.add_argument('-i',
+                        '--in_place',
+                        dest='in_place',
+                        action='store_true',
+                        help='Skip tables without deactivated participant '
+                        'data and DELETE rows instead of rewriting tables')
     return parser
 
 
+@pipeline_logging.traced()
 def run_deactivation(client,
                      project_id,
                      dataset_ids,
                      fq_deact_table,
-                     fq_pid_rid_table=None):
+                     fq_pid_rid_table=None,
+                     in_place=False):
     """
     Runs the deactivation retraction pipeline for a dataset
 
@@ -342,6 +431,8 @@ def run_deactivation(client,
         and deactivated dates as 'project.dataset.table'
     :param fq_pid_rid_table: Fully qualified table containing mappings from person_ids
         to research_ids as 'project.dataset.table'
+    :param in_place: If True, skips tables without deactivated participant data
+        and removes rows with a DELETE instead of truncating each table
     :return:job_ids: List of BigQuery job ids to perform the retraction as strings
     """
     pid_rid_table_ref = gbq.TableReference.from_string(
@@ -355,12 +446,13 @@ def run_deactivation(client,
             project_id, dataset_id)
         LOGGER.info(
             f"Using sandbox dataset '{sandbox_dataset_id}' for '{dataset_id}'")
-        queries = generate_queries(client, project_id, dataset_id,
-                                   sandbox_dataset_id, deact_table_ref,
-                                   pid_rid_table_ref)
-        for query in queries:
-            job_id = query_runner(client, query)
-            job_ids[dataset_id].append(job_id)
+        with pipeline_logging.span('retract_dataset', dataset_id=dataset_id):
+            queries = generate_queries(client, project_id, dataset_id,
+                                       sandbox_dataset_id, deact_table_ref,
+                                       pid_rid_table_ref, in_place)
+            for query in queries:
+                job_id = query_runner(client, query)
+                job_ids[dataset_id].append(job_id)
         LOGGER.info(
             f"Successfully retracted from {dataset_id} via jobs {job_ids[dataset_id]}"
         )
@@ -376,7 +468,7 @@ def main(args=None):
     LOGGER.info(
         f"Datasets to retract deactivated participants from: {dataset_ids}")
     run_deactivation(client, args.project_id, dataset_ids, args.fq_deact_table,
-                     args.fq_pid_rid_table)
+                     args.fq_pid_rid_table, args.in_place)
     LOGGER.info(
         f"Retraction of deactivated participants from {dataset_ids} complete")
 
@@ -0,0 +1,659 @@
+"""
+Offline benchmark of cleaning rule query generation for every data stage
+
+Every rule in DATA_STAGE_RULES_MAPPING is instantiated, set up against a fake
+BigQuery client and asked for its query specs, as clean_engine.get_query_list
+does.  The time, peak python memory and total size of the rendered SQL are
+reported per rule and per stage and compared with a stored baseline, so changes
+which make query generation slower, hungrier or produce different SQL stand out.
+
+Times and peak memory depend on the machine, so the committed baseline only
+stores the SQL size, query count and errors of each rule.  To also compare
+times and memory, write a baseline with --with_timings on the machine doing
+the comparison first.
+
+No network access is needed, or allowed: utils.bq.get_client returns the fake
+client, the RDR participant summary API returns no participants and opening a
+socket raises an error.
+
+Usage: python tools/benchmark_query_generation.py [-a ehr rdr] [-r 3] [--write_baseline [--with_timings]]
+"""
+# Python imports
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import time
+import tracemalloc
+import warnings
+from collections import defaultdict
+from contextlib import ExitStack
+from unittest import mock
+
+# Third party imports
+import pandas as pd
+from google.cloud import bigquery
+
+# Project imports
+import bq_utils
+import resources
+from cdr_cleaner import clean_cdr, clean_cdr_engine
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
+from utils import bq
+from utils import participant_summary_requests as psr
+
+LOGGER = logging.getLogger(__name__)
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.INFO)
+LOGGER.addHandler(handler)
+LOGGER.setLevel(logging.INFO)
+LOGGER.propagate = False
+
+PROJECT_ID = 'fake-project'
+DATASET_ID = 'fake_dataset'
+SANDBOX_DATASET_ID = 'fake_sandbox'
+
+BASELINE_PATH = os.path.join(resources.resource_files_path, 'benchmarks',
+                             'query_generation_baseline.json')
+TIME_TOLERANCE = 0.5
+"""Fraction by which a rule may get slower than its baseline"""
+MEMORY_TOLERANCE = 0.25
+"""Fraction by which a rule's peak memory may grow over its baseline"""
+MIN_SECONDS = 0.01
+"""Slowdowns smaller than this are timing noise"""
+MIN_BYTES = 256 * 1024
+"""Memory growth smaller than this is noise"""
+
+SECONDS = 'seconds'
+PEAK_BYTES = 'peak_bytes'
+SQL_BYTES = 'sql_bytes'
+QUERIES = 'queries'
+ERROR = 'error'
+POSITION = 'position'
+"""Position of the rule in its stage, from 1, stored apart from the rule name
+so that adding or moving a rule does not change the key of the others"""
+
+MACHINE_DEPENDENT = [SECONDS, PEAK_BYTES]
+"""Measurements only stored in baselines written with timings"""
+
+TABLES_META_TABLE = '__TABLES__'
+
+
+class NetworkAccessError(RuntimeError):
+    """
+    Raised when a rule attempts network access during the benchmark
+    """
+    pass
+
+
+class EmptyFrame(pd.DataFrame):
+    """
+    Query result frame without rows, which has every column a rule asks for
+    """
+
+    @property
+    def _constructor(self):
+        return EmptyFrame
+
+    def __getitem__(self, key):
+        if isinstance(key, str) and key not in self.columns:
+            return pd.Series(dtype=object, name=key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if isinstance(key, str):
+            return self[key]
+        return super().get(key, default)
+
+
+class FakeRowIterator(bigquery.table.RowIterator):
+    """
+    Query result with the given rows, without rows by default
+
+    Subclasses RowIterator, without calling its constructor, so that helpers
+    such as utils.bq.to_scalar accept it.
+    """
+    total_rows = 0
+    schema = []
+
+    def __init__(self, schema=(), rows=()):
+        """
+        :param schema: list of bigquery.SchemaField of the result
+        :param rows: list of tuples of values
+        """
+        self.schema = list(schema)
+        self.rows = list(rows)
+        self.total_rows = len(self.rows)
+        self._field_to_index = {
+            field.name: index for index, field in enumerate(self.schema)
+        }
+
+    def __iter__(self):
+        return (bigquery.Row(row, self._field_to_index) for row in self.rows)
+
+    def to_dataframe(self, *args, **kwargs):
+        if not self.rows:
+            return EmptyFrame()
+        return pd.DataFrame.from_records(
+            self.rows, columns=[field.name for field in self.schema])
+
+
+class FakeQueryJob(bigquery.QueryJob):
+    """
+    Finished job without errors
+
+    Subclasses QueryJob, without calling its constructor, so that helpers
+    such as utils.bq.to_scalar accept it.  The class attributes shadow the
+    read-only properties of QueryJob.
+    """
+    job_id = None
+    query = None
+    errors = None
+    error_result = None
+    state = None
+    num_dml_affected_rows = None
+
+    def __init__(self, job_id, query=None, rows=None):
+        """
+        :param job_id: identifies the job
+        :param query: the query the job ran
+        :param rows: FakeRowIterator of the result, by default without rows
+        """
+        self.job_id = job_id
+        self.query = query
+        self.errors = None
+        self.error_result = None
+        self.state = 'DONE'
+        self.num_dml_affected_rows = 0
+        # backs the properties of QueryJob which are not shadowed
+        self._properties = {}
+        self._rows = rows or FakeRowIterator()
+
+    def result(self, *args, **kwargs):
+        return self._rows
+
+    def to_dataframe(self, *args, **kwargs):
+        return self._rows.to_dataframe()
+
+    def done(self, *args, **kwargs):
+        return True
+
+
+class FakeClient(object):
+    """
+    Stands in for a bigquery.Client so rules can be set up offline
+
+    Queries and jobs finish at once without rows, except queries counting the
+    tables of a dataset, which count `table_ids`, and queries of
+    INFORMATION_SCHEMA.COLUMNS, which list the columns of `table_ids`.  Every table named in
+    `table_ids` exists with its schema from the schema files if there is one,
+    and other calls return a finished job.  Calls are counted by method name.
+    """
+
+    def __init__(self, project=PROJECT_ID, table_ids=()):
+        """
+        :param project: project the client is for
+        :param table_ids: names of tables list_tables reports in every dataset
+        """
+        self.project = project
+        self.table_ids = sorted(set(table_ids))
+        self.calls = defaultdict(int)
+
+    def _job(self, query=None, rows=None):
+        job_id = f'fake_job_{sum(self.calls.values())}'
+        return FakeQueryJob(job_id, query, rows)
+
+    def query(self, query, *args, **kwargs):
+        self.calls['query'] += 1
+        if TABLES_META_TABLE in query and 'COUNT' in query.upper():
+            return self._job(
+                query,
+                FakeRowIterator([bigquery.SchemaField('table_count', 'INT64')],
+                                [(len(self.table_ids),)]))
+        if 'INFORMATION_SCHEMA.COLUMNS' in query:
+            return self._job(query, self._columns())
+        return self._job(query)
+
+    def _columns(self):
+        """
+        Rows of INFORMATION_SCHEMA.COLUMNS for the tables in `table_ids`
+
+        Tables without a schema file have no rows.
+        """
+        rows = []
+        for table_id in self.table_ids:
+            try:
+                fields = bq.get_table_schema(table_id)
+            except RuntimeError:
+                continue
+            rows.extend((table_id, field.name, position, field.field_type)
+                        for position, field in enumerate(fields, start=1))
+        return FakeRowIterator([
+            bigquery.SchemaField('table_name', 'STRING'),
+            bigquery.SchemaField('column_name', 'STRING'),
+            bigquery.SchemaField('ordinal_position', 'INT64'),
+            bigquery.SchemaField('data_type', 'STRING')
+        ], rows)
+
+    def _table(self, table):
+        if isinstance(table, str):
+            if table.count('.') == 1:
+                table = f'{self.project}.{table}'
+            table = bigquery.TableReference.from_string(table)
+        if isinstance(table, bigquery.TableReference):
+            table = bigquery.Table(table)
+        if not table.schema:
+            try:
+                table.schema = bq.get_table_schema(table.table_id)
+            except RuntimeError:
+                pass
+        return table
+
+    def get_table(self, table, *args, **kwargs):
+        self.calls['get_table'] += 1
+        return self._table(table)
+
+    def create_table(self, table, *args, **kwargs):
+        self.calls['create_table'] += 1
+        return self._table(table)
+
+    def list_tables(self, dataset, *args, **kwargs):
+        self.calls['list_tables'] += 1
+        dataset_id = getattr(dataset, 'dataset_id', str(dataset).split('.')[-1])
+        return [
+            bigquery.table.TableListItem({
+                'tableReference': {
+                    'projectId': self.project,
+                    'datasetId': dataset_id,
+                    'tableId': table_id
+                }
+            }) for table_id in self.table_ids
+        ]
+
+    def get_dataset(self, dataset, *args, **kwargs):
+        self.calls['get_dataset'] += 1
+        dataset_id = getattr(dataset, 'dataset_id', str(dataset).split('.')[-1])
+        return bigquery.Dataset(f'{self.project}.{dataset_id}')
+
+    def list_jobs(self, *args, **kwargs):
+        self.calls['list_jobs'] += 1
+        return []
+
+    def list_datasets(self, *args, **kwargs):
+        self.calls['list_datasets'] += 1
+        return []
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            return self._job()
+
+        return call
+
+
+class FakeService(object):
+    """
+    Stands in for the BigQuery discovery service used by bq_utils
+
+    Any chain of resource and method calls ends in a request whose response
+    describes a finished job without errors or rows.
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+
+    def execute(self, *args, **kwargs):
+        self.calls['execute'] += 1
+        job_id = f'fake_job_{self.calls["execute"]}'
+        return {
+            'jobReference': {
+                'projectId': PROJECT_ID,
+                'jobId': job_id
+            },
+            'jobComplete': True,
+            'status': {
+                'state': 'DONE'
+            },
+            'schema': {
+                'fields': []
+            },
+            'rows': [],
+            'totalRows': '0',
+            'tables': [],
+            'datasets': []
+        }
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self
+
+
+def _refuse_connection(*args, **kwargs):
+    raise NetworkAccessError('The query generation benchmark must not access '
+                             'the network')
+
+
+def no_participants(api_project_id, columns):
+    """
+    Stands in for the RDR participant summary API, which finds no participants
+
+    :return: empty dataframe with the requested columns
+    """
+    return pd.DataFrame(columns=columns)
+
+
+def stage_kwargs(rules):
+    """
+    Fake values for the custom parameters the rules of a stage require
+
+    :param rules: cleaning rules of a stage
+    :return: dict mapping each parameter name to a fake value
+    """
+    engine_params = set(
+        ce_consts.CLEAN_ENGINE_REQUIRED_PARAMS) | {'table_namer'}
+    return {
+        name: f'fake_{name}'
+        for name in clean_cdr.get_required_params(rules)
+        if name not in engine_params
+    }
+
+
+def generate_queries(clazz, stage, kwargs, client):
+    """
+    Instantiate and set up a rule and render its query specs
+
+    :param clazz: cleaning rule class or function
+    :param stage: name of the data stage, used as table namer
+    :param kwargs: custom parameters of the stage
+    :param client: fake client
+    :return: list of query dicts
+    """
+    query_function, setup_function, _ = clean_cdr_engine.infer_rule(
+        clazz, PROJECT_ID, DATASET_ID, SANDBOX_DATASET_ID, stage, **kwargs)
+    setup_function(client)
+    return query_function()
+
+
+def measure_rule(clazz, stage, kwargs, client, repeat):
+    """
+    Measure generating a rule's queries
+
+    Time is the best of `repeat` runs without tracing, peak memory is measured
+    with tracemalloc in a separate run.
+
+    :return: dict of the measurements, or of the error if the rule failed
+    """
+    try:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            queries = generate_queries(clazz, stage, kwargs, client)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        tracemalloc.start()
+        try:
+            generate_queries(clazz, stage, kwargs, client)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    # pylint: disable=broad-except
+    except Exception as exc:
+        return {ERROR: f'{type(exc).__name__}: {exc}'}
+    return {
+        SECONDS:
+            best,
+        PEAK_BYTES:
+            peak_bytes,
+        SQL_BYTES:
+            sum(len(query.get(cdr_consts.QUERY) or '') for query in queries),
+        QUERIES:
+            len(queries)
+    }
+
+
+def run_benchmark(stages=None, repeat=3):
+    """
+    Measure query generation of every rule in each data stage
+
+    :param stages: names of the data stages to run, by default all
+    :param repeat: number of timed runs of each rule
+    :return: dict mapping each stage to a dict mapping each rule name to its
+        measurements and position
+    """
+    stages = stages or list(clean_cdr.DATA_STAGE_RULES_MAPPING)
+    results = {}
+    with ExitStack() as stack:
+        stack.enter_context(warnings.catch_warnings())
+        warnings.simplefilter('ignore')
+        stack.enter_context(
+            mock.patch.object(socket.socket, 'connect', _refuse_connection))
+        stack.enter_context(
+            mock.patch.dict(
+                os.environ, {
+                    'GOOGLE_CLOUD_PROJECT': PROJECT_ID,
+                    'BIGQUERY_DATASET_ID': DATASET_ID
+                }))
+        stack.enter_context(
+            mock.patch.object(bq_utils, 'create_service', FakeService))
+        # the fake jobs are done at once, there is no need to wait on them
+        stack.enter_context(mock.patch.object(bq_utils, 'sleeper'))
+        get_client = stack.enter_context(mock.patch.object(bq, 'get_client'))
+        stack.enter_context(mock.patch.object(psr, 'get_client', get_client))
+        stack.enter_context(
+            mock.patch.object(psr, 'get_deactivated_participants',
+                              no_participants))
+        for stage in stages:
+            rules = clean_cdr.DATA_STAGE_RULES_MAPPING[stage]
+            kwargs = stage_kwargs(rules)
+            client = FakeClient(table_ids=resources.CDM_TABLES +
+                                resources.MAPPING_TABLES +
+                                list(kwargs.values()))
+            get_client.return_value = client
+            results[stage] = {}
+            for rule_index, rule in enumerate(rules):
+                rule_name = rule[0].__name__
+                occurrence = 2
+                while rule_name in results[stage]:
+                    # a rule listed more than once in a stage
+                    rule_name = f'{rule[0].__name__}_{occurrence}'
+                    occurrence += 1
+                measurements = measure_rule(rule[0], stage, kwargs, client,
+                                            repeat)
+                measurements[POSITION] = rule_index + 1
+                results[stage][rule_name] = measurements
+    return results
+
+
+def stage_totals(stage_results):
+    """
+    Sum the measurements of a stage's rules
+
+    :param stage_results: dict mapping each rule to its measurements
+    :return: dict of total seconds, SQL bytes and queries and the largest peak
+    """
+    measured = [m for m in stage_results.values() if ERROR not in m]
+    return {
+        SECONDS: sum(m[SECONDS] for m in measured),
+        PEAK_BYTES: max([m[PEAK_BYTES] for m in measured], default=0),
+        SQL_BYTES: sum(m[SQL_BYTES] for m in measured),
+        QUERIES: sum(m[QUERIES] for m in measured),
+        ERROR: len(stage_results) - len(measured)
+    }
+
+
+def compare_rule(current, baseline):
+    """
+    Compare a rule's measurements with its baseline
+
+    :return: list of descriptions of regressions and changes, empty if none
+    """
+    if baseline is None:
+        return ['new rule']
+    if ERROR in current or ERROR in baseline:
+        if current.get(ERROR) != baseline.get(ERROR):
+            return [
+                f'error changed: {baseline.get(ERROR)} -> '
+                f'{current.get(ERROR)}'
+            ]
+        return []
+    findings = []
+    # only baselines written with timings on this machine have them
+    slower = current[SECONDS] - baseline.get(SECONDS, current[SECONDS])
+    if (slower > MIN_SECONDS and
+            current[SECONDS] > baseline[SECONDS] * (1 + TIME_TOLERANCE)):
+        findings.append(f'slower: {baseline[SECONDS] * 1000:.1f}ms -> '
+                        f'{current[SECONDS] * 1000:.1f}ms')
+    grew = current[PEAK_BYTES] - baseline.get(PEAK_BYTES, current[PEAK_BYTES])
+    if (grew > MIN_BYTES and current[PEAK_BYTES] > baseline[PEAK_BYTES] *
+        (1 + MEMORY_TOLERANCE)):
+        findings.append(
+            f'peak memory: {baseline[PEAK_BYTES] / 2**20:.1f}MiB -> '
+            f'{current[PEAK_BYTES] / 2**20:.1f}MiB')
+    if current[SQL_BYTES] != baseline[SQL_BYTES]:
+        findings.append(f'sql size: {baseline[SQL_BYTES]} -> '
+                        f'{current[SQL_BYTES]} bytes')
+    return findings
+
+
+def compare(results, baseline):
+    """
+    Compare the results of every rule with the baseline
+
+    :param results: as returned by run_benchmark
+    :param baseline: results of an earlier run
+    :return: dict mapping (stage, rule) to the list of findings of rules with any
+    """
+    findings = {}
+    for stage, stage_results in results.items():
+        for rule_name, current in stage_results.items():
+            rule_findings = compare_rule(current,
+                                         baseline.get(stage, {}).get(rule_name))
+            if rule_findings:
+                findings[(stage, rule_name)] = rule_findings
+    return findings
+
+
+def log_results(results):
+    """
+    Log the measurements of each rule and stage
+    """
+    for stage, stage_results in results.items():
+        LOGGER.info(f'\n{stage}')
+        for rule_name, measurements in sorted(
+                stage_results.items(), key=lambda item: item[1][POSITION]):
+            rule_label = f'{measurements[POSITION]:>3} {rule_name}'
+            if ERROR in measurements:
+                LOGGER.info(f'  {rule_label:<60} {measurements[ERROR]}')
+                continue
+            LOGGER.info(f'  {rule_label:<60}'
+                        f'{measurements[SECONDS] * 1000:>9.1f}ms'
+                        f'{measurements[PEAK_BYTES] / 2**20:>8.2f}MiB'
+                        f'{measurements[SQL_BYTES]:>10} sql bytes'
+                        f'{measurements[QUERIES]:>5} queries')
+        totals = stage_totals(stage_results)
+        LOGGER.info(f'  {"total":<60}{totals[SECONDS] * 1000:>9.1f}ms'
+                    f'{totals[PEAK_BYTES] / 2**20:>8.2f}MiB'
+                    f'{totals[SQL_BYTES]:>10} sql bytes'
+                    f'{totals[QUERIES]:>5} queries'
+                    f'{totals[ERROR]:>4} failed')
+
+
+def read_baseline(baseline_path=BASELINE_PATH):
+    """
+    Read stored results, or an empty baseline if there are none
+    """
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def write_baseline(results, baseline_path=BASELINE_PATH, timings=False):
+    """
+    Store results as the baseline for later runs
+
+    :param results: as returned by run_benchmark
+    :param baseline_path: file to write
+    :param timings: if True, also store times and peak memory, which are
+        only comparable on the machine writing the baseline
+    """
+    if not timings:
+        results = {
+            stage: {
+                rule_name: {
+                    key: value
+                    for key, value in measurements.items()
+                    if key not in MACHINE_DEPENDENT
+                } for rule_name, measurements in stage_results.items()
+            } for stage, stage_results in results.items()
+        }
+    os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+    with open(baseline_path, 'w') as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+    LOGGER.info(f'Wrote baseline to {baseline_path}')
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Benchmark query generation of every cleaning rule offline')
+    parser.add_argument('-a',
+                        '--data_stages',
+                        nargs='+',
+                        choices=list(clean_cdr.DATA_STAGE_RULES_MAPPING),
+                        help='Data stages to benchmark, by default all')
+    parser.add_argument('-r',
+                        '--repeat',
+                        type=int,
+                        default=3,
+                        help='Number of timed runs of each rule')
+    parser.add_argument('--baseline',
+                        default=BASELINE_PATH,
+                        help='Baseline to compare with')
+    parser.add_argument('--write_baseline',
+                        action='store_true',
+                        help='Store the results as the new baseline')
+    parser.add_argument(
+        '--with_timings',
+        action='store_true',
+        help=('Also store times and peak memory in the baseline, '
+              'only comparable on this machine'))
+    return parser
+
+
+def main(args=None):
+    """
+    Run the benchmark and compare it with the baseline
+
+    :return: exit status, 1 if any rule regressed or changed
+    """
+    args = get_arg_parser().parse_args(args)
+    results = run_benchmark(args.data_stages, args.repeat)
+    log_results(results)
+    if args.write_baseline:
+        baseline = read_baseline(args.baseline)
+        baseline.update(results)
+        write_baseline(baseline, args.baseline, args.with_timings)
+        return 0
+    findings = compare(results, read_baseline(args.baseline))
+    if not findings:
+        LOGGER.info('\nNo changes from the baseline')
+        return 0
+    LOGGER.info(f'\n{len(findings)} rule(s) differ from the baseline')
+    for (stage, rule_name), rule_findings in sorted(findings.items()):
+        LOGGER.info(f'  {stage} {rule_name}: {"; ".join(rule_findings)}')
+    return 1
+
+
+if __name__ == '__main__':
+    # keep the rules' own logging out of the report
+    logging.getLogger().setLevel(logging.CRITICAL)
+    sys.exit(main())
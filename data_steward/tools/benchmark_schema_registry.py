@@ -0,0 +1,110 @@
+"""
+Micro-benchmark comparing schema lookups through the schema registry with
+walking and parsing the schema files on every lookup
+
+Usage: python tools/benchmark_schema_registry.py [-n 20] [--write_index]
+"""
+# Python imports
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+
+# Project imports
+import resources
+
+LOGGER = logging.getLogger(__name__)
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.INFO)
+LOGGER.addHandler(handler)
+LOGGER.setLevel(logging.INFO)
+
+
+def walk_fields_for(table):
+    """
+    Look up a schema the way fields_for did before the schema registry
+
+    :param table: the table to get a schema for
+    :return: list of json field definitions
+    """
+    json_path = None
+    for dirpath, _, files in os.walk(resources.fields_path):
+        for filename in files:
+            if filename[:-5] == table:
+                json_path = os.path.join(dirpath, filename)
+    with open(json_path, 'r') as fp:
+        return json.load(fp)
+
+
+def lookup_all(lookup, tables):
+    """
+    Look up the schema of every table
+
+    :param lookup: function taking a table name
+    :param tables: names of tables to look up
+    """
+    for table in tables:
+        lookup(table)
+
+
+def run_benchmark(number):
+    """
+    Time looking up every CDM, mapping and rdr schema with each approach
+
+    :param number: number of times each approach looks up every schema
+    :return: dict mapping each approach to the seconds per lookup
+    """
+    tables = resources.CDM_TABLES + resources.MAPPING_TABLES + list(
+        resources.rdr_specific_schemas())
+    approaches = {
+        'os.walk + json.load':
+            walk_fields_for,
+        'registry fields_for':
+            resources.fields_for,
+        'registry schema_for':
+            resources.schema_for,
+        'registry bq_fields':
+            lambda table: resources.schema_for(table).bq_fields,
+    }
+    build_seconds = timeit.timeit(resources.SchemaRegistry.from_files, number=1)
+    LOGGER.info(f'Registry built from files in {build_seconds * 1000:.1f}ms')
+    if os.path.exists(resources.SCHEMA_INDEX_PATH):
+        index_seconds = timeit.timeit(resources.SchemaRegistry.from_index,
+                                      number=1)
+        LOGGER.info(
+            f'Registry built from index in {index_seconds * 1000:.1f}ms')
+
+    results = {}
+    for name, lookup in approaches.items():
+        seconds = timeit.timeit(lambda: lookup_all(lookup, tables),
+                                number=number)
+        results[name] = seconds / (number * len(tables))
+    baseline = results['os.walk + json.load']
+    for name, seconds in results.items():
+        LOGGER.info(f'{name:<22}{seconds * 1e6:>12.1f}us per lookup'
+                    f'{baseline / seconds:>10.1f}x')
+    return results
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Compare schema registry lookups with walking schema files')
+    parser.add_argument('-n',
+                        '--number',
+                        type=int,
+                        default=20,
+                        help='Number of times to look up every schema')
+    parser.add_argument('--write_index',
+                        action='store_true',
+                        help='Write the precompiled schema index first')
+    return parser
+
+
+if __name__ == '__main__':
+    ARGS = get_arg_parser().parse_args()
+    if ARGS.write_index:
+        resources.SchemaRegistry.from_files().write_index()
+    run_benchmark(ARGS.number)
@@ -44,7 +44,10 @@ TODO
  * Load `combined.<hpo>_observation` with records derived from values in `ehr.<hpo>_person`
  * Communicate to data steward EHR records not matched with RDR
 """
+import argparse
 import logging
+import time
+from functools import partial
 
 import google.cloud.bigquery as bq
 
@@ -52,6 +55,11 @@ import bq_utils
 import common
 import resources
 from constants.tools import combine_ehr_rdr as combine_consts
+from utils.job_graph import MAX_CONCURRENT_STEPS, log_timings, run_job_graph
+
+EHR_CONSENT_STEP = 'ehr_consent'
+FACT_RELATIONSHIP_STEP = 'load_fact_relationship'
+MAPPED_PERSON_STEP = 'load_mapped_person'
 
 
 def query(q, dst_table_id, write_disposition='WRITE_APPEND'):
@@ -361,34 +369,118 @@ def load_mapped_person():
     query(q, 'person', write_disposition='WRITE_TRUNCATE')
 
 
-def main():
+def mapped_dependencies(table):
+    """
+    Get the domain tables whose mapping tables are joined when loading a table
+
+    :param table: name of the table to load
+    :return: set of domain table names
+    """
+    field_names = {field['name'] for field in resources.fields_for(table)}
+    tables = {
+        key[:-len('_id')]
+        for key in combine_consts.FOREIGN_KEYS_FIELDS
+        if key in field_names
+    }
+    return tables & set(combine_consts.DOMAIN_TABLES)
+
+
+def combine_steps(client):
+    """
+    Get the steps needed to combine EHR and RDR along with their dependencies
+
+    Records are only mapped or copied from EHR after ehr consent is loaded and
+    tables are only loaded after the mapping tables they join are loaded.
+
+    :param client: Bigquery client
+    :return: dict mapping each step name to a tuple of a callable and the set
+        of step names it depends on
+    """
+    steps = {EHR_CONSENT_STEP: (ehr_consent, set())}
+    for table in combine_consts.RDR_TABLES_TO_COPY:
+        steps[f'copy_rdr_{table}'] = (partial(copy_rdr_table, table), set())
+    for table in combine_consts.EHR_TABLES_TO_COPY:
+        steps[f'copy_ehr_{table}'] = (partial(copy_ehr_table,
+                                              table), {EHR_CONSENT_STEP})
+    for domain_table in combine_consts.DOMAIN_TABLES:
+        steps[f'mapping_{domain_table}'] = (partial(mapping, client,
+                                                    domain_table),
+                                            {EHR_CONSENT_STEP})
+    for domain_table in combine_consts.DOMAIN_TABLES:
+        dependencies = {domain_table} | mapped_dependencies(domain_table)
+        steps[f'load_{domain_table}'] = (partial(
+            load, domain_table), {f'mapping_{table}' for table in dependencies})
+    steps[FACT_RELATIONSHIP_STEP] = (load_fact_relationship, {
+        f'mapping_{table}'
+        for table in [common.MEASUREMENT, common.OBSERVATION]
+        if table in combine_consts.DOMAIN_TABLES
+    })
+    person_dependencies = {
+        f'mapping_{table}'
+        for table in mapped_dependencies(combine_consts.PERSON_TABLE)
+    }
+    if combine_consts.PERSON_TABLE in combine_consts.RDR_TABLES_TO_COPY:
+        person_dependencies.add(f'copy_rdr_{combine_consts.PERSON_TABLE}')
+    steps[MAPPED_PERSON_STEP] = (load_mapped_person, person_dependencies)
+    return steps
+
+
+def run_sequential(steps):
+    """
+    Run steps one at a time in the order given
+
+    :param steps: dict mapping each step name to a tuple of a callable and
+        the set of step names it depends on
+    :return: dict mapping each step name to the seconds it took to run
+    """
+    timings = {}
+    for name, (func, _) in steps.items():
+        logging.info(f'Running {name}...')
+        start = time.monotonic()
+        func()
+        timings[name] = time.monotonic() - start
+    return timings
+
+
+def main(concurrent=False, max_workers=MAX_CONCURRENT_STEPS):
+    """
+    Combine the EHR and RDR datasets
+
+    :param concurrent: if True run independent steps concurrently, otherwise
+        run steps one at a time
+    :param max_workers: maximum number of steps running at a time when
+        running concurrently
+    """
     client = bq.Client()
     logging.info('EHR + RDR combine started')
     logging.info('Verifying all CDM tables in EHR and RDR datasets...')
     assert_ehr_and_rdr_tables()
     logging.info('Creating destination CDM tables...')
     create_cdm_tables()
-    ehr_consent()
-    for table in combine_consts.RDR_TABLES_TO_COPY:
-        logging.info(f'Copying {table} table from RDR...')
-        copy_rdr_table(table)
-    logging.info(f'Translating {combine_consts.PERSON_TABLE} table from EHR...')
-    for table in combine_consts.EHR_TABLES_TO_COPY:
-        logging.info(f'Copying {table} table from EHR...')
-        copy_ehr_table(table)
-    logging.info(f'Loading {combine_consts.EHR_CONSENT_TABLE_ID}...')
-    for domain_table in combine_consts.DOMAIN_TABLES:
-        logging.info(f'Mapping {domain_table}...')
-        mapping(client, domain_table)
-    for domain_table in combine_consts.DOMAIN_TABLES:
-        logging.info(f'Loading {domain_table}...')
-        load(domain_table)
-    logging.info('Loading fact_relationship...')
-    load_fact_relationship()
-    logging.info('Loading foreign key Mapped Person table...')
-    load_mapped_person()
+    steps = combine_steps(client)
+    if concurrent:
+        timings = run_job_graph(steps, max_workers)
+    else:
+        timings = run_sequential(steps)
     logging.info('EHR + RDR combine completed')
+    log_timings(timings)
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Combine the EHR and RDR datasets')
+    parser.add_argument('-c',
+                        '--concurrent',
+                        action='store_true',
+                        help='Run independent steps concurrently')
+    parser.add_argument('-j',
+                        '--max_workers',
+                        type=int,
+                        default=MAX_CONCURRENT_STEPS,
+                        help='Maximum number of steps running at a time')
+    return parser
 
 
 if __name__ == '__main__':
-    main()
+    ARGS = get_arg_parser().parse_args()
+    main(ARGS.concurrent, ARGS.max_workers)
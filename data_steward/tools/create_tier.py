@@ -180,8 +180,15 @@ def create_datasets(client, name, input_dataset, tier, release_tag):
     return datasets
 
 
-def create_tier(credentials_filepath, project_id, tier, input_dataset,
-                release_tag, deid_stage, run_as, **kwargs):
+def create_tier(credentials_filepath,
+                project_id,
+                tier,
+                input_dataset,
+                release_tag,
+                deid_stage,
+                run_as,
+                clone=True,
+                **kwargs):
     """
     This function is the main entry point for the deid process.
     It passes the required parameters to the implementing functions.
@@ -193,6 +200,8 @@ def create_tier(credentials_filepath, project_id, tier, input_dataset,
     :param release_tag: release tag for dataset in the format of YYYYq#r#
     :param deid_stage: deid stage (deid, base or clean)
     :param run_as: email address of the service account to impersonate
+    :param clone: if True, stage the input tables and snapshot conforming
+        staging tables as clones instead of copying them by query
     :return: name of created controlled or registered dataset
     """
     # validation of params
@@ -213,7 +222,11 @@ def create_tier(credentials_filepath, project_id, tier, input_dataset,
     # Create intermediary datasets and copy tables from input dataset to newly created dataset
     datasets = create_datasets(client, final_dataset_name, input_dataset, tier,
                                release_tag)
-    bq.copy_datasets(client, input_dataset, datasets[consts.STAGING])
+    # clones are metadata-only, cleaning rules only store the rows they change
+    bq.copy_datasets(client,
+                     input_dataset,
+                     datasets[consts.STAGING],
+                     clone=clone)
 
     # Run cleaning rules
     cleaning_args = [
@@ -243,8 +256,11 @@ def create_tier(credentials_filepath, project_id, tier, input_dataset,
     clean_cdr.main(args=controlled_tier_cleaning_args)
 
     # Snapshot the staging dataset to final dataset
-    create_schemaed_snapshot_dataset(project_id, datasets[consts.STAGING],
-                                     final_dataset_name, False)
+    create_schemaed_snapshot_dataset(project_id,
+                                     datasets[consts.STAGING],
+                                     final_dataset_name,
+                                     False,
+                                     clone_conforming=clone)
 
     return datasets
 
@@ -305,6 +321,11 @@ def parse_deid_args(args=None):
                         action='store_true',
                         required=False,
                         help='Log to the console as well as to a file.')
+    parser.add_argument('--no_clone',
+                        dest='clone',
+                        action='store_false',
+                        help='Copy tables by query instead of cloning them '
+                        'into the staging and final datasets')
 
     common_args, unknown_args = parser.parse_known_args(args)
     custom_args = clean_cdr._get_kwargs(unknown_args)
@@ -326,7 +347,8 @@ def main(raw_args=None):
     # Runs create_tier in order to generate the {args.tier}_tier_{args.data_stage} datasets and apply cleaning rules
     datasets = create_tier(args.credentials_filepath, args.project_id,
                            args.tier, args.idataset, args.release_tag,
-                           args.deid_stage, args.target_principal, **kwargs)
+                           args.deid_stage, args.target_principal, args.clone,
+                           **kwargs)
     return datasets
 
 
@@ -4,12 +4,18 @@
 """
 import argparse
 import datetime
+import gzip
 import hashlib
 import json
 import logging
+import shutil
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict
 
+from google.api_core.exceptions import GoogleAPIError
 from google.cloud import storage
 from google.cloud.exceptions import NotFound
 from google.cloud.bigquery import Client, Dataset, SchemaField, LoadJob, LoadJobConfig
@@ -23,6 +29,11 @@ LOGGER = logging.getLogger(__name__)
 DATE_TIME_TYPES = ['date', 'timestamp', 'datetime']
 MAX_BAD_RECORDS = 0
 FIELD_DELIMITER = '\t'
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+# favor speed since the files are compressed only for transfer
+GZIP_COMPRESS_LEVEL = 1
+GZIP_SUFFIX = '.gz'
+MAX_UPLOAD_WORKERS = 4
 SELECT_TPL = JINJA_ENV.from_string("""
     SELECT 
     {% for field in fields %}
@@ -47,7 +58,8 @@ def hash_dir(vocab_folder_path: Path) -> str:
     hash_obj = hashlib.sha256()
     for vocab_file in vocab_folder_path.glob('*.csv'):
         with vocab_file.open('rb') as fp:
-            hash_obj.update(fp.read())
+            for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b''):
+                hash_obj.update(chunk)
     return hash_obj.hexdigest()
 
 
@@ -62,8 +74,9 @@ def update_aou_vocabs(vocab_folder_path: Path):
     aou_custom_path = Path(AOU_VOCAB_PATH) / concept_file
     with aou_custom_path.open('r') as custom_concept, concept_path.open(
             'a') as vocab_concept:
-        for line in custom_concept.readlines()[1:]:
-            vocab_concept.write(line)
+        # skip the header and stream the remaining lines
+        custom_concept.readline()
+        shutil.copyfileobj(custom_concept, vocab_concept)
         LOGGER.info(f'Successfully updated file {str(concept_path)}')
 
     vocabulary_file = _table_name_to_filename(VOCABULARY)
@@ -77,24 +90,58 @@ def update_aou_vocabs(vocab_folder_path: Path):
     return
 
 
-def upload_stage(bucket_name: str, vocab_folder_path: Path,
-                 gcs_client: storage.Client):
+def _gzip_file(src_path: Path, dst_path: Path):
+    """
+    Compress a file into a gzip file without reading it into memory
+
+    :param src_path: path of the file to compress
+    :param dst_path: path of the gzip file to create
+    """
+    with src_path.open('rb') as src, gzip.open(
+            dst_path, 'wb', compresslevel=GZIP_COMPRESS_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+
+
+def upload_stage(bucket_name: str,
+                 vocab_folder_path: Path,
+                 gcs_client: storage.Client,
+                 compress: bool = True,
+                 workers: int = MAX_UPLOAD_WORKERS):
     """
     Upload vocabulary tables to cloud storage
 
+    Files are uploaded concurrently. If compressed, they are uploaded as
+    gzip files which BigQuery loads directly.
+
     :param bucket_name: the location in GCS containing the vocabulary files
     :param vocab_folder_path: points to the directory containing files downloaded from athena with CPT4 applied
     :param gcs_client: google cloud storage client
+    :param compress: if True, gzip files before uploading them
+    :param workers: maximum number of files compressed and uploaded at a time
     """
     bucket = gcs_client.get_bucket(bucket_name)
     LOGGER.info(f'GCS bucket {bucket_name} found successfully')
-    for table in VOCABULARY_TABLES:
-        file_name = _table_name_to_filename(table)
-        file_path = vocab_folder_path / file_name
-        blob = bucket.blob(file_name)
-        blob.upload_from_filename(str(file_path))
-        LOGGER.info(f'Vocabulary file {str(file_path)} uploaded '
-                    f'successfully to GCS bucket {bucket_name}')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        def upload_table(table):
+            file_name = _table_name_to_filename(table)
+            file_path = vocab_folder_path / file_name
+            if compress:
+                file_name = f'{file_name}{GZIP_SUFFIX}'
+                upload_path = Path(tmp_dir) / file_name
+                _gzip_file(file_path, upload_path)
+            else:
+                upload_path = file_path
+            blob = bucket.blob(file_name)
+            blob.upload_from_filename(str(upload_path))
+            LOGGER.info(f'Vocabulary file {str(file_path)} uploaded '
+                        f'successfully to GCS bucket {bucket_name} '
+                        f'as {file_name}')
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # consume the results to raise any upload errors
+            list(executor.map(upload_table, VOCABULARY_TABLES))
     return
 
 
@@ -135,6 +182,8 @@ def safe_schema_for(table: str) -> List[SchemaField]:
 
 
 def _filename_to_table_name(filename: str) -> str:
+    if filename.endswith(GZIP_SUFFIX):
+        filename = filename[:-len(GZIP_SUFFIX)]
     return filename.replace('.csv', '').lower()
 
 
@@ -142,6 +191,64 @@ def _table_name_to_filename(table_name: str) -> str:
     return f'{table_name.upper()}.csv'
 
 
+def wait_for_jobs(table_jobs: Dict[str, object]):
+    """
+    Wait for all jobs to complete, collecting the errors of each table
+
+    :param table_jobs: maps table name => running BigQuery job
+    :raises RuntimeError: if any job failed, after all jobs have completed
+    """
+    errors = dict()
+    for table, job in table_jobs.items():
+        try:
+            job.result()
+        except GoogleAPIError as e:
+            LOGGER.exception(f'table:{table} job_id:{job.job_id} failed')
+            errors[table] = e
+    if errors:
+        raise RuntimeError(f'Jobs failed for tables {sorted(errors)}: '
+                           f'{errors}')
+
+
+def _blob_recency(blob):
+    updated = blob.updated or datetime.datetime.min.replace(
+        tzinfo=datetime.timezone.utc)
+    return updated, blob.name.endswith(GZIP_SUFFIX)
+
+
+def _vocabulary_blobs(blobs) -> Dict[str, storage.Blob]:
+    """
+    Choose the file to load for each vocabulary table
+
+    A reused bucket may hold both a plain and a gzip file for a table, e.g. a
+    stale CONCEPT.csv next to the CONCEPT.csv.gz just uploaded.  The most
+    recently updated file is chosen, preferring the gzip file upload_stage
+    writes by default when the update times are equal or unknown.
+
+    :param blobs: blobs in the bucket
+    :return: dict mapping each vocabulary table found to its blob, in the
+        order of VOCABULARY_TABLES
+    """
+    candidates = defaultdict(list)
+    for blob in blobs:
+        table_name = _filename_to_table_name(blob.name)
+        # ignore any non-vocabulary files
+        if table_name in VOCABULARY_TABLES:
+            candidates[table_name].append(blob)
+
+    table_blobs = dict()
+    for table_name in VOCABULARY_TABLES:
+        if table_name not in candidates:
+            continue
+        blob = max(candidates[table_name], key=_blob_recency)
+        for skipped in candidates[table_name]:
+            if skipped is not blob:
+                LOGGER.warning(f'Skipping {skipped.name}, loading table '
+                               f'{table_name} from {blob.name}')
+        table_blobs[table_name] = blob
+    return table_blobs
+
+
 def load_stage(dst_dataset: Dataset, bq_client: Client, bucket_name: str,
                gcs_client: storage.Client) -> List[LoadJob]:
     """
@@ -152,10 +259,9 @@ def load_stage(dst_dataset: Dataset, bq_client: Client, bucket_name: str,
     :param bucket_name: the location in GCS containing the vocabulary files
     :param gcs_client: a Cloud Storage client object
     :return: list of completed load jobs
+    :raises RuntimeError: if files are missing or any load job fails
     """
-    blobs = list(gcs_client.list_blobs(bucket_name))
-
-    table_blobs = [_filename_to_table_name(blob.name) for blob in blobs]
+    table_blobs = _vocabulary_blobs(gcs_client.list_blobs(bucket_name))
     missing_blobs = [
         table for table in VOCABULARY_TABLES if table not in table_blobs
     ]
@@ -163,12 +269,8 @@ def load_stage(dst_dataset: Dataset, bq_client: Client, bucket_name: str,
         raise RuntimeError(
             f'Bucket {bucket_name} is missing files for tables {missing_blobs}')
 
-    load_jobs = []
-    for blob in blobs:
-        table_name = _filename_to_table_name(blob.name)
-        # ignore any non-vocabulary files
-        if table_name not in VOCABULARY_TABLES:
-            continue
+    load_jobs = dict()
+    for table_name, blob in table_blobs.items():
         destination = dst_dataset.table(table_name)
         safe_schema = safe_schema_for(table_name)
         job_config = LoadJobConfig()
@@ -183,9 +285,10 @@ def load_stage(dst_dataset: Dataset, bq_client: Client, bucket_name: str,
                                                  destination,
                                                  job_config=job_config)
         LOGGER.info(f'table:{destination} job_id:{load_job.job_id}')
-        load_jobs.append(load_job)
-        load_job.result()
-    return load_jobs
+        load_jobs[table_name] = load_job
+    # jobs run concurrently so smaller tables do not wait behind the largest ones
+    wait_for_jobs(load_jobs)
+    return list(load_jobs.values())
 
 
 # TODO Move this to another module (auth, admin?). It can be reused
@@ -225,6 +328,7 @@ def load(project_id, bq_client, src_dataset_id, dst_dataset_id,
     :param dataset_properties: a dict specifying target dataset properties to
       set (i.e. access_entries)
     :return: List of BQ job_ids
+    :raises RuntimeError: if any transform job fails
     """
     dst_dataset = Dataset(f'{bq_client.project}.{dst_dataset_id}')
     dst_dataset.description = f'Vocabulary cleaned and loaded from {src_dataset_id}'
@@ -233,13 +337,13 @@ def load(project_id, bq_client, src_dataset_id, dst_dataset_id,
     dst_dataset = bq_client.create_dataset(dst_dataset, exists_ok=True)
     src_tables = list(bq_client.list_tables(dataset=src_dataset_id))
 
-    job_config = QueryJobConfig()
-    query_jobs = []
+    query_jobs = dict()
     for src_table in src_tables:
         schema = bq.get_table_schema(src_table.table_id)
         destination = f'{project_id}.{dst_dataset_id}.{src_table.table_id}'
         table = bq_client.create_table(Table(destination, schema=schema),
                                        exists_ok=True)
+        job_config = QueryJobConfig()
         job_config.destination = table
         query = SELECT_TPL.render(project_id=project_id,
                                   dataset_id=src_dataset_id,
@@ -247,15 +351,15 @@ def load(project_id, bq_client, src_dataset_id, dst_dataset_id,
                                   fields=schema)
         query_job = bq_client.query(query, job_config=job_config)
         LOGGER.info(f'table:{destination} job_id:{query_job.job_id}')
-        query_jobs.append(query_job)
-        query_job.result()
+        query_jobs[src_table.table_id] = query_job
+    wait_for_jobs(query_jobs)
 
     # to prevent sharing a dataset that fails to load
     # only set dataset access policy at the end
     dst_dataset.access_entries = dataset_properties['access_entries']
     bq_client.update_dataset(dst_dataset, ['access_entries'])
 
-    return query_jobs
+    return list(query_jobs.values())
 
 
 def main(project_id: str, bucket_name: str, vocab_folder_path: str,
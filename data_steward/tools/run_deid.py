@@ -5,6 +5,7 @@ A central script to execute deid for each table needing de-identification.
 """
 
 # Python imports
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 import os
@@ -12,14 +13,16 @@ from argparse import ArgumentParser
 
 # Third party imports
 import google
+from google.oauth2 import service_account
 import app_identity
 
 # Project imports
 import bq_utils
 import deid.aou as aou
 from deid.parser import odataset_name_verification
+from deid.press import load_rules
 from resources import fields_for, fields_path, DEID_PATH
-from utils import bq
+from utils import bq, client_cache, pipeline_logging
 from common import JINJA_ENV
 
 LOGGER = logging.getLogger(__name__)
@@ -41,6 +44,7 @@ DEID_MAP_TABLE = 'primary_pid_rid_mapping'
 PIPELINE_TABLES_DATASET = 'pipeline_tables'
 
 LOGS_PATH = 'LOGS'
+RULES_PATH = os.path.join(DEID_PATH, 'config', 'ids', 'config.json')
 
 COPY_PID_RID_QUERY = JINJA_ENV.from_string("""
 CREATE or REPLACE TABLE {{map_table}} as
@@ -236,6 +240,36 @@ def parse_args(raw_args=None):
                         action='store_true',
                         required=False,
                         help='Log to the console as well as to a file.')
+    parser.add_argument(
+        '--pipelined-jobs',
+        dest='pipelined_jobs',
+        action='store_true',
+        required=False,
+        help=('Dry-run all statements for a table before executing any, and '
+              'execute appending statements concurrently.'))
+    parser.add_argument(
+        '--plan-cache',
+        dest='plan_cache',
+        action='store_true',
+        required=False,
+        help=('Reuse deid statements compiled by previous runs from the same '
+              'rules, table configuration and schema.'))
+    parser.add_argument(
+        '--fuse-segments',
+        dest='fuse_segments',
+        action='store_true',
+        required=False,
+        help=('Write each meta table, such as observation, with a single '
+              'UNION ALL statement instead of one statement per filter.'))
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        action='store',
+        type=int,
+        required=False,
+        default=1,
+        help=('Number of tables to de-identify concurrently.  Defaults to '
+              'de-identifying one table at a time.'))
     parser.add_argument('--version', action='version', version='deid-02')
     parser.add_argument('-m',
                         '--age_limit',
@@ -293,11 +327,100 @@ def load_deid_map_table(deid_map_dataset_name, age_limit):
         )
 
 
+def get_table_parameters(table, args, configured_tables, deid_tables_path):
+    """
+    Get the deid/aou.py command line arguments for a single table.
+
+    :param table:  name of the table to de-identify
+    :param args:  parsed run_deid command line arguments
+    :param configured_tables:  list of tables having a deid table configuration
+    :param deid_tables_path:  path to the deid table configuration files
+
+    :return: a list of command line arguments for deid/aou.py
+    """
+    if table in configured_tables:
+        tablepath = os.path.join(deid_tables_path, table + '.json')
+    else:
+        tablepath = table
+
+    parameter_list = [
+        '--rules', RULES_PATH, '--private_key', args.private_key, '--table',
+        tablepath, '--action', args.action, '--idataset', args.input_dataset,
+        '--log', LOGS_PATH, '--odataset', args.odataset, '--age-limit',
+        args.age_limit
+    ]
+
+    if args.interactive_mode:
+        parameter_list.append('--interactive')
+
+    if args.pipelined_jobs:
+        parameter_list.append('--pipelined-jobs')
+
+    if args.plan_cache:
+        parameter_list.append('--plan-cache')
+
+    if args.fuse_segments:
+        parameter_list.append('--fuse-segments')
+
+    field_names = [field.get('name') for field in fields_for(table)]
+    if 'person_id' in field_names:
+        parameter_list.append('--cluster')
+
+    return parameter_list
+
+
+def deid_table(table, parameter_list, deid_rules, create_lookup_tables=True):
+    """
+    Execute deid on a single table.
+
+    :param table:  name of the table to de-identify
+    :param parameter_list:  deid/aou.py command line arguments for the table
+    :param deid_rules:  rules read once by deid.press.load_rules
+    :param create_lookup_tables:  set to False if the shared lookup tables
+        were already created for this run
+
+    :return: True if deid executed successfully, False otherwise
+    """
+    LOGGER.info(
+        f"Executing deid with:\n\tpython deid/aou.py {' '.join(parameter_list)}"
+    )
+
+    with pipeline_logging.span('deid_table', table=table) as table_span:
+        try:
+            aou.main(parameter_list,
+                     deid_rules=deid_rules,
+                     create_lookup_tables=create_lookup_tables)
+        except google.api_core.exceptions.GoogleAPIError:
+            LOGGER.exception("Encountered deid exception:\n")
+            table_span.set_attribute('passed', False)
+            return False
+
+    LOGGER.info(f"Successfully executed deid on table: {table}")
+    return True
+
+
+def create_shared_lookup_tables(input_dataset, private_key):
+    """
+    Create the lookup tables every table's deid run depends on.
+
+    When tables are de-identified concurrently, the lookup tables are created
+    once up front instead of being replaced by each table's deid run.
+
+    :param input_dataset:  dataset to create the lookup tables in
+    :param private_key:  service account file location
+    """
+    credentials = service_account.Credentials.from_service_account_file(
+        private_key)
+    aou.create_concept_id_lookup_table(input_dataset, credentials)
+    LOGGER.info(f"Created shared deid lookup tables in {input_dataset}")
+
+
 def main(raw_args=None):
     """
     Execute deid as a single script.
 
     Responsible for aggregating the tables deid will execute on and calling deid.
+    If more than one worker is requested, tables are de-identified concurrently.
     """
     args = parse_args(raw_args)
     add_console_logging(args.console_log)
@@ -311,42 +434,33 @@ def main(raw_args=None):
                         age_limit=args.age_limit)
     logging.info(f"Loaded {DEID_MAP_TABLE} table.")
 
-    exceptions = []
-    successes = []
-    for table in tables:
-        tablepath = None
-        if table in configured_tables:
-            tablepath = os.path.join(deid_tables_path, table + '.json')
+    deid_rules = load_rules(RULES_PATH)
+    parameter_lists = [
+        get_table_parameters(table, args, configured_tables, deid_tables_path)
+        for table in tables
+    ]
+
+    pipeline_logging.configure_tracing(datetime.now().strftime(
+        os.path.join(LOGS_PATH, 'run_deid-%Y-%m-%d-trace.jsonl')))
+    with pipeline_logging.span('run_deid',
+                               input_dataset=args.input_dataset,
+                               tables=len(tables),
+                               workers=args.workers):
+        if args.workers > 1:
+            create_shared_lookup_tables(args.input_dataset, args.private_key)
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                results = list(
+                    executor.map(pipeline_logging.bind_span(deid_table), tables,
+                                 parameter_lists, [deid_rules] * len(tables),
+                                 [False] * len(tables)))
         else:
-            tablepath = table
-
-        parameter_list = [
-            '--rules',
-            os.path.join(DEID_PATH, 'config', 'ids', 'config.json'),
-            '--private_key', args.private_key, '--table', tablepath, '--action',
-            args.action, '--idataset', args.input_dataset, '--log', LOGS_PATH,
-            '--odataset', args.odataset, '--age-limit', args.age_limit
-        ]
-
-        if args.interactive_mode:
-            parameter_list.append('--interactive')
-
-        field_names = [field.get('name') for field in fields_for(table)]
-        if 'person_id' in field_names:
-            parameter_list.append('--cluster')
+            results = [
+                deid_table(table, parameter_list, deid_rules)
+                for table, parameter_list in zip(tables, parameter_lists)
+            ]
 
-        LOGGER.info(
-            f"Executing deid with:\n\tpython deid/aou.py {' '.join(parameter_list)}"
-        )
-
-        try:
-            aou.main(parameter_list)
-        except google.api_core.exceptions.GoogleAPIError:
-            LOGGER.exception("Encountered deid exception:\n")
-            exceptions.append(table)
-        else:
-            LOGGER.info(f"Successfully executed deid on table: {table}")
-            successes.append(table)
+    successes = [table for table, passed in zip(tables, results) if passed]
+    exceptions = [table for table, passed in zip(tables, results) if not passed]
 
     copy_suppressed_table_schemas(known_tables, args.odataset)
 
@@ -356,6 +470,7 @@ def main(raw_args=None):
     for exc in exceptions:
         LOGGER.error(f"Deid encountered exceptions when processing table: {exc}"
                      f".  Fix problems and re-run deid for table if needed.")
+    client_cache.log_stats()
 
 
 if __name__ == '__main__':
@@ -1,9 +1,11 @@
 import argparse
 
 import cdm
+import common
 import resources
 from bq_utils import create_dataset, list_all_table_ids, query, wait_on_jobs, BigQueryJobWaitError, \
-    create_standard_table
+    create_standard_table, get_table_info
+from utils import bq
 
 
 def create_empty_dataset(project_id, dataset_id, snapshot_dataset_id):
@@ -21,20 +23,25 @@ def create_empty_dataset(project_id, dataset_id, snapshot_dataset_id):
         overwrite_existing=True)
 
 
-def create_empty_cdm_tables(snapshot_dataset_id):
+def create_empty_cdm_tables(snapshot_dataset_id, exclude=()):
     """
     Copy the table content from the current dataset to the snapshot dataset
     :param snapshot_dataset_id:
+    :param exclude: tables not to create, e.g. those which will be cloned
     :return:
     """
     for table in resources.CDM_TABLES:
+        if table in exclude:
+            continue
         table_id = table
         table_name = table
         create_standard_table(table_name,
                               table_id,
                               drop_existing=True,
                               dataset_id=snapshot_dataset_id)
-    cdm.create_vocabulary_tables(snapshot_dataset_id)
+    for table in common.VOCABULARY_TABLES:
+        if table not in exclude:
+            cdm.create_table(table, snapshot_dataset_id)
 
 
 def get_field_cast_expr(field, data_type):
@@ -74,16 +81,75 @@ def get_copy_table_query(project_id, dataset_id, table_id):
                                    table_id=table_id)
 
 
-def copy_tables_to_new_dataset(project_id, dataset_id, snapshot_dataset_id):
+def is_schema_conforming(project_id, dataset_id, table_id):
+    """
+    Determine whether a table can be copied as is instead of by a cast query
+
+    Tables without a standard schema are copied with SELECT *, so they conform
+
+    :param project_id: identifies the project containing the dataset
+    :param dataset_id: identifies the dataset containing the table
+    :param table_id: identifies the table
+    :return: True if the fields match the standard schema in order, name, type and mode
+    """
+    try:
+        fields = resources.fields_for(table_id)
+    except (OSError, IOError, RuntimeError):
+        return True
+    table_info = get_table_info(table_id, dataset_id, project_id)
+    table_fields = table_info.get('schema', {}).get('fields', [])
+    return bq.schema_signature(table_fields) == bq.schema_signature(fields)
+
+
+def get_conforming_table_ids(project_id, dataset_id, table_ids):
+    """
+    Get the tables which can be cloned because they match their standard schema
+
+    :param project_id: identifies the project containing the dataset
+    :param dataset_id: identifies the dataset containing the tables
+    :param table_ids: identifies the tables to check
+    :return: list of the conforming table ids
+    """
+    return [
+        table_id for table_id in table_ids
+        if is_schema_conforming(project_id, dataset_id, table_id)
+    ]
+
+
+def copy_tables_to_new_dataset(project_id,
+                               dataset_id,
+                               snapshot_dataset_id,
+                               clone_conforming=True,
+                               clone_table_ids=None):
     """
     lists the tables in the dataset and copies each table to a new dataset.
     :param dataset_id:
     :param project_id:
     :param snapshot_dataset_id:
+    :param clone_conforming: if True, tables already matching their standard
+        schema are cloned and only the remaining tables are copied by cast query
+    :param clone_table_ids: the tables to clone if already known, by default
+        the conforming tables are looked up
     :return:
     """
+    table_ids = list_all_table_ids(dataset_id)
+    if not clone_conforming:
+        clone_table_ids = []
+    elif clone_table_ids is None:
+        clone_table_ids = get_conforming_table_ids(project_id, dataset_id,
+                                                   table_ids)
+    client = bq.get_client(project_id) if clone_table_ids else None
+    clone_jobs = []
     copy_table_job_ids = []
-    for table_id in list_all_table_ids(dataset_id):
+    for table_id in table_ids:
+        if table_id in clone_table_ids:
+            # metadata-only copy, only data changed afterwards is stored separately
+            clone_jobs.append(
+                bq.clone_table(client,
+                               f'{project_id}.{dataset_id}.{table_id}',
+                               f'{project_id}.{snapshot_dataset_id}.{table_id}',
+                               replace=True))
+            continue
         q = get_copy_table_query(project_id, dataset_id, table_id)
         results = query(q,
                         use_legacy_sql=False,
@@ -91,6 +157,8 @@ def copy_tables_to_new_dataset(project_id, dataset_id, snapshot_dataset_id):
                         destination_dataset_id=snapshot_dataset_id,
                         batch=True)
         copy_table_job_ids.append(results['jobReference']['jobId'])
+    for clone_job in clone_jobs:
+        clone_job.result()
     incomplete_jobs = wait_on_jobs(copy_table_job_ids)
     if len(incomplete_jobs) > 0:
         raise BigQueryJobWaitError(incomplete_jobs)
@@ -99,20 +167,33 @@ def copy_tables_to_new_dataset(project_id, dataset_id, snapshot_dataset_id):
 def create_schemaed_snapshot_dataset(project_id,
                                      dataset_id,
                                      snapshot_dataset_id,
-                                     overwrite_existing=True):
+                                     overwrite_existing=True,
+                                     clone_conforming=True):
     """
     :param project_id:
     :param dataset_id:
     :param snapshot_dataset_id:
     :param overwrite_existing: Default is True, False if a dataset is already created.
+    :param clone_conforming: Default is True, False to copy every table by cast query.
     :return:
     """
     if overwrite_existing:
         create_empty_dataset(project_id, dataset_id, snapshot_dataset_id)
 
-    create_empty_cdm_tables(snapshot_dataset_id)
+    clone_table_ids = []
+    if clone_conforming:
+        clone_table_ids = get_conforming_table_ids(
+            project_id, dataset_id, list_all_table_ids(dataset_id))
+
+    # a clone replaces any table created beforehand along with its definition,
+    # so only the tables which are copied by query are created from the schemas
+    create_empty_cdm_tables(snapshot_dataset_id, exclude=clone_table_ids)
 
-    copy_tables_to_new_dataset(project_id, dataset_id, snapshot_dataset_id)
+    copy_tables_to_new_dataset(project_id,
+                               dataset_id,
+                               snapshot_dataset_id,
+                               clone_conforming,
+                               clone_table_ids=clone_table_ids)
 
 
 if __name__ == '__main__':
@@ -138,7 +219,14 @@ if __name__ == '__main__':
                         dest='snapshot_dataset_id',
                         help='Name of the new dataset that needs to be created',
                         required=True)
+    parser.add_argument('--no_clone',
+                        action='store_false',
+                        dest='clone_conforming',
+                        help='Copy every table by cast query instead of '
+                        'cloning tables that match their standard schema')
     args = parser.parse_args()
 
-    create_schemaed_snapshot_dataset(args.project_id, args.dataset_id,
-                                     args.snapshot_dataset_id)
+    create_schemaed_snapshot_dataset(args.project_id,
+                                     args.dataset_id,
+                                     args.snapshot_dataset_id,
+                                     clone_conforming=args.clone_conforming)
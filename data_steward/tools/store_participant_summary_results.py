@@ -13,7 +13,8 @@ from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
 
 # Project imports
-from utils.participant_summary_requests import get_org_participant_information, store_participant_data
+from utils.participant_summary_requests import (
+    get_orgs_participant_information, store_participant_data, MAX_FETCH_WORKERS)
 from common import PS_API_VALUES, DRC_OPS
 from utils import bq, pipeline_logging
 from constants import bq_utils as bq_consts
@@ -56,7 +57,8 @@ def main(project_id,
          rdr_project_id,
          org_id=None,
          hpo_id=None,
-         dataset_id=DRC_OPS):
+         dataset_id=DRC_OPS,
+         max_workers=MAX_FETCH_WORKERS):
 
     #Get list of hpos
     LOGGER.info('Getting hpo list...')
@@ -67,13 +69,16 @@ def main(project_id,
 
     LOGGER.info(hpo_list)
 
+    # Get participant summary data for all organizations concurrently
+    org_ids = [hpo['org_id'] for hpo in hpo_list]
+    LOGGER.info(f'Getting participant summary data for {org_ids}...')
+    org_participant_info = get_orgs_participant_information(
+        rdr_project_id, org_ids, max_workers=max_workers)
+
     for hpo in hpo_list:
         org_id = hpo['org_id']
         hpo_id = hpo['hpo_id']
-        # Get participant summary data
-        LOGGER.info(f'Getting participant summary data for {org_id}...')
-        participant_info = get_org_participant_information(
-            rdr_project_id, org_id)
+        participant_info = org_participant_info[org_id]
 
         # Load schema and create ingestion time-partitioned table
 
@@ -115,6 +120,11 @@ if __name__ == '__main__':
     parser.add_argument('--rdr_project_id', '-r', required=True)
     parser.add_argument('--org_id', required=False)
     parser.add_argument('--hpo_id', required=False)
+    parser.add_argument(
+        '--max_workers',
+        type=int,
+        default=MAX_FETCH_WORKERS,
+        help='Maximum number of organizations fetched at a time')
 
     args = parser.parse_args()
 
@@ -127,4 +137,5 @@ if __name__ == '__main__':
     main(args.project_id,
          args.rdr_project_id,
          org_id=args.org_id,
-         hpo_id=args.hpo_id)
+         hpo_id=args.hpo_id,
+         max_workers=args.max_workers)
@@ -0,0 +1,102 @@
+"""
+Summarize the spans of a pipeline run from its trace file
+
+Prints the span paths which took the most time and can write the spans as
+folded stacks, which flame graph tools such as flamegraph.pl and speedscope read.
+
+Usage: python tools/summarize_spans.py logs/20210101-project-trace.jsonl [-n 20] [--folded out.folded]
+"""
+# Python imports
+import argparse
+import logging
+import sys
+from collections import defaultdict
+
+# Project imports
+from utils import pipeline_logging
+
+LOGGER = logging.getLogger(__name__)
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.INFO)
+LOGGER.addHandler(handler)
+LOGGER.setLevel(logging.INFO)
+
+MICROSECONDS = 1000000
+
+
+def summarize(spans):
+    """
+    Aggregate spans by path
+
+    :param spans: span dicts, as returned by pipeline_logging.read_spans
+    :return: dict mapping each span path to a dict with the number of spans,
+        their total and self seconds and the number which raised errors
+    """
+    summary = defaultdict(lambda: {
+        'count': 0,
+        'total_seconds': 0.0,
+        'self_seconds': 0.0,
+        'errors': 0
+    })
+    for span in spans:
+        path_summary = summary[span['path']]
+        path_summary['count'] += 1
+        path_summary['total_seconds'] += span['duration_seconds']
+        path_summary['self_seconds'] += span['self_seconds']
+        if span['status'] != 'ok':
+            path_summary['errors'] += 1
+    return dict(summary)
+
+
+def write_folded(spans, folded_path):
+    """
+    Write spans as folded stacks weighted by self time in microseconds
+
+    :param spans: span dicts, as returned by pipeline_logging.read_spans
+    :param folded_path: path of the file to write
+    """
+    folded = pipeline_logging.fold_spans(spans)
+    with open(folded_path, 'w') as folded_file:
+        for path, seconds in sorted(folded.items()):
+            folded_file.write(f'{path} {int(seconds * MICROSECONDS)}\n')
+
+
+def log_summary(summary, top):
+    """
+    Log the span paths with the most self time
+
+    :param summary: as returned by summarize
+    :param top: number of span paths to log
+    """
+    rows = sorted(summary.items(),
+                  key=lambda item: item[1]['self_seconds'],
+                  reverse=True)[:top]
+    LOGGER.info(f'{"self":>10}{"total":>10}{"count":>7}{"errors":>7}  path')
+    for path, path_summary in rows:
+        LOGGER.info(f'{path_summary["self_seconds"]:>9.3f}s'
+                    f'{path_summary["total_seconds"]:>9.3f}s'
+                    f'{path_summary["count"]:>7}{path_summary["errors"]:>7}'
+                    f'  {path}')
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Summarize the spans written to a trace file')
+    parser.add_argument('trace_path', help='Path to the trace file')
+    parser.add_argument('-n',
+                        '--top',
+                        type=int,
+                        default=20,
+                        help='Number of span paths to list')
+    parser.add_argument(
+        '--folded', help='Write folded stacks for flame graphs to this file')
+    return parser
+
+
+if __name__ == '__main__':
+    ARGS = get_arg_parser().parse_args()
+    SPANS = pipeline_logging.read_spans(ARGS.trace_path)
+    log_summary(summarize(SPANS), ARGS.top)
+    if ARGS.folded:
+        write_folded(SPANS, ARGS.folded)
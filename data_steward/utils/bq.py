@@ -2,7 +2,9 @@
 A utility to standardize use of the BigQuery python client library.
 """
 # Python Imports
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 import logging
 import os
 import typing
@@ -12,17 +14,21 @@ import warnings
 from google.api_core.exceptions import GoogleAPIError, BadRequest
 from google.cloud import bigquery
 from google.auth import default
+from requests.adapters import HTTPAdapter
 
 # Project Imports
-from utils import auth
+from utils import auth, client_cache
 from constants.utils import bq as consts
-from resources import fields_for
+from resources import schema_for
 from common import JINJA_ENV
 
 _MAX_RESULTS_PADDING = 100
 """Constant added to table count in order to list all table results"""
 LOGGER = logging.getLogger(__name__)
 
+HTTP_POOL_SIZE = 32
+"""Connections kept open by each client, enough for jobs polled concurrently"""
+
 CREATE_OR_REPLACE_TABLE_TPL = JINJA_ENV.from_string("""
 CREATE OR REPLACE TABLE `{{project_id}}.{{dataset_id}}.{{table_id}}` (
 {% for field in schema -%}
@@ -66,15 +72,70 @@ TABLE_COUNT_TPL = JINJA_ENV.from_string(
 Requires parameter `dataset`: :class:`DatasetReference` and
 yields a scalar result with column `table_count`: :class:`int`."""
 
+CLONE_TABLE_TPL = JINJA_ENV.from_string("""
+CREATE {% if replace %}OR REPLACE {% endif %}TABLE `{{dest_table.project}}.{{dest_table.dataset_id}}.{{dest_table.table_id}}`
+CLONE `{{src_table.project}}.{{src_table.dataset_id}}.{{src_table.table_id}}`
+""")
+"""Query template to create a zero-copy clone of a table.
+Requires parameters `src_table` and `dest_table`: :class:`TableReference`.
+If `replace` is set, an existing `dest_table` is replaced."""
+
+MAX_CONCURRENT_COPY_JOBS = 10
+"""Maximum number of table copy jobs running at a time"""
+
+TYPE_ALIASES = {'INT64': 'INTEGER', 'FLOAT64': 'FLOAT', 'BOOL': 'BOOLEAN'}
+"""Standard sql type names reported for fields, mapped to legacy type names"""
+
 FIELDS_TMPL = JINJA_ENV.from_string("""
     {{name}} {{col_type}} {{mode}} OPTIONS(description="{{desc}}")
 """)
 
 
+def _build_client(project_id, scopes=None, credentials=None):
+    """
+    Build a client whose HTTP session pools up to HTTP_POOL_SIZE connections
+
+    :param project_id:  Name of the project to create a bigquery library client for
+    :param scopes: Tuple of Google scopes as strings
+    :param credentials: Google credentials object (ignored if scopes is defined)
+    :return:  A bigquery Client object.
+    """
+    if scopes:
+        credentials, project_id = default()
+        credentials = auth.delegated_credentials(credentials,
+                                                 scopes=list(scopes))
+    client = bigquery.Client(project=project_id, credentials=credentials)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                          pool_maxsize=HTTP_POOL_SIZE)
+    client._http.mount('https://', adapter)
+    return client
+
+
+def _credentials_key(credentials):
+    """
+    Identify credentials by the service account they act as and their scopes
+
+    Credentials built anew for each call, e.g. impersonation credentials, then
+    share a client.  Credentials of a user are identified by the object itself.
+
+    :param credentials: Google credentials object or None
+    :return: hashable key of the credentials
+    """
+    email = getattr(credentials, 'service_account_email', None)
+    if not email:
+        return credentials
+    scopes = getattr(credentials, 'scopes', None)
+    return (type(credentials).__name__, email,
+            tuple(sorted(scopes)) if scopes else None)
+
+
 def get_client(project_id, scopes=None, credentials=None):
     """
     Get a client for a specified project.
 
+    Clients are cached per thread by project, scopes and the service account
+    the credentials act as.
+
     :param project_id:  Name of the project to create a bigquery library client for
     :param scopes: List of Google scopes as strings
     :param credentials: Google credentials object (ignored if scopes is defined,
@@ -82,10 +143,36 @@ def get_client(project_id, scopes=None, credentials=None):
 
     :return:  A bigquery Client object.
     """
-    if scopes:
-        credentials, project_id = default()
-        credentials = auth.delegated_credentials(credentials, scopes=scopes)
-    return bigquery.Client(project=project_id, credentials=credentials)
+    client_cache.check_allowed('bigquery.Client')
+    scopes = tuple(scopes) if scopes else None
+    key = (bigquery.Client, project_id, scopes,
+           None if scopes else _credentials_key(credentials))
+    return client_cache.get_or_build(
+        'bigquery.Client', key,
+        partial(_build_client, project_id, scopes, credentials))
+
+
+def schema_signature(fields):
+    """
+    Get the name, type and mode of each field, ignoring descriptions
+
+    Schemas with the same signature hold the same data, e.g. a table cloned
+    from an unschemaed table has its schema but lacks its descriptions.
+
+    :param fields: list of SchemaField objects or field dicts from a fields
+        file or table resource
+    :return: list of (name, type, mode) tuples
+    """
+    signature = []
+    for field in fields:
+        if isinstance(field, bigquery.SchemaField):
+            field = field.to_api_repr()
+        field_type = field['type'].upper()
+        signature.append((field['name'].lower(),
+                          TYPE_ALIASES.get(field_type,
+                                           field_type), (field.get('mode') or
+                                                         'nullable').upper()))
+    return signature
 
 
 def get_table_schema(table_name, fields=None):
@@ -101,10 +188,8 @@ def get_table_schema(table_name, fields=None):
     :param fields: An optional argument to provide fields/schema as a list of JSON objects
     :returns:  a list of SchemaField objects representing the table's schema.
     """
-    if fields:
-        fields = fields
-    else:
-        fields = fields_for(table_name)
+    if not fields:
+        return list(schema_for(table_name).bq_fields)
 
     schema = []
     for column in fields:
@@ -568,20 +653,111 @@ def list_tables(
                               max_results=table_count + _MAX_RESULTS_PADDING)
 
 
-def copy_datasets(client: bigquery.Client, input_dataset, output_dataset):
+def verify_row_counts(client: bigquery.Client, src_table, dest_table):
+    """
+    Checks the destination table has as many rows as the source table
+
+    :param client: an instantiated bigquery client object
+    :param src_table: the table copied from
+    :param dest_table: the table copied to
+    :raises RuntimeError: if the row counts differ
+    """
+    src_rows = client.get_table(src_table).num_rows
+    dest_rows = client.get_table(dest_table).num_rows
+    if src_rows != dest_rows:
+        raise RuntimeError(f'Copied {dest_rows} of {src_rows} rows '
+                           f'from `{src_table}` to `{dest_table}`')
+
+
+def run_copy_jobs(client: bigquery.Client,
+                  copies,
+                  max_concurrent_jobs=MAX_CONCURRENT_COPY_JOBS):
+    """
+    Runs table copies concurrently and verifies each one
+
+    Every copy is waited on, and its row count is verified, even if others fail
+
+    :param client: an instantiated bigquery client object
+    :param copies: list of (src_table, dest_table, submit) tuples where submit
+        is a callable that starts the copy and returns its job
+    :param max_concurrent_jobs: maximum number of copy jobs running at a time
+    :raises RuntimeError: if any copy failed or its row counts differ
+    """
+
+    def run_copy(copy):
+        src_table, dest_table, submit = copy
+        try:
+            job = submit()
+            job.result()
+            verify_row_counts(client, src_table, dest_table)
+        except (GoogleAPIError, RuntimeError) as e:
+            LOGGER.exception(f'Failed to copy `{src_table}` to `{dest_table}`')
+            return e
+        LOGGER.info(f'Copied `{src_table}` to `{dest_table}` via {job.job_id}')
+        return None
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_jobs) as executor:
+        errors = {
+            str(dest_table): error
+            for (_, dest_table,
+                 _), error in zip(copies, executor.map(run_copy, copies))
+            if error
+        }
+    if errors:
+        raise RuntimeError(f'Failed to copy tables {sorted(errors)}: {errors}')
+
+
+def clone_table(client: bigquery.Client, src_table, dest_table, replace=False):
+    """
+    Starts a job creating dest_table as a clone of src_table
+
+    A clone only stores data that later differs from its source, so it is
+    much faster and cheaper than a full copy
+
+    :param client: an instantiated bigquery client object
+    :param src_table: the table to clone
+    :param dest_table: the clone to create
+    :param replace: if True, replace dest_table if it exists
+    :return: the query job creating the clone
+    """
+    src_table = bigquery.TableReference.from_string(
+        str(src_table), default_project=client.project)
+    dest_table = bigquery.TableReference.from_string(
+        str(dest_table), default_project=client.project)
+    return client.query(
+        CLONE_TABLE_TPL.render(src_table=src_table,
+                               dest_table=dest_table,
+                               replace=replace))
+
+
+def copy_datasets(client: bigquery.Client,
+                  input_dataset,
+                  output_dataset,
+                  clone=False,
+                  max_concurrent_jobs=MAX_CONCURRENT_COPY_JOBS):
     """
     Copies tables from source dataset to a destination datasets
 
     :param client: an instantiated bigquery client object
     :param input_dataset: name of the input dataset
     :param output_dataset: name of the output dataset
+    :param clone: if True, clone the tables instead of copying them
+    :param max_concurrent_jobs: maximum number of copy jobs running at a time
     :return:
+    :raises RuntimeError: if any table failed to copy completely
     """
     # Copy input dataset tables to backup and staging datasets
     tables = client.list_tables(input_dataset)
+    copies = []
     for table in tables:
         staging_table = f'{output_dataset}.{table.table_id}'
-        client.copy_table(table, staging_table)
+        if clone:
+            submit = partial(clone_table, client, table.reference,
+                             staging_table)
+        else:
+            submit = partial(client.copy_table, table, staging_table)
+        copies.append((table.reference, staging_table, submit))
+    run_copy_jobs(client, copies, max_concurrent_jobs)
 
 
 def validate_bq_date_string(date_string):
@@ -601,7 +777,11 @@ def validate_bq_date_string(date_string):
     return date_string
 
 
-def build_and_copy_contents(client, src_dataset, dest_dataset):
+def build_and_copy_contents(client,
+                            src_dataset,
+                            dest_dataset,
+                            clone=False,
+                            max_concurrent_jobs=MAX_CONCURRENT_COPY_JOBS):
     """
     Uses google client object to copy non-schemaed data to schemaed table.
 
@@ -609,16 +789,28 @@ def build_and_copy_contents(client, src_dataset, dest_dataset):
     :param src_dataset: The dataset to copy data from
     :param des_dataset: The dataset to copy data to.  It's tables are
         created with valid schemas before inserting data.
+    :param clone: if True, tables whose fields already match the schema in
+        name, type and mode are cloned instead of copied by query
+    :param max_concurrent_jobs: maximum number of copy jobs running at a time
+    :raises RuntimeError: if any table failed to copy completely
     """
     LOGGER.info(f'Beginning copy of data from unschemaed dataset, '
                 f'`{src_dataset}`, to schemaed dataset, `{dest_dataset}`.')
     table_list = client.list_tables(src_dataset)
 
+    copies = []
     for table_item in table_list:
-        # create empty schemaed tablle with client object
         schema_list = get_table_schema(table_item.table_id)
-        dest_table = f'{client.project}.{dest_dataset}.{table_item.table_id}'
-        dest_table = bigquery.Table(dest_table, schema=schema_list)
+        dest_table_id = f'{client.project}.{dest_dataset}.{table_item.table_id}'
+        if clone and schema_signature(client.get_table(
+                table_item).schema) == schema_signature(schema_list):
+            copies.append((table_item.reference, dest_table_id,
+                           partial(clone_table, client, table_item.reference,
+                                   dest_table_id)))
+            continue
+
+        # create empty schemaed tablle with client object
+        dest_table = bigquery.Table(dest_table_id, schema=schema_list)
         dest_table = client.create_table(dest_table)  # Make an API request.
         LOGGER.info(
             f'Created empty table `{dest_table.project}.{dest_table.dataset_id}.{dest_table.table_id}`'
@@ -641,13 +833,13 @@ def build_and_copy_contents(client, src_dataset, dest_dataset):
             })
         job_id = (f'schemaed_copy_{table_item.table_id.lower()}_'
                   f'{datetime.now().strftime("%Y%m%d_%H%M%S")}')
-        job = client.query(sql, job_config=job_config, job_id=job_id)
-        job.result()  # Wait for the job to complete.
+        copies.append((table_item.reference, dest_table_id,
+                       partial(client.query,
+                               sql,
+                               job_config=job_config,
+                               job_id=job_id)))
 
-        LOGGER.info(
-            f'Table contents `{table_item.project}.{table_item.dataset_id}.'
-            f'{table_item.table_id}` were copied to `{dest_table.project}.'
-            f'{dest_table.dataset_id}.{dest_table.table_id}`')
+    run_copy_jobs(client, copies, max_concurrent_jobs)
 
     LOGGER.info(f'Completed copy of data from unschemaed dataset, '
                 f'`{src_dataset}`, to schemaed dataset, `{dest_dataset}`.')
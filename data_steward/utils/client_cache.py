@@ -0,0 +1,147 @@
+"""
+A per-thread cache of API services and clients
+
+Building a discovery service or client is slow and discards any open HTTP
+connections, so services and clients are built once per thread and key and
+reused after that.  Neither httplib2 nor requests sessions are safe to share
+between threads, which is why each thread keeps its own cache.  Each thread
+keeps at most MAX_CACHED_PER_THREAD objects, discarding the least recently
+used.
+
+Counts of how often each kind of service or client is built and reused are
+kept for all threads.
+
+Within refuse_services, the entry points which get services and clients, such
+as utils.bq.get_client and bq_utils.create_service, raise ServiceRefusedError
+instead, e.g. while rules run against a local database.
+"""
+# Python imports
+import logging
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_CACHED_PER_THREAD = 16
+"""Services and clients each thread keeps, enough for a few projects"""
+
+_LOCAL = threading.local()
+_COUNTS_LOCK = threading.Lock()
+_BUILD_COUNTS = Counter()
+_REUSE_COUNTS = Counter()
+_REFUSALS_LOCK = threading.Lock()
+_REFUSALS = []
+
+
+class ServiceRefusedError(RuntimeError):
+    """
+    Raised when a service or client is requested within refuse_services
+    """
+    pass
+
+
+@contextmanager
+def refuse_services(reason):
+    """
+    Refuse services and clients to all threads until the context exits
+
+    :param reason: explains the refusal in the error message
+    """
+    with _REFUSALS_LOCK:
+        _REFUSALS.append(reason)
+    try:
+        yield
+    finally:
+        with _REFUSALS_LOCK:
+            _REFUSALS.remove(reason)
+
+
+def check_allowed(kind):
+    """
+    Check that services and clients are not refused
+
+    :param kind: name of the kind of object requested
+    :raises ServiceRefusedError: within refuse_services
+    """
+    with _REFUSALS_LOCK:
+        reason = _REFUSALS[-1] if _REFUSALS else None
+    if reason is not None:
+        raise ServiceRefusedError(f'Cannot get {kind}: {reason}')
+
+
+def _thread_cache():
+    cache = getattr(_LOCAL, 'cache', None)
+    if cache is None:
+        cache = _LOCAL.cache = OrderedDict()
+    return cache
+
+
+def get_or_build(kind, key, build):
+    """
+    Get the object cached in the current thread for a key, building it if needed
+
+    :param kind: name of the kind of object, used to count builds
+    :param key: hashable tuple identifying the object, e.g. project and
+        credentials
+    :param build: callable without arguments which builds the object
+    :return: the cached object
+    """
+    cache = _thread_cache()
+    cache_key = (kind,) + tuple(key)
+    if cache_key in cache:
+        cache.move_to_end(cache_key)
+        with _COUNTS_LOCK:
+            _REUSE_COUNTS[kind] += 1
+        return cache[cache_key]
+    obj = build()
+    cache[cache_key] = obj
+    if len(cache) > MAX_CACHED_PER_THREAD:
+        evicted_key, _ = cache.popitem(last=False)
+        LOGGER.debug(f'Discarded {evicted_key[0]} for {evicted_key[1:]} in '
+                     f'thread {threading.current_thread().name}')
+    with _COUNTS_LOCK:
+        _BUILD_COUNTS[kind] += 1
+    LOGGER.debug(
+        f'Built {kind} for {key} in thread {threading.current_thread().name}')
+    return obj
+
+
+def clear():
+    """
+    Discard the objects cached in the current thread
+    """
+    _thread_cache().clear()
+
+
+def get_stats():
+    """
+    Get how often each kind of object was built and reused in all threads
+
+    :return: dict mapping each kind to a dict with 'built' and 'reused' counts
+    """
+    with _COUNTS_LOCK:
+        return {
+            kind: {
+                'built': _BUILD_COUNTS[kind],
+                'reused': _REUSE_COUNTS[kind]
+            } for kind in sorted(set(_BUILD_COUNTS) | set(_REUSE_COUNTS))
+        }
+
+
+def reset_stats():
+    """
+    Reset the build and reuse counts
+    """
+    with _COUNTS_LOCK:
+        _BUILD_COUNTS.clear()
+        _REUSE_COUNTS.clear()
+
+
+def log_stats():
+    """
+    Log how often each kind of object was built and reused
+    """
+    for kind, counts in get_stats().items():
+        LOGGER.info(f"{kind}: built {counts['built']} time(s), "
+                    f"reused {counts['reused']} time(s)")
@@ -0,0 +1,79 @@
+"""
+Run interdependent steps concurrently, each once the steps it depends on complete
+"""
+# Python imports
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Project imports
+from utils import pipeline_logging
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_CONCURRENT_STEPS = 8
+
+
+def run_job_graph(steps, max_workers=MAX_CONCURRENT_STEPS):
+    """
+    Run steps concurrently, each only after the steps it depends on complete
+
+    If a step fails no further steps are started and its error is raised
+    once the running steps complete.  Each step runs in a span nested beneath
+    the span run_job_graph is called in
+
+    :param steps: dict mapping each step name to a tuple of a callable
+        and the set of step names it depends on
+    :param max_workers: maximum number of steps running at a time
+    :return: dict mapping each step name to the seconds it took to run
+    """
+
+    def timed(name, func):
+        start = time.monotonic()
+        with pipeline_logging.span(name):
+            func()
+        return time.monotonic() - start
+
+    pending = dict(steps)
+    timings = {}
+    running = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            if error is None:
+                ready = [
+                    name for name, (_, dependencies) in pending.items()
+                    if dependencies <= timings.keys()
+                ]
+                for name in ready:
+                    func, _ = pending.pop(name)
+                    running[executor.submit(pipeline_logging.bind_span(timed),
+                                            name, func)] = name
+            if not running:
+                if error is None:
+                    raise RuntimeError(
+                        f'Steps {sorted(pending)} have unmet dependencies')
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    LOGGER.error(f'Step {name} failed')
+                    error = error or future.exception()
+                else:
+                    timings[name] = future.result()
+    if error is not None:
+        raise error
+    return timings
+
+
+def log_timings(timings):
+    """
+    Log the time each step took, slowest first
+
+    :param timings: dict mapping each step name to the seconds it took to run
+    """
+    for name, seconds in sorted(timings.items(),
+                                key=lambda item: item[1],
+                                reverse=True):
+        LOGGER.info(f'{name}: {seconds:.1f}s')
@@ -14,14 +14,20 @@ The intent of the get_participant_information function is to retrieve the inform
     `zipCode`, `phoneNumber`, `email`, `dateOfBirth`, `sex`
 """
 # Python imports
+import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pandas.core.frame import DataFrame
 import requests
-from typing import List
+from typing import Dict, Iterable, List
 
 # Third party imports
+import numpy
 import pandas
 import google.auth.transport.requests as req
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from google.auth import default
 from google.cloud.bigquery.schema import SchemaField
 from google.cloud.bigquery import LoadJobConfig
@@ -40,6 +46,19 @@ These fields are coming in from RDR with their naming convention and will be con
 to the Curation naming convention in the `get_site_participant_information` function
 """
 
+LOGGER = logging.getLogger(__name__)
+
+PS_API_URL = 'https://{project_id}.appspot.com/rdr/v1/ParticipantSummary'
+"""ParticipantSummary API endpoint of an RDR project"""
+MAX_RETRIES = 5
+"""Number of times a failed request is retried before giving up"""
+BACKOFF_FACTOR = 2
+"""Seconds to wait before the first retry, doubled for every retry after"""
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+"""Response statuses which are retried"""
+MAX_FETCH_WORKERS = 8
+"""Maximum number of sites or organizations fetched at a time"""
+
 
 def get_access_token():
     """
@@ -62,37 +81,123 @@ def get_access_token():
     return access_token
 
 
-def get_participant_data(url, headers):
+def get_session(max_retries=MAX_RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                pool_size=MAX_FETCH_WORKERS):
+    """
+    Get a session which pools connections and retries failed requests with backoff
+
+    :param max_retries: number of times a failed request is retried
+    :param backoff_factor: seconds to wait before the first retry, doubled
+        for every retry after
+    :param pool_size: number of connections kept open per host
+
+    :return: a requests Session
+    """
+    retry = Retry(total=max_retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(max_retries=retry,
+                          pool_connections=pool_size,
+                          pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def iter_participant_data(url, headers, session=None):
+    """
+    Fetches participant data via ParticipantSummary API one page at a time
+
+    :param url: the /ParticipantSummary endpoint to fetch information about the participant
+    :param headers: the metadata associated with the API request and response
+    :param session: requests Session used to send requests, a new session
+        is used if not set
+
+    :return: generator of entries fetched from the ParticipantSummary API
+    :raises: RuntimeError if a request still fails after it was retried
+    """
+    session = session or get_session()
+    original_url = url
+    next_url = url
+
+    while next_url:
+        resp = session.get(next_url, headers=headers)
+        if resp.status_code != 200:
+            raise RuntimeError(
+                f'Error: API request failed because {resp}: {resp.text}')
+        r_json = resp.json()
+        yield from r_json.get('entry', [])
+        next_url = None
+        if 'link' in r_json:
+            link_url = r_json.get('link')[0].get('url')
+            next_url = original_url + '&' + link_url[link_url.find('_token'):]
+
+
+def get_participant_data(url, headers, session=None):
     """
     Fetches participant data via ParticipantSummary API
 
     :param url: the /ParticipantSummary endpoint to fetch information about the participant
     :param headers: the metadata associated with the API request and response
+    :param session: requests Session used to send requests, a new session
+        is used if not set
 
     :return: list of data fetched from the ParticipantSummary API
+    :raises: RuntimeError if a request still fails after it was retried
     """
+    return list(iter_participant_data(url, headers, session))
+
+
+def entries_to_dataframe(entries: Iterable[Dict],
+                         columns: List[str]) -> DataFrame:
+    """
+    Builds a dataframe column by column from participant summary entries
+
+    :param entries: iterable of ParticipantSummary API entries
+    :param columns: resource keys to keep as columns, values missing from a
+        resource are set to NaN
+
+    :return: dataframe with one row per entry
+    """
+    data = {column: [] for column in columns}
+    for entry in entries:
+        resource = entry.get('resource', {})
+        for column, values in data.items():
+            values.append(resource.get(column, numpy.nan))
+    return pandas.DataFrame(data, columns=columns)
 
-    done = False
-    participant_data = []
-    original_url = url
-    next_url = url
 
-    while not done:
-        resp = requests.get(next_url, headers=headers)
-        if not resp or resp.status_code != 200:
-            print(f'Error: API request failed because {resp}')
-        else:
-            r_json = resp.json()
-            participant_data += r_json.get('entry', {})
-            if 'link' in r_json:
-                link_obj = r_json.get('link')
-                link_url = link_obj[0].get('url')
-                next_url = original_url + '&' + link_url[link_url.find('_token'
-                                                                      ):]
-            else:
-                done = True
+def get_auth_headers():
+    """
+    Get the headers needed to send requests to the ParticipantSummary API
+
+    :return: dict of headers including a bearer token
+    """
+    token = get_access_token()
+    return {
+        'content-type': 'application/json',
+        'Authorization': f'Bearer {token}'
+    }
 
-    return participant_data
+
+def to_curation_columns(df, columns):
+    """
+    Rename columns to be consistent with the curation software
+
+    :param df: dataframe with columns named by the ParticipantSummary API
+    :param columns: columns of df to rename
+
+    :return: the renamed dataframe
+    """
+    bq_columns = ['_'.join(re.split('(?=[A-Z])', k)).lower() for k in columns]
+    bq_columns = [
+        'person_id' if k == 'participant_id' else k for k in bq_columns
+    ]
+    column_map = {k: v for k, v in zip(columns, bq_columns)}
+    return df.rename(columns=column_map)
 
 
 def get_deactivated_participants(api_project_id, columns):
@@ -112,37 +217,19 @@ def get_deactivated_participants(api_project_id, columns):
         raise RuntimeError(
             'Please provide a list of columns to be pushed to BigQuery table')
 
-    token = get_access_token()
-
-    headers = {
-        'content-type': 'application/json',
-        'Authorization': f'Bearer {token}'
-    }
+    headers = get_auth_headers()
 
     field = 'NO_CONTACT'
 
     # Make request to get API version. This is the current RDR version for reference
     # See https://github.com/all-of-us/raw-data-repository/blob/master/opsdataAPI.md for documentation of this api.
-    url = (f'https://{api_project_id}.appspot.com/rdr/v1/ParticipantSummary'
-           f'?_sort=lastModified'
-           f'&suspensionStatus={field}')
-
-    participant_data = get_participant_data(url, headers)
+    url = PS_API_URL.format(project_id=api_project_id)
+    url += f'?_sort=lastModified&suspensionStatus={field}'
 
     deactivated_participants_cols = columns
 
-    deactivated_participants = []
-    # loop over participant summary records, insert participant data in same order as deactivated_participant_cols
-    for entry in participant_data:
-        item = []
-        for col in deactivated_participants_cols:
-            for key, val in entry.get('resource', {}).items():
-                if col == key:
-                    item.append(val)
-        deactivated_participants.append(item)
-
-    df = pandas.DataFrame(deactivated_participants,
-                          columns=deactivated_participants_cols)
+    df = entries_to_dataframe(iter_participant_data(url, headers),
+                              deactivated_participants_cols)
 
     # Converts column `suspensionTime` from string to timestamp
     if 'suspensionTime' in deactivated_participants_cols:
@@ -153,21 +240,8 @@ def get_deactivated_participants(api_project_id, columns):
     df['participantId'] = df['participantId'].apply(participant_id_to_int)
 
     # Rename columns to be consistent with the curation software
-    bq_columns = [
-        '_'.join(re.split('(?=[A-Z])', k)).lower()
-        for k in deactivated_participants_cols
-    ]
-    bq_columns = [
-        'person_id' if k == 'participant_id' else k for k in bq_columns
-    ]
-    bq_columns = [
-        'deactivated_date' if k == 'suspension_time' else k for k in bq_columns
-    ]
-    column_map = {
-        k: v for k, v in zip(deactivated_participants_cols, bq_columns)
-    }
-
-    df = df.rename(columns=column_map)
+    df = to_curation_columns(df, deactivated_participants_cols)
+    df = df.rename(columns={'suspension_time': 'deactivated_date'})
 
     return df
 
@@ -188,12 +262,7 @@ def get_site_participant_information(project_id, hpo_id):
     if not isinstance(hpo_id, str):
         raise RuntimeError(f'Please provide an hpo_id')
 
-    token = get_access_token()
-
-    headers = {
-        'content-type': 'application/json',
-        'Authorization': f'Bearer {token}'
-    }
+    headers = get_auth_headers()
 
     # Make request to get API version. This is the current RDR version for reference see
     # see https://github.com/all-of-us/raw-data-repository/blob/master/opsdataAPI.md for documentation of this API.
@@ -201,60 +270,52 @@ def get_site_participant_information(project_id, hpo_id):
     #   regardless if there is EHR data uploaded for that participant
     # suspensionStatus=NOT_SUSPENDED and withdrawalStatus=NOT_WITHDRAWN -- ensures only active participants returned
     #   via the API
-    url = (f'https://{project_id}.appspot.com/rdr/v1/ParticipantSummary'
-           f'?awardee={hpo_id}'
-           f'&suspensionStatus=NOT_SUSPENDED'
-           f'&consentForElectronicHealthRecords=SUBMITTED'
-           f'&withdrawalStatus=NOT_WITHDRAWN'
-           f'&_sort=participantId'
-           f'&_count=1000')
+    url = PS_API_URL.format(project_id=project_id)
+    url += (f'?awardee={hpo_id}'
+            f'&suspensionStatus=NOT_SUSPENDED'
+            f'&consentForElectronicHealthRecords=SUBMITTED'
+            f'&withdrawalStatus=NOT_WITHDRAWN'
+            f'&_sort=participantId'
+            f'&_count=1000')
 
-    participant_data = get_participant_data(url, headers)
+    return _participant_information(url, headers)
 
-    # Columns of interest for participants of a desired site
-    participant_information_cols = FIELDS_OF_INTEREST_FOR_VALIDATION
 
-    participant_information = []
+def _participant_information(url, headers, session=None):
+    """
+    Fetches participant information needed for participant validation
+
+    :param url: the /ParticipantSummary endpoint to fetch information from
+    :param headers: the metadata associated with the API request and response
+    :param session: requests Session used to send requests
 
-    # Loop over participant summary records, insert participant data in
-    # the same order as participant_information_cols
-    for entry in participant_data:
-        item = []
-        for col in participant_information_cols:
-            for key, val in entry.get('resource', {}).items():
-                if col == key:
-                    item.append(val)
-        participant_information.append(item)
+    :return: a dataframe of participant information
+    """
+    # Columns of interest for participants of a desired site
+    participant_information_cols = FIELDS_OF_INTEREST_FOR_VALIDATION
 
-    df = pandas.DataFrame(participant_information,
-                          columns=participant_information_cols)
+    df = entries_to_dataframe(iter_participant_data(url, headers, session),
+                              participant_information_cols)
 
     # Transforms participantId to an integer string
     df['participantId'] = df['participantId'].apply(participant_id_to_int)
 
     # Rename columns to be consistent with the curation software
-    bq_columns = [
-        '_'.join(re.split('(?=[A-Z])', k)).lower()
-        for k in participant_information_cols
-    ]
-    bq_columns = [
-        'person_id' if k == 'participant_id' else k for k in bq_columns
-    ]
-    column_map = {
-        k: v for k, v in zip(participant_information_cols, bq_columns)
-    }
-
-    df = df.rename(columns=column_map)
-
-    return df
+    return to_curation_columns(df, participant_information_cols)
 
 
-def get_org_participant_information(project_id, org_id):
+def get_org_participant_information(project_id,
+                                    org_id,
+                                    headers=None,
+                                    session=None):
     """
     Fetches the necessary participant information for a particular organization.
 
     :param project_id: The RDR project hosting the API
     :param org_id: organization name of the site
+    :param headers: headers to send with requests, a new token is requested
+        if not set
+    :param session: requests Session used to send requests
 
     :return: a dataframe of participant information
     :raises: RuntimeError if the project_id and hpo_id are not strings
@@ -267,12 +328,7 @@ def get_org_participant_information(project_id, org_id):
     if not isinstance(org_id, str):
         raise RuntimeError(f'Please provide an org_id')
 
-    token = get_access_token()
-
-    headers = {
-        'content-type': 'application/json',
-        'Authorization': f'Bearer {token}'
-    }
+    headers = headers or get_auth_headers()
 
     # Make request to get API version. This is the current RDR version for reference see
     # see https://github.com/all-of-us/raw-data-repository/blob/master/opsdataAPI.md for documentation of this API.
@@ -280,53 +336,41 @@ def get_org_participant_information(project_id, org_id):
     #   regardless if there is EHR data uploaded for that participant
     # suspensionStatus=NOT_SUSPENDED and withdrawalStatus=NOT_WITHDRAWN -- ensures only active participants returned
     #   via the API
-    url = (f'https://{project_id}.appspot.com/rdr/v1/ParticipantSummary'
-           f'?organization={org_id}'
-           f'&suspensionStatus=NOT_SUSPENDED'
-           f'&consentForElectronicHealthRecords=SUBMITTED'
-           f'&withdrawalStatus=NOT_WITHDRAWN'
-           f'&_sort=participantId'
-           f'&_count=1000')
+    url = PS_API_URL.format(project_id=project_id)
+    url += (f'?organization={org_id}'
+            f'&suspensionStatus=NOT_SUSPENDED'
+            f'&consentForElectronicHealthRecords=SUBMITTED'
+            f'&withdrawalStatus=NOT_WITHDRAWN'
+            f'&_sort=participantId'
+            f'&_count=1000')
 
-    participant_data = get_participant_data(url, headers)
-
-    # Columns of interest for participants of a desired site
-    participant_information_cols = FIELDS_OF_INTEREST_FOR_VALIDATION
-
-    participant_information = []
-
-    # Loop over participant summary records, insert participant data in
-    # the same order as participant_information_cols
-    for entry in participant_data:
-        resource = entry.get('resource', {})
-        items = {
-            k: v
-            for k, v in resource.items()
-            if k in participant_information_cols
-        }
-        participant_information.append(items)
+    return _participant_information(url, headers, session)
 
-    df = pandas.DataFrame.from_records(participant_information,
-                                       columns=participant_information_cols)
 
-    # Transforms participantId to an integer string
-    df['participantId'] = df['participantId'].apply(participant_id_to_int)
+def get_orgs_participant_information(project_id,
+                                     org_ids,
+                                     max_workers=MAX_FETCH_WORKERS):
+    """
+    Fetches participant information for several organizations concurrently
 
-    # Rename columns to be consistent with the curation software
-    bq_columns = [
-        '_'.join(re.split('(?=[A-Z])', k)).lower()
-        for k in participant_information_cols
-    ]
-    bq_columns = [
-        'person_id' if k == 'participant_id' else k for k in bq_columns
-    ]
-    column_map = {
-        k: v for k, v in zip(participant_information_cols, bq_columns)
-    }
+    Every organization is fetched with one request per page, sharing a token
+    and a pool of connections.
 
-    df = df.rename(columns=column_map)
+    :param project_id: The RDR project hosting the API
+    :param org_ids: organization names of the sites
+    :param max_workers: maximum number of organizations fetched at a time
 
-    return df
+    :return: dict mapping each org_id to a dataframe of participant information
+    """
+    headers = get_auth_headers()
+    session = get_session(pool_size=max_workers)
+    fetch = partial(get_org_participant_information,
+                    project_id,
+                    headers=headers,
+                    session=session)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dfs = list(executor.map(fetch, org_ids))
+    return dict(zip(org_ids, dfs))
 
 
 def participant_id_to_int(participant_id):
@@ -5,14 +5,26 @@ Original Issue = DC-637
 
 The intent of this module is to allow other modules to setup logging easily without
 duplicating code.
+
+It also provides timing spans.  A span times a block of code, spans opened inside
+it are nested beneath it, and each span is written as a JSON line to the trace
+file once it ends, so where the time of a run went can be summarized afterwards
+(see tools/summarize_spans.py).
 """
 
 # Python imports
+import contextvars
+import functools
+import json
 import logging
 import logging.config
 import os
 import sys
-from datetime import datetime
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
 
 # Project imports
 import resources
@@ -30,6 +42,19 @@ _FILE_HANDLER = 'curation_file_handler'
 """Identifies the file log handler"""
 _CONSOLE_HANDLER = 'curation_console_handler'
 """Identifies the console handler"""
+_TRACE_HANDLER = 'curation_trace_handler'
+"""Identifies the handler writing spans to the trace file"""
+
+TRACE_LOGGER_NAME = 'curation.trace'
+"""Spans are logged as JSON lines by this logger, it does not propagate to the root logger"""
+TRACE_FILENAME_SUFFIX = '-trace.jsonl'
+SPAN_PATH_SEPARATOR = ';'
+"""Separates span names in a span's path, as in folded flame graph stacks"""
+
+TRACE_LOGGER = logging.getLogger(TRACE_LOGGER_NAME)
+TRACE_LOGGER.propagate = False
+
+_CURRENT_SPAN = contextvars.ContextVar('current_span', default=None)
 
 
 def _get_log_date_str():
@@ -58,6 +83,13 @@ def get_log_filename() -> str:
         return f'{_get_log_date_str()}{filename_suffix}.log'
 
 
+def get_trace_filename() -> str:
+    """
+    Construct runtime-specific trace filename, next to the log file
+    """
+    return get_log_filename()[:-len('.log')] + TRACE_FILENAME_SUFFIX
+
+
 def _get_log_file_path():
     """
     Get the abs path of the log file to use. 
@@ -70,6 +102,15 @@ def _get_log_file_path():
     return os.path.join(DEFAULT_LOG_DIR, get_log_filename())
 
 
+def _get_trace_file_path():
+    """
+    Get the abs path of the trace file to use, in DEFAULT_LOG_DIR
+
+    :return: absolute path to the trace file
+    """
+    return os.path.join(DEFAULT_LOG_DIR, get_trace_filename())
+
+
 def _get_config(level, add_console_handler):
     """
     Get a dictionary which describes the logging configuration
@@ -161,3 +202,194 @@ def configure(level=logging.INFO, add_console_handler=False):
     os.makedirs(DEFAULT_LOG_DIR, exist_ok=True)
     logging.config.dictConfig(config)
     sys.excepthook = _except_hook
+    configure_tracing()
+
+
+def configure_tracing(filename=None, stream=None):
+    """
+    Write spans as JSON lines to a trace file or a stream
+
+    Called by configure, scripts which set up logging themselves may call it
+    directly.  Replaces the trace handler of any previous call.
+
+    :param filename: path of the trace file, defaults to the trace file for the
+                     current date in DEFAULT_LOG_DIR.  The file is only created
+                     once a span ends.
+    :param stream: if set, spans are written to this stream instead of a file
+    :return: the trace handler
+    """
+    for handler in list(TRACE_LOGGER.handlers):
+        if handler.name == _TRACE_HANDLER:
+            TRACE_LOGGER.removeHandler(handler)
+            handler.close()
+    if stream is not None:
+        handler = logging.StreamHandler(stream)
+    else:
+        if filename is None:
+            os.makedirs(DEFAULT_LOG_DIR, exist_ok=True)
+            filename = _get_trace_file_path()
+        handler = logging.FileHandler(filename, mode='a', delay=True)
+    handler.name = _TRACE_HANDLER
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    TRACE_LOGGER.addHandler(handler)
+    TRACE_LOGGER.setLevel(logging.INFO)
+    return handler
+
+
+class _Span(object):
+    """
+    A span which has started but not yet ended
+    """
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.path = (f'{parent.path}{SPAN_PATH_SEPARATOR}{name}'
+                     if parent else name)
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = attributes
+        self.child_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_child_seconds(self, seconds):
+        with self._lock:
+            self.child_seconds += seconds
+
+
+def _emit_span(span_, started, seconds, status):
+    """
+    Log an ended span as a JSON line
+
+    Self time is the span's duration minus the time of its children, it is never
+    less than zero but children running concurrently can make it understated
+    """
+    record = {
+        'name': span_.name,
+        'path': span_.path,
+        'span_id': span_.span_id,
+        'parent_id': span_.parent.span_id if span_.parent else None,
+        'depth': span_.depth,
+        'thread': threading.current_thread().name,
+        'start': datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        'duration_seconds': round(seconds, 6),
+        'self_seconds': round(max(seconds - span_.child_seconds, 0.0), 6),
+        'status': status,
+        'attributes': span_.attributes
+    }
+    TRACE_LOGGER.info(json.dumps(record, default=str))
+
+
+class span(object):
+    """
+    Time a block of code as a span, nested beneath the span it runs in
+
+    Spans are written to the trace file when they end.  Use bind_span to nest
+    spans opened in other threads beneath the current span.
+
+    :param name: name of the span, e.g. the step or table it times
+    :param attributes: JSON serializable values describing the span
+    :example:
+    >>> from utils import pipeline_logging
+    >>>
+    >>> with pipeline_logging.span('load', table='person'):
+    >>>     with pipeline_logging.span('query'):
+    >>>         run_query()
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span = None
+        self._token = None
+        self._started = None
+        self._start = None
+
+    def __enter__(self):
+        self._span = _Span(self.name, _CURRENT_SPAN.get(), self.attributes)
+        self._token = _CURRENT_SPAN.set(self._span)
+        self._started = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        seconds = time.perf_counter() - self._start
+        _CURRENT_SPAN.reset(self._token)
+        if self._span.parent:
+            self._span.parent.add_child_seconds(seconds)
+        if TRACE_LOGGER.isEnabledFor(logging.INFO) and TRACE_LOGGER.handlers:
+            _emit_span(self._span, self._started, seconds,
+                       'error' if exc_type else 'ok')
+        return False
+
+    def set_attribute(self, key, value):
+        """
+        Add a value describing the span, e.g. a result only known at its end
+        """
+        self._span.attributes[key] = value
+
+
+def traced(name=None):
+    """
+    Decorator timing every call of a function as a span
+
+    :param name: name of the span, defaults to the function's qualified name
+    :example:
+    >>> @pipeline_logging.traced()
+    >>> def process(table):
+    >>>     ...
+    """
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def bind_span(func):
+    """
+    Bind a callable to the current span, so spans it opens are nested beneath
+    the current span even if it is called in another thread, e.g. by an executor
+
+    :param func: the callable to bind
+    :return: callable running func in a copy of the current context
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def read_spans(trace_path):
+    """
+    Read the spans written to a trace file
+
+    :param trace_path: path to the trace file
+    :return: list of span dicts
+    """
+    with open(trace_path) as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+def fold_spans(spans):
+    """
+    Sum the self time of spans by path, the folded stack format flame graph
+    tools such as flamegraph.pl and speedscope read
+
+    :param spans: span dicts, as returned by read_spans
+    :return: dict mapping each span path to its total self seconds
+    """
+    folded = defaultdict(float)
+    for span_ in spans:
+        folded[span_['path']] += span_['self_seconds']
+    return dict(folded)
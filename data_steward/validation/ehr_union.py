@@ -77,6 +77,7 @@ TODO: Refactor query generation logic in mapping_query and table_union_query
 """
 import argparse
 import logging
+from functools import partial
 
 import google.cloud.bigquery as bq
 
@@ -86,6 +87,12 @@ import cdm
 import common
 import resources
 from constants.validation import ehr_union as eu_constants
+from utils import pipeline_logging
+from utils.job_graph import run_job_graph
+
+MAX_CONCURRENT_JOBS = 8
+MAP_PERSON_TO_OBSERVATION = 'map_person_to_observation'
+MOVE_PERSON_TO_OBSERVATION = 'move_person_to_observation'
 
 UNION_ALL = '''
 
@@ -719,14 +726,51 @@ def map_ehr_person_to_observation(output_dataset_id):
     query(q, dst_table_id, dst_dataset_id, write_disposition='WRITE_APPEND')
 
 
-def main(input_dataset_id, output_dataset_id, project_id, hpo_ids=None):
+def mapping_step(table):
+    return f'mapping_{table}'
+
+
+def load_step(table):
+    return f'load_{table}'
+
+
+def load_dependencies(cdm_table, mapped_tables):
+    """
+    Get the mapping tables which must be loaded before a CDM table can be loaded
+
+    Includes the table's own mapping and those of any id fields it references,
+    which is a superset of the mapping tables its load query joins
+
+    :param cdm_table: name of the CDM table
+    :param mapped_tables: CDM tables which have mapping tables
+    :return: set of CDM table names whose mapping must be loaded first
+    """
+    if cdm_table == common.FACT_RELATIONSHIP:
+        return {common.MEASUREMENT, common.OBSERVATION}
+    field_names = {field['name'] for field in resources.fields_for(cdm_table)}
+    return {
+        table for table in mapped_tables
+        if table == cdm_table or f'{table}_id' in field_names
+    }
+
+
+@pipeline_logging.traced('ehr_union')
+def main(input_dataset_id,
+         output_dataset_id,
+         project_id,
+         hpo_ids=None,
+         max_workers=MAX_CONCURRENT_JOBS):
     """
     Create a new CDM which is the union of all EHR datasets submitted by HPOs
 
+    Mapping and load jobs run concurrently, each table is loaded once the
+    mapping tables it references are complete
+
     :param input_dataset_id identifies a dataset containing multiple CDMs, one for each HPO submission
     :param output_dataset_id identifies the dataset to store the new CDM in
     :param project_id: project containing the datasets
     :param hpo_ids: (optional) identifies HPOs to process, by default process all
+    :param max_workers: maximum number of jobs running at a time
     :returns: list of tables generated successfully
     """
     client = bq.Client()
@@ -736,44 +780,55 @@ def main(input_dataset_id, output_dataset_id, project_id, hpo_ids=None):
         hpo_ids = [item['hpo_id'] for item in bq_utils.get_hpo_info()]
 
     # Create empty output tables to ensure proper schema, clustering, etc.
-    for table in resources.CDM_TABLES:
-        result_table = output_table_for(table)
-        logging.info(f'Creating {output_dataset_id}.{result_table}...')
-        bq_utils.create_standard_table(table,
-                                       result_table,
-                                       drop_existing=True,
-                                       dataset_id=output_dataset_id)
-
-    # Create mapping tables
-    for domain_table in cdm.tables_to_map():
-        logging.info(f'Mapping {domain_table}...')
-        mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-                project_id, client)
+    with pipeline_logging.span('create_output_tables'):
+        for table in resources.CDM_TABLES:
+            result_table = output_table_for(table)
+            logging.info(f'Creating {output_dataset_id}.{result_table}...')
+            bq_utils.create_standard_table(table,
+                                           result_table,
+                                           drop_existing=True,
+                                           dataset_id=output_dataset_id)
+
+    steps = {}
+    # Create mapping tables, including the person mapping table
+    mapped_tables = cdm.tables_to_map()
+    for domain_table in mapped_tables + [common.PERSON]:
+        steps[mapping_step(domain_table)] = (partial(mapping, domain_table,
+                                                     hpo_ids, input_dataset_id,
+                                                     output_dataset_id,
+                                                     project_id, client), set())
 
     # Load all tables with union of submitted tables
     for table_name in resources.CDM_TABLES:
-        logging.info(f'Creating union of table {table_name}...')
-        load(table_name, hpo_ids, input_dataset_id, output_dataset_id)
-
-    logging.info('Creation of Unioned EHR complete')
-
-    # create person mapping table
-    domain_table = common.PERSON
-    logging.info(f'Mapping {domain_table}...')
-    mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-            project_id, client)
+        dependencies = {
+            mapping_step(table)
+            for table in load_dependencies(table_name, mapped_tables)
+        }
+        steps[load_step(table_name)] = (partial(load, table_name, hpo_ids,
+                                                input_dataset_id,
+                                                output_dataset_id),
+                                        dependencies)
 
-    logging.info('Starting process for Person to Observation')
     # Map and move EHR person records into four rows in observation, one each for race, ethnicity, dob and gender
-    map_ehr_person_to_observation(output_dataset_id)
-    move_ehr_person_to_observation(output_dataset_id)
+    # Only after all loads so the appended observation mappings are not used by other tables
+    person_dependencies = {mapping_step(common.PERSON)} | {
+        load_step(table_name) for table_name in resources.CDM_TABLES
+    }
+    steps[MAP_PERSON_TO_OBSERVATION] = (partial(map_ehr_person_to_observation,
+                                                output_dataset_id),
+                                        person_dependencies)
+    steps[MOVE_PERSON_TO_OBSERVATION] = (partial(move_ehr_person_to_observation,
+                                                 output_dataset_id),
+                                         person_dependencies)
+
+    with pipeline_logging.span('union_tables', hpo_ids=len(hpo_ids)):
+        run_job_graph(steps, max_workers)
 
+    logging.info('Creation of Unioned EHR complete')
     logging.info('Completed Person to Observation')
 
 
 if __name__ == '__main__':
-    from utils import pipeline_logging
-
     pipeline_logging.configure(logging.INFO, add_console_handler=True)
     parser = argparse.ArgumentParser(
         description=
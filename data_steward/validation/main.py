@@ -11,6 +11,7 @@ import json
 import logging
 import os
 import re
+import sys
 from io import StringIO, open
 
 # Third party imports
@@ -26,6 +27,7 @@ import cdm
 import common
 import gcs_utils
 import resources
+from utils import client_cache, pipeline_logging
 from utils.slack_alerts import log_event_factory
 from common import ACHILLES_EXPORT_PREFIX_STRING, ACHILLES_EXPORT_DATASOURCES_JSON, AOU_REQUIRED_FILES
 from constants.validation import hpo_report as report_consts
@@ -504,26 +506,34 @@ def process_hpo(hpo_id, force_run=False):
     """
     try:
         logging.info(f"Processing hpo_id {hpo_id}")
-        bucket = gcs_utils.get_hpo_bucket(hpo_id)
-        bucket_items = list_bucket(bucket)
-        folder_prefix = _get_submission_folder(bucket, bucket_items, force_run)
-        if folder_prefix is None:
-            logging.info(
-                f"No submissions to process in {hpo_id} bucket {bucket}")
-        else:
-            folder_items = []
-            if is_valid_folder_prefix_name(folder_prefix):
-                # perform validation
-                folder_items = get_folder_items(bucket_items, folder_prefix)
-                summary = validate_submission(hpo_id, bucket, folder_items,
-                                              folder_prefix)
-                report_data = generate_metrics(hpo_id, bucket, folder_prefix,
-                                               summary)
+        with pipeline_logging.span('process_hpo', hpo_id=hpo_id) as hpo_span:
+            bucket = gcs_utils.get_hpo_bucket(hpo_id)
+            with pipeline_logging.span('list_bucket'):
+                bucket_items = list_bucket(bucket)
+                folder_prefix = _get_submission_folder(bucket, bucket_items,
+                                                       force_run)
+            if folder_prefix is None:
+                logging.info(
+                    f"No submissions to process in {hpo_id} bucket {bucket}")
             else:
-                # do not perform validation
-                report_data = generate_empty_report(hpo_id, folder_prefix)
-            perform_reporting(hpo_id, report_data, folder_items, bucket,
-                              folder_prefix)
+                hpo_span.set_attribute('folder_prefix', folder_prefix)
+                folder_items = []
+                if is_valid_folder_prefix_name(folder_prefix):
+                    # perform validation
+                    folder_items = get_folder_items(bucket_items, folder_prefix)
+                    with pipeline_logging.span('validate_submission'):
+                        summary = validate_submission(hpo_id, bucket,
+                                                      folder_items,
+                                                      folder_prefix)
+                    with pipeline_logging.span('generate_metrics'):
+                        report_data = generate_metrics(hpo_id, bucket,
+                                                       folder_prefix, summary)
+                else:
+                    # do not perform validation
+                    report_data = generate_empty_report(hpo_id, folder_prefix)
+                with pipeline_logging.span('perform_reporting'):
+                    perform_reporting(hpo_id, report_data, folder_items, bucket,
+                                      folder_prefix)
     except BucketDoesNotExistError as bucket_error:
         bucket = bucket_error.bucket
         logging.warning(
@@ -1021,6 +1031,19 @@ def validate_pii():
 def set_up_logging():
     initialize_logging()
     initialize_slack_logging()
+    # App Engine sends stdout to Cloud Logging, where spans can be queried
+    pipeline_logging.configure_tracing(stream=sys.stdout)
+
+
+def log_client_stats(exception=None):
+    """
+    Log how often services and clients were built and reused
+
+    The counts are kept across requests since the instance started.
+
+    :param exception: the exception the request raised, if any
+    """
+    client_cache.log_stats()
 
 
 app.add_url_rule(consts.PREFIX + 'ValidateAllHpoFiles',
@@ -1064,3 +1087,7 @@ app.before_request(
 app.teardown_request(
     end_request_logging
 )  # teardown_request to be called regardless if there is an exception thrown
+
+# teardown_request functions run in reverse order, so the counts are logged
+# before the request's logs are ended
+app.teardown_request(log_client_stats)
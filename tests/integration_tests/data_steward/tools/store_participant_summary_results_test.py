@@ -72,9 +72,9 @@ class StoreParticipantSummaryResultsTest(TestCase):
 
     @mock.patch('tools.store_participant_summary_results.bq.get_table_schema')
     @mock.patch(
-        'tools.store_participant_summary_results.get_org_participant_information'
+        'tools.store_participant_summary_results.get_orgs_participant_information'
     )
-    def test_main(self, mock_get_org_participant_information,
+    def test_main(self, mock_get_orgs_participant_information,
                   mock_get_table_schema):
         data = [{
             'person_id': 1,
@@ -86,7 +86,9 @@ class StoreParticipantSummaryResultsTest(TestCase):
             'last_name': 'Doe'
         }]
         data_df = DataFrame(data)
-        mock_get_org_participant_information.return_value = data_df
+        mock_get_orgs_participant_information.return_value = {
+            self.org_id: data_df
+        }
         mock_get_table_schema.return_value = [
             bigquery.SchemaField('person_id', 'integer'),
             bigquery.SchemaField('first_name', 'string'),
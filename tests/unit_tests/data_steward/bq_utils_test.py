@@ -1,7 +1,9 @@
+import json
 import unittest
 from datetime import datetime
 
 import mock
+from googleapiclient.errors import HttpError
 
 import bq_utils
 from constants import bq_utils as bq_utils_consts
@@ -17,6 +19,45 @@ class BqUtilsTest(unittest.TestCase):
 
     def setUp(self):
         self.hpo_id = 'fake-hpo'
+        self.fields = [{
+            'name': 'id',
+            'type': 'integer',
+            'mode': 'required',
+            'description': ''
+        }, {
+            'name': 'value',
+            'type': 'float',
+            'mode': 'nullable',
+            'description': ''
+        }, {
+            'name': 'flag',
+            'type': 'boolean',
+            'mode': 'nullable',
+            'description': ''
+        }, {
+            'name': 'name',
+            'type': 'string',
+            'mode': 'required',
+            'description': ''
+        }, {
+            'name': 'day',
+            'type': 'date',
+            'mode': 'nullable',
+            'description': ''
+        }]
+        self.rows = [{
+            'id': '1',
+            'value': '3.14',
+            'flag': 'true',
+            'name': 'abc',
+            'day': '2019-01-01'
+        }, {
+            'id': '2',
+            'value': '',
+            'flag': '',
+            'name': '',
+            'day': ''
+        }]
 
     def test_load_cdm_csv_error_on_bad_table_name(self):
         self.assertRaises(ValueError, bq_utils.load_cdm_csv, self.hpo_id,
@@ -95,3 +136,140 @@ class BqUtilsTest(unittest.TestCase):
         # post conditions
         expected = 'dataset_foo'
         self.assertEqual(result_id, expected)
+
+    def test_csv_line_to_json_row(self):
+        fields_by_name = {field['name']: field for field in self.fields}
+
+        self.assertDictEqual(
+            bq_utils.csv_line_to_json_row(self.rows[0], fields_by_name), {
+                'id': 1,
+                'value': 3.14,
+                'flag': True,
+                'name': 'abc',
+                'day': '2019-01-01'
+            })
+        # empty nullable values are null and empty required strings are kept
+        self.assertDictEqual(
+            bq_utils.csv_line_to_json_row(self.rows[1], fields_by_name), {
+                'id': 2,
+                'value': None,
+                'flag': None,
+                'name': '',
+                'day': None
+            })
+
+        with self.assertRaises(bq_utils.InvalidOperationError):
+            bq_utils.csv_line_to_json_row({'id': ''}, fields_by_name)
+        with self.assertRaises(bq_utils.InvalidOperationError):
+            bq_utils.csv_line_to_json_row({'id': 'one'}, fields_by_name)
+        with self.assertRaises(bq_utils.InvalidOperationError):
+            bq_utils.csv_line_to_json_row({'missing': '1'}, fields_by_name)
+
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    @mock.patch('bq_utils.query')
+    @mock.patch('bq_utils.get_job_details')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.create_service')
+    @mock.patch('bq_utils.create_table')
+    @mock.patch('bq_utils.resources.csv_to_list')
+    def test_load_table_from_csv(self, mock_csv_to_list, mock_create_table,
+                                 mock_create_service, mock_wait_on_jobs,
+                                 mock_get_job_details, mock_query, mock_app_id):
+        mock_csv_to_list.return_value = self.rows
+        mock_app_id.return_value = 'fake_project'
+        mock_insert = mock_create_service.return_value.jobs.return_value.insert
+        mock_insert.return_value.execute.return_value = {
+            'jobReference': {
+                'jobId': 'fake_job'
+            }
+        }
+        mock_wait_on_jobs.return_value = []
+        mock_get_job_details.return_value = {'status': {'state': 'DONE'}}
+
+        result = bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                              'fake_table', 'fake.csv',
+                                              self.fields)
+
+        self.assertEqual(result, mock_get_job_details.return_value)
+        mock_create_table.assert_called_once_with(table_id='fake_table',
+                                                  fields=self.fields,
+                                                  drop_existing=True,
+                                                  dataset_id='fake_dataset')
+        mock_query.assert_not_called()
+        _, kwargs = mock_insert.call_args
+        load = kwargs['body']['configuration']['load']
+        self.assertEqual(load['sourceFormat'],
+                         bq_utils_consts.NEWLINE_DELIMITED_JSON)
+        self.assertEqual(load['destinationTable']['tableId'], 'fake_table')
+        uploaded = kwargs['media_body'].stream().getvalue().decode('utf-8')
+        self.assertListEqual(
+            [json.loads(line)['id'] for line in uploaded.splitlines()], [1, 2])
+
+        # rows are inserted using a query if the load job fails
+        mock_get_job_details.return_value = {
+            'status': {
+                'state': 'DONE',
+                'errorResult': {
+                    'message': 'fake error'
+                }
+            }
+        }
+        result = bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                              'fake_table', 'fake.csv',
+                                              self.fields)
+        self.assertEqual(result, mock_query.return_value)
+        self.assertIn('INSERT INTO `fake_project.fake_dataset.fake_table`',
+                      mock_query.call_args[0][0])
+
+        # or if it cannot be submitted
+        mock_query.reset_mock()
+        mock_insert.return_value.execute.side_effect = HttpError(
+            mock.MagicMock(status=403), b'forbidden')
+        bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                     'fake_table', 'fake.csv', self.fields)
+        mock_query.assert_called_once()
+
+        # or if it does not complete in time and is stopped once cancelled
+        mock_query.reset_mock()
+        mock_insert.return_value.execute.side_effect = None
+        mock_cancel = mock_create_service.return_value.jobs.return_value.cancel
+        mock_wait_on_jobs.side_effect = [['fake_job'], []]
+        result = bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                              'fake_table', 'fake.csv',
+                                              self.fields)
+        self.assertEqual(result, mock_query.return_value)
+        mock_query.assert_called_once()
+        mock_cancel.assert_called_once_with(projectId='fake_project',
+                                            jobId='fake_job')
+
+        # rows are not inserted if the load job completed before it was cancelled
+        mock_query.reset_mock()
+        mock_wait_on_jobs.side_effect = [['fake_job'], []]
+        mock_get_job_details.return_value = {'status': {'state': 'DONE'}}
+        result = bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                              'fake_table', 'fake.csv',
+                                              self.fields)
+        self.assertEqual(result, mock_get_job_details.return_value)
+        mock_query.assert_not_called()
+
+        # or if it does not stop once cancelled
+        mock_wait_on_jobs.side_effect = [['fake_job'], ['fake_job']]
+        with self.assertRaises(bq_utils.BigQueryJobWaitError):
+            bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                         'fake_table', 'fake.csv', self.fields)
+        mock_query.assert_not_called()
+
+        # rows are inserted if they cannot be marshalled to json
+        mock_query.reset_mock()
+        mock_insert.reset_mock()
+        mock_wait_on_jobs.side_effect = None
+        mock_wait_on_jobs.return_value = []
+        mock_csv_to_list.return_value = [{'id': 'one'}]
+        with mock.patch('bq_utils.csv_line_to_sql_row_expr') as mock_row_expr:
+            mock_row_expr.return_value = "('one')"
+            result = bq_utils.load_table_from_csv('fake_project',
+                                                  'fake_dataset', 'fake_table',
+                                                  'fake.csv', self.fields)
+        self.assertEqual(result, mock_query.return_value)
+        mock_insert.assert_not_called()
+        mock_query.assert_called_once()
@@ -3,8 +3,11 @@ import unittest
 from mock import patch
 
 import cdr_cleaner.clean_cdr as cc
+from cdr_cleaner.rule_profiler import RuleProfiler
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
 from constants.cdr_cleaner.clean_cdr import DataStage
 from tests.test_util import FakeRuleClass, fake_rule_func
+from utils import client_cache
 
 
 class CleanCDRTest(unittest.TestCase):
@@ -95,7 +98,11 @@ class CleanCDRTest(unittest.TestCase):
             'sandbox_dataset_id': self.sandbox_dataset_id,
             'data_stage': DataStage.EHR,
             'console_log': False,
-            'list_queries': False
+            'list_queries': False,
+            'profile': None,
+            'profile_dir': ce_consts.PROFILE_DIR,
+            'backend': ce_consts.BIGQUERY_BACKEND,
+            'duckdb_database': None
         }
         parser = cc.get_parser()
         actual_args, actual_kwargs = cc.fetch_args_kwargs(
@@ -274,7 +281,11 @@ class CleanCDRTest(unittest.TestCase):
                 'sandbox_dataset_id': self.sandbox_dataset_id,
                 'data_stage': DataStage.EHR,
                 'console_log': False,
-                'list_queries': False
+                'list_queries': False,
+                'profile': None,
+                'profile_dir': ce_consts.PROFILE_DIR,
+                'backend': ce_consts.BIGQUERY_BACKEND,
+                'duckdb_database': None
             })
 
         expected_kargs = {}
@@ -291,7 +302,9 @@ class CleanCDRTest(unittest.TestCase):
             dataset_id=self.dataset_id,
             sandbox_dataset_id=self.sandbox_dataset_id,
             rules=rules,
-            table_namer=DataStage.EHR.value)
+            table_namer=DataStage.EHR.value,
+            profiler=None,
+            client=None)
 
         # Test get_queries() function call
         args = [
@@ -307,7 +320,11 @@ class CleanCDRTest(unittest.TestCase):
                 'sandbox_dataset_id': self.sandbox_dataset_id,
                 'data_stage': DataStage.EHR,
                 'console_log': False,
-                'list_queries': True
+                'list_queries': True,
+                'profile': None,
+                'profile_dir': ce_consts.PROFILE_DIR,
+                'backend': ce_consts.BIGQUERY_BACKEND,
+                'duckdb_database': None
             })
 
         expected_kargs = {}
@@ -320,4 +337,72 @@ class CleanCDRTest(unittest.TestCase):
             dataset_id=self.dataset_id,
             sandbox_dataset_id=self.sandbox_dataset_id,
             rules=rules,
-            table_namer=DataStage.EHR.value)
+            table_namer=DataStage.EHR.value,
+            profiler=None)
+
+    @patch('cdr_cleaner.clean_cdr.pipeline_logging.configure_tracing')
+    @patch('cdr_cleaner.clean_cdr.rule_profiler.RuleProfiler.write_reports')
+    @patch('cdr_cleaner.clean_cdr.clean_engine.clean_dataset')
+    @patch('cdr_cleaner.clean_cdr.clean_engine.add_console_logging')
+    def test_clean_cdr_profile(self, mock_logging, mock_clean_dataset,
+                               mock_write_reports, mock_tracing):
+        mock_clean_dataset.side_effect = RuntimeError('rule failed')
+        args = [
+            '-p', self.project_id, '-d', self.dataset_id, '-b',
+            self.sandbox_dataset_id, '--data_stage', 'ehr', '--profile', 'cpu',
+            '--profile_dir', 'profiles'
+        ]
+
+        with self.assertRaises(RuntimeError):
+            cc.main(args)
+
+        mock_tracing.assert_called_once_with(ce_consts.TRACE_FILENAME)
+        profiler = mock_clean_dataset.call_args[1]['profiler']
+        self.assertIsInstance(profiler, RuleProfiler)
+        self.assertEqual(profiler.mode, 'cpu')
+        self.assertTrue(profiler.output_dir.startswith('profiles/ehr_cpu_'))
+        # reports are written even though a rule failed
+        mock_write_reports.assert_called_once_with()
+
+    @patch('cdr_cleaner.clean_cdr.pipeline_logging.configure_tracing')
+    @patch('cdr_cleaner.clean_cdr.os.path.isfile')
+    @patch('cdr_cleaner.clean_cdr.duckdb_backend.DuckDBClient')
+    @patch('cdr_cleaner.clean_cdr.clean_engine.clean_dataset')
+    @patch('cdr_cleaner.clean_cdr.clean_engine.add_console_logging')
+    def test_clean_cdr_duckdb_backend(self, mock_logging, mock_clean_dataset,
+                                      mock_duckdb_client, mock_isfile,
+                                      mock_tracing):
+        args = [
+            '-p', self.project_id, '-d', self.dataset_id, '-b',
+            self.sandbox_dataset_id, '--data_stage', 'ehr', '--backend',
+            'duckdb', '--duckdb_database', 'sample.duckdb'
+        ]
+        mock_isfile.return_value = True
+        client = mock_duckdb_client.return_value
+        client.dataset_exists.return_value = True
+
+        def clean_dataset(**kwargs):
+            # rules cannot reach BigQuery while they run against duckdb
+            with self.assertRaises(client_cache.ServiceRefusedError):
+                cc.clean_engine.bq.get_client(self.project_id)
+
+        mock_clean_dataset.side_effect = clean_dataset
+
+        cc.main(args)
+
+        mock_duckdb_client.assert_called_once_with('sample.duckdb',
+                                                   project=self.project_id)
+        client.dataset_exists.assert_called_once_with(self.dataset_id)
+        self.assertIs(mock_clean_dataset.call_args[1]['client'], client)
+        client.close.assert_called_once_with()
+
+        # the database file is required, and must contain the dataset
+        with self.assertRaises(SystemExit):
+            cc.main(args[:-2])
+        mock_isfile.return_value = False
+        self.assertRaises(RuntimeError, cc.main, args)
+        mock_isfile.return_value = True
+        client.dataset_exists.return_value = False
+        self.assertRaises(RuntimeError, cc.main, args)
+        self.assertEqual(client.close.call_count, 2)
+        mock_clean_dataset.assert_called_once()
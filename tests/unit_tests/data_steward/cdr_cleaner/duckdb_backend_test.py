@@ -0,0 +1,243 @@
+# Python imports
+import unittest
+
+# Third party imports
+import pandas as pd
+from google.api_core.exceptions import BadRequest, Conflict, NotFound
+from google.cloud import bigquery
+
+# Project imports
+import bq_utils
+import gcs_utils
+from cdr_cleaner import clean_cdr_engine, duckdb_backend
+from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from constants.bq_utils import WRITE_APPEND, WRITE_EMPTY, WRITE_TRUNCATE
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+from utils import bq, client_cache
+from utils.bq import get_client
+
+
+class RemoveOldPersons(BaseCleaningRule):
+    """
+    Sandboxes and removes persons born before 1900
+    """
+
+    def __init__(self, project_id, dataset_id, sandbox_dataset_id):
+        super().__init__(issue_numbers=['DC000'],
+                         description='remove persons born before 1900',
+                         affected_datasets=[],
+                         affected_tables=['person'],
+                         project_id=project_id,
+                         dataset_id=dataset_id,
+                         sandbox_dataset_id=sandbox_dataset_id)
+
+    def get_query_specs(self):
+        return [{
+            cdr_consts.QUERY:
+                f'CREATE OR REPLACE TABLE `{self.project_id}.'
+                f'{self.sandbox_dataset_id}.old_person` AS '
+                f'SELECT * FROM `{self.project_id}.{self.dataset_id}.person` '
+                f'WHERE year_of_birth < 1900'
+        }, {
+            cdr_consts.QUERY:
+                f'SELECT * FROM `{self.project_id}.{self.dataset_id}.person` '
+                f'WHERE person_id NOT IN (SELECT person_id FROM '
+                f'`{self.project_id}.{self.sandbox_dataset_id}.old_person`)',
+            cdr_consts.DESTINATION_TABLE: 'person',
+            cdr_consts.DESTINATION_DATASET: self.dataset_id,
+            cdr_consts.DISPOSITION: WRITE_TRUNCATE
+        }]
+
+    def setup_rule(self, client):
+        pass
+
+    def setup_validation(self, client):
+        pass
+
+    def validate_rule(self, client):
+        pass
+
+    def get_sandbox_tablenames(self):
+        return ['old_person']
+
+
+@unittest.skipIf(duckdb_backend.duckdb is None or
+                 duckdb_backend.sqlglot is None,
+                 'duckdb and sqlglot are not installed')
+class DuckDBBackendTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.project_id = 'fake_project'
+        self.dataset_id = 'fake_dataset'
+        self.sandbox_dataset_id = 'fake_sandbox'
+        self.client = duckdb_backend.DuckDBClient(project=self.project_id)
+        self.client.create_tables(self.dataset_id, ['person'])
+        self.person_df = pd.DataFrame({
+            'person_id': [1, 2, 3],
+            'gender_concept_id': [0, 0, 0],
+            'year_of_birth': [1850, 1990, 2000],
+            'race_concept_id': [0, 0, 0],
+            'ethnicity_concept_id': [0, 0, 0]
+        })
+        self.client.load_table_from_dataframe(self.person_df,
+                                              f'{self.dataset_id}.person')
+
+    def tearDown(self):
+        self.client.close()
+
+    def job_config(self, table_id, write_disposition):
+        job_config = bigquery.QueryJobConfig()
+        job_config.destination = bigquery.TableReference.from_string(
+            f'{self.project_id}.{self.dataset_id}.{table_id}')
+        job_config.write_disposition = write_disposition
+        return job_config
+
+    def test_transpile(self):
+        statements = duckdb_backend.transpile(
+            'SELECT EXTRACT(DATE FROM observation_datetime) AS d '
+            'FROM `p.ds.observation`; '
+            'UPDATE `p.ds.person` p SET p.year_of_birth = 1900 WHERE TRUE; '
+            'SELECT table_id FROM `p.sb.__TABLES__`')
+
+        self.assertEqual(len(statements), 3)
+        select, is_query, datasets, shimmed = statements[0]
+        self.assertTrue(is_query)
+        self.assertIn('CAST(observation_datetime AS DATE)', select)
+        self.assertIn('"ds"."observation"', select)
+        self.assertNotIn('"p"', select)
+        self.assertEqual(datasets, {'ds'})
+        self.assertEqual(shimmed, set())
+        update, is_query, _, _ = statements[1]
+        self.assertFalse(is_query)
+        self.assertIn('SET year_of_birth = 1900', update)
+        self.assertEqual(statements[2][3], {'sb'})
+
+        with self.assertRaises(ValueError):
+            duckdb_backend.transpile('DECLARE i INT64 DEFAULT 0')
+
+    def test_transpile_create_table_as_with_columns(self):
+        statements = duckdb_backend.transpile(
+            'CREATE OR REPLACE TABLE `p.sb.t` (person_id INT64) AS '
+            'SELECT person_id FROM `p.ds.person`')
+
+        self.assertEqual(len(statements), 2)
+        self.assertNotIn('SELECT', statements[0][0])
+        self.assertTrue(statements[1][0].startswith('INSERT INTO "sb"."t"'))
+
+    def test_query(self):
+        rows = list(
+            self.client.query(
+                f'SELECT person_id, year_of_birth FROM '
+                f'`{self.project_id}.{self.dataset_id}.person` '
+                f'WHERE year_of_birth > 1900 ORDER BY person_id').result())
+
+        self.assertEqual([row['person_id'] for row in rows], [2, 3])
+        self.assertEqual([row.year_of_birth for row in rows], [1990, 2000])
+
+        job = self.client.query('SELECT * FROM `p.fake_dataset.missing`',
+                                job_id_prefix='missing_')
+        self.assertTrue(job.job_id.startswith('missing_'))
+        self.assertTrue(job.errors)
+        self.assertRaises(BadRequest, job.result)
+
+    def test_query_destination(self):
+        query = (f'SELECT person_id FROM '
+                 f'`{self.project_id}.{self.dataset_id}.person`')
+
+        self.client.query(query,
+                          job_config=self.job_config('person_ids',
+                                                     WRITE_EMPTY)).result()
+        self.assertEqual(
+            self.client.get_table(f'{self.dataset_id}.person_ids').num_rows, 3)
+
+        self.client.query(query,
+                          job_config=self.job_config('person_ids',
+                                                     WRITE_APPEND)).result()
+        self.assertEqual(
+            self.client.get_table(f'{self.dataset_id}.person_ids').num_rows, 6)
+
+        job = self.client.query(query,
+                                job_config=self.job_config(
+                                    'person_ids', WRITE_EMPTY))
+        self.assertRaises(BadRequest, job.result)
+
+        self.client.query(query + ' WHERE person_id = 1',
+                          job_config=self.job_config('person_ids',
+                                                     WRITE_TRUNCATE)).result()
+        self.assertEqual(
+            self.client.get_table(f'{self.dataset_id}.person_ids').num_rows, 1)
+
+    def test_tables_shim(self):
+        self.client.create_tables(self.dataset_id, ['observation'])
+
+        rows = self.client.query(
+            f'SELECT table_id, row_count FROM '
+            f'`{self.project_id}.{self.dataset_id}.__TABLES__` '
+            f'ORDER BY table_id').result()
+
+        self.assertEqual([tuple(row.values()) for row in rows],
+                         [('observation', 0), ('person', 3)])
+        self.assertEqual([
+            table.table_id for table in self.client.list_tables(self.dataset_id)
+        ], ['observation', 'person'])
+
+    def test_tables(self):
+        table = self.client.get_table(
+            f'{self.project_id}.{self.dataset_id}.person')
+        fields = {field.name: field for field in table.schema}
+        self.assertEqual(fields['person_id'].field_type, 'INTEGER')
+        self.assertEqual(fields['person_id'].mode, 'REQUIRED')
+        self.assertEqual(fields['birth_datetime'].field_type, 'TIMESTAMP')
+
+        self.assertRaises(Conflict, self.client.create_table, table)
+        self.client.copy_table(f'{self.dataset_id}.person',
+                               f'{self.sandbox_dataset_id}.person_copy')
+        self.assertEqual(
+            self.client.get_table(
+                f'{self.sandbox_dataset_id}.person_copy').num_rows, 3)
+
+        self.client.delete_table(f'{self.sandbox_dataset_id}.person_copy')
+        self.assertRaises(NotFound, self.client.get_table,
+                          f'{self.sandbox_dataset_id}.person_copy')
+        self.client.delete_table(f'{self.sandbox_dataset_id}.person_copy',
+                                 not_found_ok=True)
+
+    def test_clean_dataset(self):
+        jobs = clean_cdr_engine.clean_dataset(self.project_id,
+                                              self.dataset_id,
+                                              self.sandbox_dataset_id,
+                                              [(RemoveOldPersons,)],
+                                              client=self.client)
+
+        self.assertEqual(len(jobs), 2)
+        person_ids = self.client.query(
+            f'SELECT person_id FROM `{self.dataset_id}.person` '
+            f'ORDER BY person_id').to_dataframe()['person_id'].tolist()
+        self.assertEqual(person_ids, [2, 3])
+        sandboxed = self.client.query(
+            f'SELECT person_id FROM `{self.sandbox_dataset_id}.old_person`'
+        ).to_dataframe()['person_id'].tolist()
+        self.assertEqual(sandboxed, [1])
+
+    def test_dataset_exists(self):
+        self.assertTrue(self.client.dataset_exists(self.dataset_id))
+        self.assertFalse(self.client.dataset_exists('missing_dataset'))
+
+    def test_local_only(self):
+        with duckdb_backend.local_only():
+            for connect in [
+                    lambda: bq.get_client(self.project_id),
+                    lambda: get_client(self.project_id),
+                    bq_utils.create_service, gcs_utils.create_service
+            ]:
+                self.assertRaises(client_cache.ServiceRefusedError, connect)
+            # the duckdb client still works
+            self.assertEqual(
+                self.client.get_table(f'{self.dataset_id}.person').num_rows, 3)
+        client_cache.check_allowed('bigquery.Client')
@@ -0,0 +1,97 @@
+"""
+Unit test for rule_profiler module
+"""
+# Python imports
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+# Project imports
+from cdr_cleaner import rule_profiler
+from cdr_cleaner.rule_profiler import (RuleProfiler, profiled, VALIDATION,
+                                       SETUP, QUERY_GENERATION, BIGQUERY)
+
+
+def build_lookup():
+    return [str(value) * 10 for value in range(5000)]
+
+
+class RuleProfilerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def run_rule(self, profiler):
+        for phase in [VALIDATION, SETUP, QUERY_GENERATION, BIGQUERY]:
+            with profiler.phase(1, 'FakeRule', phase):
+                build_lookup()
+
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, RuleProfiler, 'disk', self.output_dir)
+
+    def test_cpu_profile(self):
+        profiler = RuleProfiler(rule_profiler.CPU, self.output_dir, top=5)
+        self.run_rule(profiler)
+
+        key = (1, 'FakeRule')
+        self.assertEqual(set(profiler.seconds[key]),
+                         {VALIDATION, SETUP, QUERY_GENERATION, BIGQUERY})
+        # waiting on BigQuery is timed but not profiled
+        self.assertEqual(set(profiler.profiles[key]),
+                         {VALIDATION, SETUP, QUERY_GENERATION})
+        self.assertAlmostEqual(
+            profiler.python_seconds(key),
+            sum(profiler.seconds[key][phase]
+                for phase in rule_profiler.PYTHON_PHASES))
+
+        paths = profiler.write_reports()
+        self.assertEqual([os.path.basename(path) for path in paths], [
+            '001_FakeRule.txt', '001_FakeRule.prof',
+            rule_profiler.SUMMARY_FILENAME
+        ])
+        with open(paths[0]) as report_file:
+            report = report_file.read()
+        self.assertIn('bigquery', report)
+        self.assertIn('(not profiled)', report)
+        self.assertIn('build_lookup', report)
+        with open(paths[-1]) as summary_file:
+            self.assertIn('FakeRule', summary_file.read())
+
+    def test_memory_profile(self):
+        profiler = RuleProfiler(rule_profiler.MEMORY, self.output_dir, top=5)
+        self.run_rule(profiler)
+
+        peak, statistics = profiler.profiles[(1, 'FakeRule')][SETUP]
+        self.assertGreater(peak, 0)
+        self.assertTrue(statistics)
+
+        paths = profiler.write_reports()
+        self.assertEqual([os.path.basename(path) for path in paths],
+                         ['001_FakeRule.txt', rule_profiler.SUMMARY_FILENAME])
+        with open(paths[0]) as report_file:
+            self.assertIn('peak', report_file.read())
+
+    def test_memory_peak_per_phase(self):
+        profiler = RuleProfiler(rule_profiler.MEMORY, self.output_dir)
+        with profiler.phase(1, 'FakeRule', SETUP):
+            build_lookup()
+        with profiler.phase(1, 'FakeRule', QUERY_GENERATION):
+            [0] * 10
+
+        profiles = profiler.profiles[(1, 'FakeRule')]
+        # the peak of a phase does not include earlier phases
+        self.assertLess(profiles[QUERY_GENERATION][0] * 10, profiles[SETUP][0])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_profiled_without_profiler(self):
+        with profiled(None, 1, 'FakeRule', SETUP):
+            build_lookup()
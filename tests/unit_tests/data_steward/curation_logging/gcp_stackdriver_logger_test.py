@@ -13,6 +13,7 @@ import pytz
 
 from curation_logging import curation_gae_handler
 from curation_logging.curation_gae_handler import GCPStackDriverLogger, LogCompletionStatusEnum
+from curation_logging.curation_gae_handler import FakeLoggingClient, LogEntryFlusher
 from curation_logging.curation_gae_handler import GAE_LOGGING_MODULE_ID, GAE_LOGGING_VERSION_ID
 
 LOG_BUFFER_SIZE = 3
@@ -195,6 +196,81 @@ class GCPStackDriverLoggerTest(unittest.TestCase):
         self.assertEqual(self.gcp_stackdriver_logger._request_log_id, None)
         self.assertEqual(self.gcp_stackdriver_logger._trace, None)
 
+    @mock.patch('curation_logging.curation_gae_handler.datetime')
+    @mock.patch('curation_logging.curation_gae_handler.setup_logging_zone')
+    def test_gcp_stackdriver_logger_flusher(self, mock_setup_logging_zone,
+                                            mock_datetime):
+        mock_datetime.now.return_value.isoformat.return_value = self.request_start_time.isoformat(
+        )
+        mock_datetime.utcnow.return_value = self.request_start_time
+        mock_datetime.utcfromtimestamp.return_value = self.log_record_created
+        mock_setup_logging_zone.return_value = 'test time zone'
+        fake_client = FakeLoggingClient()
+        flusher = LogEntryFlusher(fake_client, flush_interval=60)
+        self.addCleanup(flusher.close)
+
+        gcp_stackdriver_logger = GCPStackDriverLogger(LOG_BUFFER_SIZE,
+                                                      flusher=flusher)
+        gcp_stackdriver_logger.setup_from_request(self.request)
+        for _ in range(2):
+            gcp_stackdriver_logger.log_event(self.info_log_record)
+            gcp_stackdriver_logger.log_event(self.debug_log_record)
+            gcp_stackdriver_logger.log_event(self.error_log_record)
+        gcp_stackdriver_logger.log_event(self.info_log_record)
+        gcp_stackdriver_logger.finalize()
+
+        self.assertTrue(flusher.flush(timeout=5))
+        # the zone is looked up once per logger, not once per log entry
+        self.assertEqual(mock_setup_logging_zone.call_count, 1)
+        # all entries were built in the request thread and sent in one batch
+        self.assertEqual(len(fake_client.calls), 1)
+        log_name, entries = fake_client.calls[0]
+        self.assertEqual(
+            log_name,
+            curation_gae_handler.LOG_NAME_TEMPLATE.format(
+                project_id=self.project_id))
+
+        expected_operations = [
+            curation_gae_handler.update_long_operation(self.request_log_id,
+                                                       status)
+            for status in (LogCompletionStatusEnum.PARTIAL_BEGIN,
+                           LogCompletionStatusEnum.PARTIAL_MORE,
+                           LogCompletionStatusEnum.PARTIAL_FINISHED)
+        ]
+        self.assertEqual([entry.operation for entry in entries],
+                         expected_operations)
+        self.mock_logging_service_client.assert_not_called()
+
+    def test_log_entry_flusher(self):
+        fake_client = FakeLoggingClient()
+        flusher = LogEntryFlusher(fake_client,
+                                  flush_interval=0.01,
+                                  batch_size=2)
+        for index in range(5):
+            flusher.submit(index, 'log_a' if index < 3 else 'log_b')
+
+        # the flush interval sends partial batches without closing the flusher
+        self.assertTrue(flusher.flush(timeout=5))
+        self.assertEqual(fake_client.entries, [0, 1, 2, 3, 4])
+        self.assertTrue(
+            all(len(entries) <= 2 for _, entries in fake_client.calls))
+        self.assertEqual([log_name for log_name, _ in fake_client.calls],
+                         sorted(log_name for log_name, _ in fake_client.calls))
+
+        flusher.close()
+        # entries submitted after closing are sent in the calling thread
+        flusher.submit(5, 'log_a')
+        self.assertEqual(fake_client.calls[-1], ('log_a', [5]))
+
+    def test_log_entry_flusher_failures(self):
+        failing_client = MagicMock()
+        failing_client.write_log_entries.side_effect = RuntimeError('boom')
+        flusher = LogEntryFlusher(failing_client, flush_interval=0.01)
+        flusher.submit('entry', 'log_a')
+        self.assertTrue(flusher.flush(timeout=5))
+        flusher.close()
+        self.assertEqual(flusher.failed, 1)
+
     @mock.patch('curation_logging.curation_gae_handler.get_gcp_logger')
     def test_initialize_logging(self, mock_get_gcp_logger):
         with patch.dict('os.environ', {'GAE_ENV': ''}):
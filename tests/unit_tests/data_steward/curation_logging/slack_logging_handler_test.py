@@ -15,11 +15,15 @@ Notes: -- if dev is using macOS and gets error:
 # Python imports
 import os
 import logging
+import threading
+import time
 import mock
 import unittest
 
 # Project imports
-from curation_logging.slack_logging_handler import initialize_slack_logging, SlackLoggingHandler
+from curation_logging.slack_logging_handler import (initialize_slack_logging,
+                                                    SlackLoggingHandler,
+                                                    AsyncSlackLoggingHandler)
 from utils.slack_alerts import SLACK_TOKEN, SLACK_CHANNEL
 
 GAE_ENV = 'GAE_ENV'
@@ -46,8 +50,17 @@ class SlackLoggingHandlerTest(unittest.TestCase):
             handler for handler in root_logger.handlers
             if not isinstance(handler, SlackLoggingHandler)
         ]
+        for handler in root_logger.handlers:
+            if isinstance(handler, SlackLoggingHandler):
+                handler.close()
         root_logger.handlers = handlers
 
+    def _slack_handlers(self):
+        return [
+            handler for handler in logging.getLogger().handlers
+            if isinstance(handler, SlackLoggingHandler)
+        ]
+
     @mock.patch.dict('os.environ', {
         SLACK_CHANNEL: TEST_CHANNEL_NAME,
         SLACK_TOKEN: SLACK_TOKEN
@@ -68,8 +81,139 @@ class SlackLoggingHandlerTest(unittest.TestCase):
         logging.critical(CRITICAL_MESSAGE)
         logging.error(ERROR_MESSAGE)
 
+        # messages are posted from a background thread
+        for handler in self._slack_handlers():
+            handler.flush()
         self.assertEqual(mock_post_message.call_count, 3)
 
         mock_post_message.assert_any_call(WARNING_MESSAGE)
         mock_post_message.assert_any_call(CRITICAL_MESSAGE)
         mock_post_message.assert_any_call(ERROR_MESSAGE)
+
+    @mock.patch.dict('os.environ', {
+        SLACK_CHANNEL: TEST_CHANNEL_NAME,
+        SLACK_TOKEN: SLACK_TOKEN
+    },
+                     clear=True)
+    @mock.patch('curation_logging.slack_logging_handler.time.sleep')
+    @mock.patch('curation_logging.slack_logging_handler.post_message')
+    def test_async_slack_logging_handler(self, mock_post_message, mock_sleep):
+        handler = AsyncSlackLoggingHandler(coalesce_window=60,
+                                           min_post_interval=1)
+        logger = logging.getLogger('async_slack_test')
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        for _ in range(5):
+            logger.warning(WARNING_MESSAGE)
+        logger.error('%s', ERROR_MESSAGE)
+        handler.flush()
+
+        # duplicates within the window are only posted once
+        self.assertListEqual(
+            mock_post_message.call_args_list,
+            [mock.call(WARNING_MESSAGE),
+             mock.call(ERROR_MESSAGE)])
+        # posts to the channel are spaced out
+        mock_sleep.assert_called_once()
+        self.assertLessEqual(mock_sleep.call_args[0][0], 1)
+
+        # repeats are posted when the handler is closed
+        handler.close()
+        mock_post_message.assert_called_with(
+            f'{WARNING_MESSAGE} (repeated 4 more time(s))')
+        self.assertEqual(mock_post_message.call_count, 3)
+
+    @mock.patch.dict('os.environ', {
+        SLACK_CHANNEL: TEST_CHANNEL_NAME,
+        SLACK_TOKEN: SLACK_TOKEN
+    },
+                     clear=True)
+    @mock.patch('curation_logging.slack_logging_handler.post_message')
+    def test_async_slack_logging_handler_forgets_expired(
+        self, mock_post_message):
+        handler = AsyncSlackLoggingHandler(coalesce_window=0.05,
+                                           min_post_interval=0)
+        logger = logging.getLogger('async_slack_expiry_test')
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        for _ in range(3):
+            logger.warning(WARNING_MESSAGE)
+        handler.flush()
+        time.sleep(0.1)
+        logger.error('%s', ERROR_MESSAGE)
+        handler.flush()
+
+        # repeats of a message whose window passed are posted with the next post
+        self.assertListEqual(mock_post_message.call_args_list, [
+            mock.call(WARNING_MESSAGE),
+            mock.call(ERROR_MESSAGE),
+            mock.call(f'{WARNING_MESSAGE} (repeated 2 more time(s))')
+        ])
+        self.assertListEqual(list(handler._last_posted), [ERROR_MESSAGE])
+        self.assertFalse(handler._repeats)
+        handler.close()
+        self.assertEqual(mock_post_message.call_count, 3)
+
+    @mock.patch.dict('os.environ', {
+        SLACK_CHANNEL: TEST_CHANNEL_NAME,
+        SLACK_TOKEN: SLACK_TOKEN
+    },
+                     clear=True)
+    @mock.patch('curation_logging.slack_logging_handler.post_message')
+    def test_async_slack_logging_handler_does_not_block(self,
+                                                        mock_post_message):
+        posting = threading.Event()
+        release = threading.Event()
+
+        def slow_post(text):
+            posting.set()
+            release.wait(10)
+
+        mock_post_message.side_effect = slow_post
+        handler = AsyncSlackLoggingHandler(min_post_interval=0, max_queued=2)
+        logger = logging.getLogger('async_slack_blocking_test')
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        logger.warning('first')
+        self.assertTrue(posting.wait(10))
+        # logging does not wait on slack and drops messages once the queue is full
+        for i in range(5):
+            logger.warning(f'message {i}')
+        self.assertEqual(handler.dropped, 3)
+
+        release.set()
+        handler.close()
+        self.assertEqual(mock_post_message.call_count, 3)
+
+    @mock.patch.dict('os.environ', {
+        SLACK_CHANNEL: TEST_CHANNEL_NAME,
+        SLACK_TOKEN: SLACK_TOKEN
+    },
+                     clear=True)
+    @mock.patch('curation_logging.slack_logging_handler.post_message')
+    def test_async_slack_logging_handler_survives_errors(
+        self, mock_post_message):
+        mock_post_message.side_effect = [ValueError('unexpected'), None]
+        handler = AsyncSlackLoggingHandler(min_post_interval=0)
+        logger = logging.getLogger('async_slack_error_test')
+        logger.propagate = False
+        # assertLogs raises the root level, which this logger would inherit
+        logger.setLevel(logging.WARNING)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        with self.assertLogs(level='ERROR'):
+            logger.warning('first')
+            handler.flush()
+        # the worker keeps posting after an unexpected error
+        logger.warning('second')
+        handler.flush()
+        mock_post_message.assert_called_with('second')
+        self.assertEqual(mock_post_message.call_count, 2)
+        handler.close()
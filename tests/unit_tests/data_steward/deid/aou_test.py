@@ -0,0 +1,173 @@
+"""
+Unit test for the aou module
+
+Ensures BigQuery clients and dataset checks are reused within a run and
+that pipelined statements are dry-run before any are executed.
+"""
+# Python imports
+import unittest
+
+# Third party imports
+from google.api_core.exceptions import BadRequest
+from mock import MagicMock, patch
+
+# Project imports
+import constants.bq_utils as bq_consts
+from deid import aou
+from deid.aou import ensure_dataset, get_client
+
+
+class AOUTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        aou._CLIENTS.clear()
+        aou._DATASETS.clear()
+        aou._KEY_LOCKS.clear()
+
+        self.client = MagicMock()
+        self.client.project = 'foo_project'
+
+        mock_client = patch('deid.aou.get_client', return_value=self.client)
+        mock_client.start()
+        self.addCleanup(mock_client.stop)
+
+        mock_dataset = patch('deid.aou.ensure_dataset')
+        self.mock_ensure_dataset = mock_dataset.start()
+        self.addCleanup(mock_dataset.stop)
+
+        mock_create = patch('deid.aou.bq_utils.create_standard_table')
+        self.mock_create_table = mock_create.start()
+        self.addCleanup(mock_create.stop)
+
+        # avoid reading rule and service account files
+        self.handle = aou.AOU.__new__(aou.AOU)
+        self.handle.idataset = 'foo_input'
+        self.handle.odataset = 'foo_input_deid'
+        self.handle.tablename = 'observation'
+        self.handle.logpath = 'fake_logs'
+        self.handle.private_key = 'fake/SA/file/path.json'
+        self.handle.priority = 'BATCH'
+        self.handle.partition = False
+        self.handle.pipelined_jobs = True
+        self.handle._make_log_path = MagicMock()
+
+        self.events = []
+
+        def query(sql, location=None, job_config=None):
+            self.events.append(('dry_run' if job_config.dry_run else 'execute',
+                                sql, job_config.write_disposition))
+            job = MagicMock()
+            job.state = 'DONE'
+            job.job_id = sql
+            job.result.side_effect = lambda: self.events.append(
+                ('done', sql, None))
+            return job
+
+        self.client.query.side_effect = query
+
+    @patch('deid.aou.bq.Client')
+    def test_get_client(self, mock_client):
+        client = get_client('key.json')
+        self.assertIs(client, get_client('key.json'))
+        mock_client.from_service_account_json.assert_called_once_with(
+            'key.json')
+
+    def test_ensure_dataset(self):
+        client = MagicMock()
+        client.project = 'foo_project'
+        client.list_datasets.return_value = []
+
+        ensure_dataset(client, 'foo_input_deid')
+        ensure_dataset(client, 'foo_input_deid')
+
+        client.list_datasets.assert_called_once_with()
+        self.assertEqual(client.create_dataset.call_count, 1)
+
+    def test_ensure_dataset_does_not_block_other_datasets(self):
+        client = MagicMock()
+        client.project = 'foo_project'
+        lock_held = []
+
+        def list_datasets():
+            # other threads may use the cache during the API call
+            lock_held.append(aou._CACHE_LOCK.locked())
+            return []
+
+        client.list_datasets.side_effect = list_datasets
+
+        ensure_dataset(client, 'foo_input_deid')
+        ensure_dataset(client, 'foo_output_deid')
+
+        self.assertEqual(lock_held, [False, False])
+        self.assertEqual(client.create_dataset.call_count, 2)
+
+    def test_submit_statements_pipelined(self):
+        sql = ['create', 'append1', 'append2']
+        dml_sql = ['delete']
+
+        self.handle.submit_statements(sql, dml_sql)
+
+        # every statement is dry-run before any statement executes
+        kinds = [event[0] for event in self.events]
+        self.assertEqual(kinds[:4], ['dry_run'] * 4)
+        self.assertNotIn('dry_run', kinds[4:])
+        self.mock_create_table.assert_called_once_with(
+            'observation',
+            'observation',
+            drop_existing=True,
+            dataset_id='foo_input_deid')
+
+        executed = [event[1:] for event in self.events if event[0] == 'execute']
+        self.assertEqual(executed[0], ('create', bq_consts.WRITE_EMPTY))
+        self.assertCountEqual(executed[1:3],
+                              [('append1', bq_consts.WRITE_APPEND),
+                               ('append2', bq_consts.WRITE_APPEND)])
+        self.assertEqual(executed[3][0], 'delete')
+
+        # the creating statement finishes before appends are executed
+        self.assertLess(self.events.index(('done', 'create', None)),
+                        executed_index(self.events, 'append1'))
+        # appends are executed together and finish before the dml statement
+        self.assertLess(executed_index(self.events, 'append2'),
+                        self.events.index(('done', 'append1', None)))
+        self.assertLess(self.events.index(('done', 'append2', None)),
+                        executed_index(self.events, 'delete'))
+
+    def test_submit_statements_skips_failed_dry_runs(self):
+        query = self.client.query.side_effect
+
+        def failing_query(sql, location=None, job_config=None):
+            if sql == 'append1' and job_config.dry_run:
+                raise BadRequest('bad sql')
+            return query(sql, location=location, job_config=job_config)
+
+        self.client.query.side_effect = failing_query
+
+        self.handle.submit_statements(['create', 'append1', 'append2'], [])
+
+        executed = [event[1] for event in self.events if event[0] == 'execute']
+        self.assertEqual(executed, ['create', 'append2'])
+
+    def test_wait_all_raises_after_all_jobs(self):
+        failed = MagicMock()
+        failed.result.side_effect = BadRequest('failed')
+        passed = MagicMock()
+
+        self.assertRaises(BadRequest, self.handle.wait_all, [failed, passed])
+        passed.result.assert_called_once_with()
+
+
+def executed_index(events, sql):
+    """
+    Get the position of a statement's execution in the recorded events.
+    """
+    for index, event in enumerate(events):
+        if event[0] == 'execute' and event[1] == sql:
+            return index
+    return None
@@ -65,6 +65,11 @@ class ParserTest(unittest.TestCase):
         # setting correct_parameter_dict values not set in setUp function
         correct_parameter_dict['cluster'] = False
         correct_parameter_dict['age_limit'] = MAX_AGE
+        correct_parameter_dict['pipelined_jobs'] = False
+        correct_parameter_dict['batched_simulation'] = False
+        correct_parameter_dict['simulation_sample'] = None
+        correct_parameter_dict['plan_cache'] = False
+        correct_parameter_dict['fuse_segments'] = False
 
         # Test if correct parameters are given
         results_dict = parse_args(self.correct_parameter_list)
@@ -1,11 +1,17 @@
 # Python imports
+import os
+import shutil
+import tempfile
 import unittest
+from json import loads
 
 # Third party imports
+import pandas as pd
 from mock import patch
 
 # Project imports
 from deid.press import Press
+from deid.rules import Deid
 
 
 class BasePass(Press):
@@ -90,3 +96,256 @@ class PressTest(unittest.TestCase):
         # post conditions
         expected = ['delete * from ' + table_path]
         self.assertEqual(result, expected)
+
+    @patch.object(BasePass, '_write_simulation')
+    @patch.object(BasePass, 'get_dataframe')
+    def test_simulate_batched(self, mock_dataframe, mock_write):
+        # pre-conditions
+        self.press_obj.pipeline = ['generalize', 'suppress', 'shift', 'compute']
+        self.press_obj.deid_rules['suppress']['FILTERS'] = [{
+            'filter': 'value_source_concept_id NOT IN (1, 2)'
+        }]
+        self.press_obj.batched_simulation = True
+        self.press_obj.simulation_sample = 10
+        info = [{
+            'label': 'generalize.RACE',
+            'name': 'value_source_concept_id',
+            'apply': 'CASE WHEN 1=1 THEN 2000000008 END',
+            'on': 'observation_source_concept_id = 1586140'
+        }, {
+            'label': 'shift.date',
+            'name': 'observation_date',
+            'apply': 'DATE_SUB(observation_date, INTERVAL 1 DAY)'
+        }, {
+            'label': 'suppress.DEMOGRAPHICS-COLUMNS',
+            'name': 'value_as_string',
+            'apply': 'NULL'
+        }]
+        mock_dataframe.return_value = pd.DataFrame({
+            'attribute': [
+                'value_source_concept_id', 'observation_date',
+                '__row_suppression__'
+            ],
+            'task': ['GENERALIZE RACE', 'SHIFT DATE', 'ROW SUPPRESSION'],
+            'original': ['1586142', '2020-01-02', '10'],
+            'transformed': ['2000000008', '2020-01-01', '3']
+        })
+
+        # test
+        self.press_obj.simulate(info)
+
+        # post conditions
+        self.assertEqual(mock_dataframe.call_count, 1)
+        sql = mock_dataframe.call_args[1]['sql']
+        self.assertEqual(sql.count('UNION ALL'), 2)
+        self.assertIn('TABLESAMPLE SYSTEM (10 PERCENT)', sql)
+        self.assertIn('LIMIT 5', sql)
+        self.assertNotIn('value_as_string', sql)
+
+        out, counts, suppressed_counts = mock_write.call_args[0]
+        self.assertEqual(list(out.columns),
+                         ['original', 'transformed', 'attribute', 'task'])
+        self.assertEqual(out['attribute'].tolist(),
+                         ['value_source_concept_id', 'observation_date'])
+        self.assertEqual(counts, {'generalize': 1, 'shift': 1, 'suppress': 1})
+        self.assertEqual(suppressed_counts, [3])
+
+    @patch.object(BasePass, '_write_simulation')
+    @patch.object(BasePass, 'get_dataframe')
+    def test_simulate_batched_with_rules(self, mock_dataframe, mock_write):
+        # pre-conditions
+        self.press_obj.pipeline = ['generalize', 'shift']
+        self.press_obj.batched_simulation = True
+        mock_dataframe.return_value = pd.DataFrame()
+        rules = Deid(
+            rules={
+                'suppress': {
+                    'FILTERS': [{
+                        'filter': 'person_id > 0',
+                        'label': 'suppress.ROWS'
+                    }]
+                }
+            })
+        # the rules alias their apply expressions
+        info = rules.generalize(fields=['value_source_concept_id'],
+                                label='generalize.RACE',
+                                store='bigquery',
+                                rules=[{
+                                    'values': [1586142],
+                                    'into': 2000000008,
+                                    'qualifier': 'IN'
+                                }])
+        info += rules.shift(fields=['observation_date'],
+                            label='shift.date',
+                            rules='DATE_SUB(:FIELD, INTERVAL 1 DAY) AS :FIELD')
+        info += rules.shift(fields=['value_as_string'],
+                            label='shift.meta',
+                            on='observation_source_concept_id = 1585250',
+                            rules='DATE_SUB(:FIELD, INTERVAL 1 DAY) AS :FIELD')
+
+        # test
+        self.press_obj.simulate(info)
+
+        # post conditions
+        sql = mock_dataframe.call_args[1]['sql']
+        self.assertIn(
+            'CAST(CASE WHEN value_source_concept_id IN (1586142) THEN '
+            '2000000008 ELSE value_source_concept_id END AS STRING) '
+            'AS transformed', sql)
+        self.assertIn(
+            'CAST(DATE_SUB(observation_date, INTERVAL 1 DAY) AS STRING) '
+            'AS transformed', sql)
+        self.assertIn(
+            'CAST(CAST( DATE_SUB(value_as_string, INTERVAL 1 DAY) AS STRING ) '
+            'AS STRING) AS transformed', sql)
+        for field in ['value_source_concept_id', 'observation_date']:
+            self.assertNotIn(f'AS {field} AS STRING', sql)
+
+    @patch('deid.press.bq_utils.get_table_info')
+    def test_get_plan_key(self, mock_info):
+        # pre-conditions
+        mock_info.return_value = {
+            'schema': {
+                'fields': [{
+                    'name': 'person_id',
+                    'type': 'integer'
+                }]
+            }
+        }
+
+        # test
+        key = self.press_obj.get_plan_key()
+
+        # post conditions
+        self.assertEqual(key, self.press_obj.get_plan_key())
+        mock_info.return_value['schema']['fields'][0]['type'] = 'string'
+        self.assertNotEqual(key, self.press_obj.get_plan_key())
+
+    @patch.object(BasePass, 'get_plan_key')
+    @patch.object(BasePass, 'compile')
+    def test_get_plan(self, mock_compile, mock_key):
+        # pre-conditions
+        log_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_path)
+        self.press_obj.logpath = log_path
+        self.press_obj.plan_cache = True
+        self.mock_read_json.side_effect = loads
+        mock_key.return_value = 'abc123'
+        plan = {
+            'info': [{
+                'label': 'shift.date',
+                'name': 'observation_date',
+                'apply': 'observation_date'
+            }],
+            'sql': ['SELECT observation_date FROM foo_input.bar_table'],
+            'dml_sql': [],
+            'pipeline': ['shift', 'dml_statements'],
+            'filters': [{
+                'filter': 'person_id > 0'
+            }]
+        }
+        mock_compile.return_value = plan
+
+        # test
+        first = self.press_obj.get_plan()
+        self.press_obj.pipeline = None
+        second = self.press_obj.get_plan()
+
+        # post conditions
+        self.assertEqual(mock_compile.call_count, 1)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(log_path, 'plans', 'bar_table-abc123.json')))
+        self.assertEqual(first, plan)
+        self.assertEqual(second, plan)
+        self.assertEqual(self.press_obj.pipeline, plan['pipeline'])
+        self.assertEqual(self.press_obj.deid_rules['suppress']['FILTERS'],
+                         plan['filters'])
+
+    @patch.object(BasePass, 'compile')
+    def test_get_plan_without_cache(self, mock_compile):
+        # test
+        result = self.press_obj.get_plan()
+
+        # post conditions
+        self.assertEqual(result, mock_compile.return_value)
+
+    def test_union_segments(self):
+        # pre-conditions
+        segments = [
+            'SELECT a, b FROM foo_input.bar_table WHERE a = 1',
+            'SELECT a, b FROM foo_input.bar_table WHERE a = 2',
+            'SELECT a, b FROM foo_input.bar_table WHERE a NOT IN (1, 2)'
+        ]
+
+        # test
+        result = self.press_obj.union_segments(segments)
+
+        # post conditions
+        expected = ('SELECT * FROM (' + segments[0] + ')\nUNION ALL\n'
+                    'SELECT * FROM (' + segments[1] + ')\nUNION ALL\n'
+                    'SELECT * FROM (' + segments[2] + ')')
+        self.assertEqual(result, expected)
+
+    @patch.object(BasePass, '_write_simulation')
+    @patch.object(BasePass, 'get_dataframe')
+    def test_simulate_batched_with_rules(self, mock_dataframe, mock_write):
+        # pre-conditions
+        self.press_obj.pipeline = ['generalize', 'shift']
+        self.press_obj.batched_simulation = True
+        mock_dataframe.return_value = pd.DataFrame()
+        rules = Deid(
+            rules={
+                'suppress': {
+                    'FILTERS': [{
+                        'filter': 'person_id > 0',
+                        'label': 'suppress.ROWS'
+                    }]
+                }
+            })
+        # the rules alias their apply expressions
+        info = rules.generalize(fields=['value_source_concept_id'],
+                                label='generalize.RACE',
+                                store='bigquery',
+                                rules=[{
+                                    'values': [1586142],
+                                    'into': 2000000008,
+                                    'qualifier': 'IN'
+                                }])
+        info += rules.shift(fields=['observation_date'],
+                            label='shift.date',
+                            rules='DATE_SUB(:FIELD, INTERVAL 1 DAY) AS :FIELD')
+        info += rules.shift(fields=['value_as_string'],
+                            label='shift.meta',
+                            on='observation_source_concept_id = 1585250',
+                            rules='DATE_SUB(:FIELD, INTERVAL 1 DAY) AS :FIELD')
+
+        # test
+        self.press_obj.simulate(info)
+
+        # post conditions
+        sql = mock_dataframe.call_args[1]['sql']
+        self.assertIn(
+            'CAST(CASE WHEN value_source_concept_id IN (1586142) THEN '
+            '2000000008 ELSE value_source_concept_id END AS STRING) '
+            'AS transformed', sql)
+        self.assertIn(
+            'CAST(DATE_SUB(observation_date, INTERVAL 1 DAY) AS STRING) '
+            'AS transformed', sql)
+        self.assertIn(
+            'CAST(CAST( DATE_SUB(value_as_string, INTERVAL 1 DAY) AS STRING ) '
+            'AS STRING) AS transformed', sql)
+        for field in ['value_source_concept_id', 'observation_date']:
+            self.assertNotIn(f'AS {field} AS STRING', sql)
+
+    @patch('deid.press.bq_utils.get_table_info')
+    def test_get_plan_key_fuse_segments(self, mock_info):
+        # pre-conditions
+        mock_info.return_value = {}
+        key = self.press_obj.get_plan_key()
+
+        # test
+        self.press_obj.fuse_segments = True
+
+        # post conditions
+        self.assertNotEqual(key, self.press_obj.get_plan_key())
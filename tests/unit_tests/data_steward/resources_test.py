@@ -1,6 +1,8 @@
 import json
 import mock
 import os
+import shutil
+import tempfile
 import unittest
 
 import common
@@ -15,6 +17,12 @@ class ResourcesTest(unittest.TestCase):
         print(cls.__name__)
         print('**************************************************************')
 
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
     def test_cdm_schemas(self):
         schemas = resources.cdm_schemas()
         table_names = schemas.keys()
@@ -90,26 +98,67 @@ class ResourcesTest(unittest.TestCase):
         """
         # preconditions
         sub_dir = 'baz'
+        schemas_path = os.path.join('resource_files', 'schemas')
         # mocks result tuples for os.walk
-        walk_results = [(os.path.join('resource_files', 'schemas'), [sub_dir],
-                         ['duplicate.json', 'unique1.json']),
-                        (os.path.join('resource_files', 'schemas', sub_dir), [],
-                         ['duplicate.json', 'unique2.json'])]
+        walk_results = [
+            (schemas_path, [sub_dir], ['duplicate.json', 'unique1.json']),
+            (os.path.join(schemas_path,
+                          sub_dir), [], ['duplicate.json', 'unique2.json'])
+        ]
 
         mock_walk.return_value = walk_results
 
+        data = '[{"name": "fake_id", "type": "integer"}]'
+        json_data = json.loads(data)
+        with mock.patch('resources.open', mock.mock_open(read_data=data)):
+            registry = resources.SchemaRegistry.from_files(schemas_path)
+
         # test
-        self.assertRaises(RuntimeError, resources.fields_for, 'duplicate')
+        self.assertListEqual(registry.duplicates, ['duplicate'])
+        self.assertRaises(RuntimeError, registry.get, 'duplicate')
+        self.assertRaises(RuntimeError, registry.get, 'missing')
 
         # test
-        data = '[{"id": "fake id desc", "type": "fake type"}]'
-        json_data = json.loads(data)
-        with mock.patch('resources.open',
-                        mock.mock_open(read_data=data)) as mock_file:
-            with mock.patch('resources.json.load') as mock_json:
-                mock_json.return_value = json_data
-                actual_fields = resources.fields_for('duplicate', sub_dir)
-                self.assertEqual(actual_fields, json_data)
+        actual_schema = registry.get('duplicate', sub_dir)
+        self.assertEqual(actual_schema.sub_path, sub_dir)
+        self.assertEqual(actual_schema.to_json(), json_data)
+        self.assertEqual(registry.get('unique1').sub_path, '')
+
+    def test_schema_for(self):
+        schema = resources.schema_for('person')
+
+        self.assertEqual(schema.to_json(), resources.fields_for('person'))
+        self.assertListEqual([field.name for field in schema.bq_fields],
+                             [field['name'] for field in schema.fields])
+        with self.assertRaises(TypeError):
+            schema.fields[0]['name'] = 'changed'
+
+        # callers get copies they are free to modify
+        fields = resources.fields_for('person')
+        fields[0]['name'] = 'changed'
+        fields.append({'name': 'extra'})
+        self.assertEqual(resources.fields_for('person'), schema.to_json())
+
+    def test_schema_index(self):
+        registry = resources.SchemaRegistry.from_files()
+        index_path = os.path.join(self.temp_dir, 'schema_index.json')
+
+        self.assertIsNone(resources.SchemaRegistry.from_index(index_path))
+
+        registry.write_index(index_path)
+        indexed = resources.SchemaRegistry.from_index(index_path)
+        self.assertEqual(indexed.get('person'), registry.get('person'))
+        self.assertListEqual(
+            [schema.name for schema in indexed.schemas_in('cdm')],
+            [schema.name for schema in registry.schemas_in('cdm')])
+
+        # an index written for different schema files is ignored
+        with open(index_path, 'r') as fp:
+            index = json.load(fp)
+        index['signature'][0][1] += 1
+        with open(index_path, 'w') as fp:
+            json.dump(index, fp)
+        self.assertIsNone(resources.SchemaRegistry.from_index(index_path))
 
     def test_cdm_tables(self):
         expected = [
@@ -1,4 +1,8 @@
 import unittest
+from unittest import mock
+
+import pandas as pd
+from google.api_core.exceptions import BadRequest
 
 import common
 from retraction import participant_row_counts as prc
@@ -16,6 +20,7 @@ class ParticipantPrevalenceTest(RetractUtilsTest, unittest.TestCase):
 
     def setUp(self):
         super(ParticipantPrevalenceTest, self).setUp()
+        prc._TABLE_DFS.clear()
 
     def test_get_combined_deid_query(self):
         actual = prc.get_combined_deid_query(self.project_id,
@@ -106,3 +111,60 @@ class ParticipantPrevalenceTest(RetractUtilsTest, unittest.TestCase):
             table = tables[0]
             self.assertIn(table, self.ehr_tables)
             self.assertIn('COUNT(*) AS ehr_count', query)
+
+    def test_get_table_df(self):
+        client = mock.MagicMock()
+        client.query.return_value.to_dataframe.return_value = self.table_df
+
+        actual = prc.get_table_df(client, self.project_id, self.dataset_id)
+        self.assertIs(actual, self.table_df)
+        actual = prc.get_table_df(client, self.project_id, self.dataset_id)
+        self.assertIs(actual, self.table_df)
+        # metadata is only queried once per dataset
+        client.query.assert_called_once()
+
+    @mock.patch('retraction.participant_row_counts.bq.get_client')
+    @mock.patch('retraction.participant_row_counts.ru.get_dataset_ids_to_target'
+               )
+    def test_count_pid_rows_in_project(self, mock_dataset_ids, mock_client):
+        dataset_ids = ['combined20200101', 'bad_dataset', 'unioned_ehr20200101']
+        mock_dataset_ids.return_value = dataset_ids
+        client = mock_client.return_value
+
+        def query(q):
+            job = mock.MagicMock()
+            if 'INFORMATION_SCHEMA' in q:
+                if 'bad_dataset' in q:
+                    job.to_dataframe.side_effect = BadRequest('bad dataset')
+                else:
+                    job.to_dataframe.return_value = self.table_df
+            else:
+                dataset_id = 'combined' if 'combined' in q else 'unioned'
+                job.to_dataframe.return_value = pd.DataFrame({
+                    'table_id': [f'{dataset_id}_a', f'{dataset_id}_b'],
+                    consts.ALL_COUNT: [1, 2],
+                    consts.ALL_EHR_COUNT: [0, 1],
+                    consts.MAP_EHR_COUNT: [0, 1]
+                })
+            return job
+
+        client.query.side_effect = query
+
+        actual = prc.count_pid_rows_in_project(self.project_id,
+                                               self.hpo_id,
+                                               self.pid_table_str,
+                                               workers=2)
+
+        # one client is shared by all datasets
+        mock_client.assert_called_once_with(self.project_id)
+        self.assertListEqual(list(actual.columns), [
+            prc.DATASET_ID, 'table_id', consts.ALL_COUNT, consts.ALL_EHR_COUNT,
+            consts.MAP_EHR_COUNT
+        ])
+        self.assertListEqual(actual[prc.DATASET_ID].to_list(), [
+            'combined20200101', 'combined20200101', 'unioned_ehr20200101',
+            'unioned_ehr20200101'
+        ])
+        self.assertListEqual(
+            actual['table_id'].to_list(),
+            ['combined_b', 'combined_a', 'unioned_b', 'unioned_a'])
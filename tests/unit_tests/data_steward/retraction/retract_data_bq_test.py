@@ -228,3 +228,64 @@ class RetractDataBqTest(TestCase):
                 ]:
                     self.assertIn(str(0), query)
         self.assertSetEqual(expected_tables, actual_tables)
+
+    def test_plan_bq_retraction(self):
+        plan = rbq.plan_bq_retraction(
+            self.client, self.project_id, self.sandbox_dataset_id,
+            self.project_id, self.pid_table_id, rbq.NONE_STR, [
+                self.ehr_dataset_id, self.combined_dataset_id,
+                self.deid_dataset_id
+            ], self.retraction_type_2)
+
+        # ehr datasets are skipped when hpo_id is none
+        self.assertListEqual(plan[self.ehr_dataset_id], [])
+        for dataset_id, pid in [(self.combined_dataset_id, rbq.PERSON_ID),
+                                (self.deid_dataset_id, rbq.RESEARCH_ID)]:
+            self.assertEqual(len(plan[dataset_id]), 1)
+            script = plan[dataset_id][0]
+            # pids are read from the pid table once into the temp table
+            self.assertEqual(script.count(self.pid_table_id), 1)
+            self.assertIn(
+                f'SELECT DISTINCT {pid} AS pid\nFROM '
+                f'`{self.project_id}.{self.sandbox_dataset_id}.{self.pid_table_id}`',
+                script)
+            self.assertIn(f'SELECT pid FROM {rbq.RETRACTION_PID_TABLE}', script)
+            self.assertIn(
+                f'DELETE\nFROM `{self.project_id}.{dataset_id}.{common.FACT_RELATIONSHIP}`',
+                script)
+
+        plan = rbq.plan_bq_retraction(self.client,
+                                      self.project_id,
+                                      self.sandbox_dataset_id,
+                                      self.project_id,
+                                      self.pid_table_id,
+                                      self.hpo_id, [self.combined_dataset_id],
+                                      self.retraction_type_2,
+                                      scripted=False)
+        # one query per table, each reading the pid table directly
+        self.assertGreater(len(plan[self.combined_dataset_id]), 1)
+        for query in plan[self.combined_dataset_id]:
+            self.assertIn(self.pid_table_id, query)
+            self.assertNotIn(rbq.RETRACTION_PID_TABLE, query)
+
+    def test_run_retraction_plan(self):
+        plan = {'dataset_1': ['query_1', 'query_2'], 'dataset_2': ['script_1']}
+        jobs = {}
+        for query, rows in [('query_1', 1), ('query_2', 2), ('script_1', 0)]:
+            job = MagicMock()
+            job.num_child_jobs = 2 if query == 'script_1' else None
+            job.num_dml_affected_rows = rows
+            jobs[query] = job
+        child_jobs = [MagicMock(num_dml_affected_rows=5), MagicMock()]
+        child_jobs[1].num_dml_affected_rows = None
+        self.client.query.side_effect = lambda query: jobs[query]
+        self.client.list_jobs.return_value = child_jobs
+
+        actual = rbq.run_retraction_plan(self.client, plan, 2)
+
+        self.assertDictEqual(actual, {'dataset_1': 3, 'dataset_2': 5})
+        self.assertEqual(self.client.query.call_count, 3)
+        for job in jobs.values():
+            job.result.assert_called_once()
+        self.client.list_jobs.assert_called_once_with(
+            parent_job=jobs['script_1'].job_id)
@@ -0,0 +1,130 @@
+"""
+Unit test for the retract_data_gcs module
+
+Ensures records are retracted from CSV files that contain quoted fields,
+embedded commas and embedded newlines, and that files are only rewritten
+when rows are retracted.
+"""
+# Python imports
+import io
+import unittest
+
+# Third party imports
+import mock
+
+# Project imports
+import common
+from retraction import retract_data_gcs as rd
+
+
+class RetractDataGcsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.bucket = 'fake_bucket'
+        self.folder_prefix = 'fake/site_bucket/2020-01-01/'
+        self.pids = {17, 20}
+        self.observation = ('observation_id,person_id,value_as_string\r\n'
+                            '1,17,"retract, me"\r\n'
+                            '2,"18","keep\r\nme, too"\r\n'
+                            '\r\n'
+                            '3,20,"retract\nme"\n'
+                            '4,abc,keep non-integers\n'
+                            'ill-formed\n'
+                            '5,21,keep\n')
+        self.expected_observation = (
+            'observation_id,person_id,value_as_string\n'
+            '2,"18","keep\r\nme, too"\n'
+            '4,abc,keep non-integers\n'
+            'ill-formed\n'
+            '5,21,keep\n')
+
+        self.gcs_client = mock.MagicMock()
+        self.blobs = {}
+        self.uploads = {}
+
+        def blob(name, chunk_size=None):
+
+            def upload_from_file(file_obj, rewind=False, content_type=None):
+                if rewind:
+                    file_obj.seek(0)
+                self.uploads[name] = file_obj.read()
+
+            mock_blob = mock.MagicMock()
+            mock_blob.open.side_effect = lambda mode, chunk_size=None: io.BytesIO(
+                self.blobs[name])
+            mock_blob.upload_from_file.side_effect = upload_from_file
+            return mock_blob
+
+        self.gcs_client.bucket.return_value.blob.side_effect = blob
+
+    def test_retract_stream(self):
+        output = io.BytesIO()
+
+        lines_removed = rd.retract_stream(
+            io.StringIO(self.observation, newline=''), output, self.pids,
+            common.OBSERVATION)
+
+        self.assertEqual(lines_removed, 2)
+        self.assertEqual(output.getvalue().decode(), self.expected_observation)
+
+    def test_retract_stream_pid_in_first_column(self):
+        output = io.BytesIO()
+        person = 'person_id,gender_concept_id\n"17",8507\n18,8532\n'
+
+        lines_removed = rd.retract_stream(io.StringIO(person, newline=''),
+                                          output, self.pids, common.PERSON)
+
+        self.assertEqual(lines_removed, 1)
+        self.assertEqual(output.getvalue(),
+                         b'person_id,gender_concept_id\n18,8532\n')
+
+    def test_retract_stream_empty_file(self):
+        output = io.BytesIO()
+
+        lines_removed = rd.retract_stream(io.StringIO(''), output, self.pids,
+                                          common.PERSON)
+
+        self.assertEqual(lines_removed, 0)
+        self.assertEqual(output.getvalue(), b'')
+
+    def test_retract_file(self):
+        observation_path = self.folder_prefix + 'observation.csv'
+        person_path = self.folder_prefix + 'person.csv'
+        self.blobs[observation_path] = self.observation.encode()
+        self.blobs[person_path] = b'person_id,gender_concept_id\n18,8532\n'
+
+        removed = rd.retract_file(self.gcs_client, self.pids, self.bucket,
+                                  self.folder_prefix, 'observation.csv')
+        self.assertEqual(removed, 2)
+        self.assertEqual(self.uploads[observation_path],
+                         self.expected_observation.encode())
+
+        # files without retracted rows are not rewritten
+        removed = rd.retract_file(self.gcs_client, self.pids, self.bucket,
+                                  self.folder_prefix, 'person.csv')
+        self.assertEqual(removed, 0)
+        self.assertNotIn(person_path, self.uploads)
+
+    @mock.patch('retraction.retract_data_gcs.get_retractable_files')
+    def test_retract_concurrently(self, mock_files):
+        folders = ['fake/site_bucket/2020-02-01/', self.folder_prefix]
+        mock_files.side_effect = lambda client, bucket, prefix: [
+            'observation.csv'
+        ]
+        for folder in folders:
+            self.blobs[folder + 'observation.csv'] = self.observation.encode()
+
+        removed = rd.retract_concurrently(self.gcs_client, self.pids,
+                                          self.bucket, folders, 2)
+
+        self.assertEqual(removed, 4)
+        self.assertEqual(mock_files.call_count, 2)
+        for folder in folders:
+            self.assertEqual(self.uploads[folder + 'observation.csv'],
+                             self.expected_observation.encode())
@@ -107,6 +107,67 @@ class RetractDeactivatedEHRDataBqTest(TestCase):
         # count sandbox and clean queries
         self.assertEqual(len(table_cols_dict) * 2, len(queries))
 
+    @mock.patch('retraction.retract_deactivated_pids.ru.is_deid_label_or_id')
+    @mock.patch('retraction.retract_deactivated_pids.get_table_dates_info')
+    @mock.patch('retraction.retract_deactivated_pids.get_table_cols_df')
+    def test_generate_queries_in_place(self, mock_table_cols, mock_table_dates,
+                                       mock_is_deid):
+        table_cols_dict = {
+            'measurement': ['measurement_date', 'measurement_datetime'],
+            'death': ['death_date', 'death_datetime'],
+            'drug_exposure': [
+                'drug_exposure_start_date', 'drug_exposure_start_datetime',
+                'drug_exposure_end_date', 'drug_exposure_end_datetime',
+                'verbatim_end_date'
+            ]
+        }
+        mock_table_cols.return_value = pd.DataFrame.from_dict(
+            {'table_name': list(table_cols_dict)})
+        mock_table_dates.return_value = table_cols_dict
+        mock_is_deid.return_value = False
+        self.mock_bq_client.query.return_value.to_dataframe.return_value = pd.DataFrame(
+            {
+                'table_name': ['measurement', 'death', 'drug_exposure'],
+                'affected_rows': [3, 0, 1]
+            })
+        deactivated_pids_table_ref = TableReference.from_string(
+            f"{self.project_id}.{self.deactivated_pids_dataset_id}.{self.deactivated_pids_table}"
+        )
+
+        queries = rdp.generate_queries(
+            client=self.mock_bq_client,
+            project_id=self.project_id,
+            dataset_id=self.dataset_id,
+            sandbox_dataset_id=self.dataset_id + '_sandbox',
+            deact_pids_table_ref=deactivated_pids_table_ref,
+            in_place=True)
+
+        # a single job checks every table for affected rows
+        self.mock_bq_client.query.assert_called_once()
+        check_query = self.mock_bq_client.query.call_args[0][0]
+        self.assertEqual(check_query.count('UNION ALL'),
+                         len(table_cols_dict) - 1)
+
+        # death has no affected rows and is skipped
+        self.assertEqual(len(queries), 4)
+        sandbox_queries, delete_queries = queries[:2], queries[2:]
+        for query in sandbox_queries:
+            self.assertIn('CREATE OR REPLACE TABLE',
+                          query[rdp.cdr_consts.QUERY])
+        for query, table in zip(delete_queries,
+                                ['measurement', 'drug_exposure']):
+            self.assertNotIn(rdp.cdr_consts.DESTINATION_TABLE, query)
+            delete_query = query[rdp.cdr_consts.QUERY]
+            self.assertIn(
+                f'DELETE\nFROM `{self.project_id}.{self.dataset_id}.{table}` t\n'
+                'WHERE EXISTS', delete_query)
+            self.assertIn(
+                f'`{self.project_id}.{self.deactivated_pids_dataset_id}.{self.deactivated_pids_table}` d',
+                delete_query)
+            self.assertIn('t.person_id = d.person_id', delete_query)
+        self.assertIn('OR t.verbatim_end_date >= d.deactivated_date',
+                      delete_queries[1][rdp.cdr_consts.QUERY])
+
     def test_get_dates_info(self):
         # preconditions
         data = {
@@ -153,6 +214,7 @@ class RetractDeactivatedEHRDataBqTest(TestCase):
         actual_datasets = args.dataset_ids
         self.assertEqual(expected_datasets, actual_datasets)
         self.assertEqual(fq_deactivated_table, args.fq_deact_table)
+        self.assertFalse(args.in_place)
 
         test_args = [
             '-p', self.project_id, '-d', self.dataset_id, fake_dataset_1, '-a',
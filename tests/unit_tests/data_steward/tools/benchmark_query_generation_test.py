@@ -0,0 +1,145 @@
+# Python imports
+import os
+import socket
+import tempfile
+from unittest import TestCase
+
+# Third party imports
+from google.cloud import bigquery
+
+# Project imports
+from tools import benchmark_query_generation as bench
+from utils import bq
+
+
+class BenchmarkQueryGenerationTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.measurements = {
+            bench.SECONDS: 0.1,
+            bench.PEAK_BYTES: 1024 * 1024,
+            bench.SQL_BYTES: 500,
+            bench.QUERIES: 2
+        }
+
+    def test_fake_client(self):
+        client = bench.FakeClient(table_ids=['person', 'observation'])
+
+        job = client.query('SELECT 1')
+        self.assertIsNone(job.errors)
+        self.assertEqual(list(job.result()), [])
+        self.assertEqual(len(job.to_dataframe().get('person_id')), 0)
+        self.assertEqual(
+            [table.table_id for table in client.list_tables('fake_dataset')],
+            ['observation', 'person'])
+        table = client.get_table('fake_dataset.person')
+        self.assertEqual(table.project, bench.PROJECT_ID)
+        self.assertIn('person_id', [field.name for field in table.schema])
+        client.delete_table('fake_dataset.person')
+        self.assertEqual(client.calls['delete_table'], 1)
+
+        # the fakes are accepted where query jobs and results are expected
+        dataset = bigquery.DatasetReference(bench.PROJECT_ID, 'fake_dataset')
+        self.assertEqual(bq.get_table_count(client, dataset), 2)
+        self.assertEqual(
+            [table.table_id for table in bq.list_tables(client, dataset)],
+            ['observation', 'person'])
+
+    def test_run_benchmark(self):
+        results = bench.run_benchmark(['controlled_tier_fitbit'], repeat=1)
+
+        stage_results = results['controlled_tier_fitbit']
+        self.assertTrue(stage_results)
+        # rules are keyed by name, their position is stored separately
+        rules = bench.clean_cdr.DATA_STAGE_RULES_MAPPING[
+            'controlled_tier_fitbit']
+        self.assertEqual(
+            {
+                rule_name: measurements[bench.POSITION]
+                for rule_name, measurements in stage_results.items()
+            },
+            {rule[0].__name__: index + 1 for index, rule in enumerate(rules)})
+        for measurements in stage_results.values():
+            self.assertNotIn(bench.ERROR, measurements)
+        totals = bench.stage_totals(stage_results)
+        self.assertGreater(totals[bench.SQL_BYTES], 0)
+        self.assertEqual(totals[bench.ERROR], 0)
+        # the RDR participant summary API is faked
+        results = bench.run_benchmark(['fitbit'], repeat=1)
+        self.assertNotIn(
+            bench.ERROR,
+            results['fitbit']['RemoveParticipantDataPastDeactivationDate'])
+        # the network guard is removed afterwards
+        self.assertIsNot(socket.socket.connect, bench._refuse_connection)
+
+    def test_compare_rule(self):
+        self.assertEqual(bench.compare_rule(self.measurements, None),
+                         ['new rule'])
+        self.assertEqual(
+            bench.compare_rule(self.measurements, dict(self.measurements)), [])
+
+        # small slowdowns and growth are noise
+        noisy = dict(self.measurements,
+                     seconds=0.105,
+                     peak_bytes=1024 * 1024 + 1024)
+        self.assertEqual(bench.compare_rule(noisy, self.measurements), [])
+
+        regressed = dict(self.measurements,
+                         seconds=0.3,
+                         peak_bytes=4 * 1024 * 1024,
+                         sql_bytes=600)
+        findings = bench.compare_rule(regressed, self.measurements)
+        self.assertEqual(len(findings), 3)
+
+        # inserting a rule only reports the new rule
+        baseline = {'stage': {'FirstRule': dict(self.measurements)}}
+        results = {
+            'stage': {
+                'NewRule': dict(self.measurements, position=1),
+                'FirstRule': dict(self.measurements, position=2)
+            }
+        }
+        self.assertEqual(bench.compare(results, baseline),
+                         {('stage', 'NewRule'): ['new rule']})
+
+        # baselines without timings only compare the sql
+        portable = {
+            bench.SQL_BYTES: self.measurements[bench.SQL_BYTES],
+            bench.QUERIES: self.measurements[bench.QUERIES]
+        }
+        self.assertEqual(bench.compare_rule(regressed, portable),
+                         ['sql size: 500 -> 600 bytes'])
+
+        failed = {bench.ERROR: 'ValueError: boom'}
+        self.assertEqual(len(bench.compare_rule(failed, self.measurements)), 1)
+        self.assertEqual(bench.compare_rule(failed, dict(failed)), [])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            baseline_path = os.path.join(tmp_dir, 'baseline.json')
+            args = ['-a', 'fitbit_deid', '-r', '1', '--baseline', baseline_path]
+
+            self.assertEqual(bench.main(args + ['--write_baseline']), 0)
+            baseline = bench.read_baseline(baseline_path)
+            self.assertIn('fitbit_deid', baseline)
+            # times and memory are only stored on request
+            for measurements in baseline['fitbit_deid'].values():
+                self.assertNotIn(bench.SECONDS, measurements)
+                self.assertIn(bench.SQL_BYTES, measurements)
+            self.assertEqual(
+                bench.main(args + ['--write_baseline', '--with_timings']), 0)
+            baseline = bench.read_baseline(baseline_path)
+            for measurements in baseline['fitbit_deid'].values():
+                self.assertIn(bench.SECONDS, measurements)
+
+            # a rule producing different SQL is reported
+            rule_name = sorted(baseline['fitbit_deid'])[0]
+            baseline['fitbit_deid'][rule_name][bench.SQL_BYTES] += 1
+            bench.write_baseline(baseline, baseline_path)
+            self.assertEqual(bench.main(args), 1)
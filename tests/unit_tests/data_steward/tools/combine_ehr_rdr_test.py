@@ -1,11 +1,12 @@
 # Python imports
 import unittest
-from mock import patch
+from mock import MagicMock, patch
 
 # Project imports
 import common
 import tools.combine_ehr_rdr as combine_ehr_rdr
-from constants.tools.combine_ehr_rdr import EHR_CONSENT_TABLE_ID
+from constants.tools.combine_ehr_rdr import (EHR_CONSENT_TABLE_ID,
+                                             DOMAIN_TABLES)
 
 EXPECTED_MAPPING_QUERY = """
 SELECT DISTINCT
@@ -73,3 +74,50 @@ class CombineEhrRdrTest(unittest.TestCase):
         mono_spaced_q = ' '.join(q.split())
 
         self.assertEqual(expected_query, mono_spaced_q)
+
+    def test_combine_steps(self):
+        steps = combine_ehr_rdr.combine_steps(MagicMock())
+        names = list(steps)
+
+        # steps are listed in an order they can be run sequentially
+        for name, (_, dependencies) in steps.items():
+            for dependency in dependencies:
+                self.assertLess(names.index(dependency), names.index(name))
+
+        self.assertSetEqual(steps['copy_ehr_death'][1], {'ehr_consent'})
+        for domain_table in DOMAIN_TABLES:
+            self.assertSetEqual(steps[f'mapping_{domain_table}'][1],
+                                {'ehr_consent'})
+        self.assertSetEqual(
+            steps['load_condition_occurrence'][1], {
+                'mapping_condition_occurrence', 'mapping_visit_occurrence',
+                'mapping_provider'
+            })
+        self.assertSetEqual(
+            steps['load_mapped_person'][1], {
+                'copy_rdr_person', 'mapping_location', 'mapping_care_site',
+                'mapping_provider'
+            })
+        self.assertSetEqual(steps['load_fact_relationship'][1],
+                            {'mapping_measurement', 'mapping_observation'})
+
+    @patch('tools.combine_ehr_rdr.run_job_graph')
+    @patch('tools.combine_ehr_rdr.combine_steps')
+    @patch('tools.combine_ehr_rdr.create_cdm_tables')
+    @patch('tools.combine_ehr_rdr.assert_ehr_and_rdr_tables')
+    @patch('tools.combine_ehr_rdr.bq.Client')
+    def test_main(self, mock_client, mock_assert, mock_create, mock_steps,
+                  mock_run_job_graph):
+        order = []
+        mock_steps.return_value = {
+            'mapping': (lambda: order.append('mapping'), set()),
+            'load': (lambda: order.append('load'), {'mapping'})
+        }
+        mock_run_job_graph.return_value = {'mapping': 1.0, 'load': 2.0}
+
+        combine_ehr_rdr.main()
+        self.assertListEqual(order, ['mapping', 'load'])
+        mock_run_job_graph.assert_not_called()
+
+        combine_ehr_rdr.main(concurrent=True, max_workers=4)
+        mock_run_job_graph.assert_called_once_with(mock_steps.return_value, 4)
@@ -198,6 +198,7 @@ class CreateTierTest(unittest.TestCase):
         correct_parameter_dict['target_principal'] = correct_parameter_dict.pop(
             'run_as', 'f@b.com')
         correct_parameter_dict['console_log'] = True
+        correct_parameter_dict['clone'] = True
 
         # Test if correct parameters are given
         args, kwargs = parse_deid_args(self.correct_parameter_list)
@@ -206,6 +207,10 @@ class CreateTierTest(unittest.TestCase):
         # Post conditions
         self.assertEqual(correct_parameter_dict, results_dict)
 
+        args, kwargs = parse_deid_args(self.correct_parameter_list +
+                                       ['--no_clone'])
+        self.assertFalse(args.clone)
+
     def test_validate_release_tag_param(self):
         # Preconditions
         invalid_release_tags = ['202q3r4', '2020q34r22']
@@ -398,15 +403,42 @@ class CreateTierTest(unittest.TestCase):
                                                 self.input_dataset, self.tier,
                                                 self.release_tag)
 
-        mock_copy_datasets.assert_called_with(client, self.input_dataset,
-                                              datasets[consts.STAGING])
+        mock_copy_datasets.assert_called_with(client,
+                                              self.input_dataset,
+                                              datasets[consts.STAGING],
+                                              clone=True)
 
         mock_add_kwargs.assert_called_with(controlled_tier_cleaning_args,
                                            kwargs)
         mock_cdr_main.assert_called_with(args=cleaning_args)
         mock_create_schemaed_snapshot.assert_called_with(
-            self.project_id, datasets[consts.STAGING], final_dataset_name,
-            False)
+            self.project_id,
+            datasets[consts.STAGING],
+            final_dataset_name,
+            False,
+            clone_conforming=True)
+
+        # tables are copied by query when cloning is turned off
+        create_tier(self.credentials_filepath,
+                    self.project_id,
+                    self.tier,
+                    self.input_dataset,
+                    self.release_tag,
+                    self.deid_stage,
+                    self.run_as,
+                    clone=False,
+                    **kwargs)
+
+        mock_copy_datasets.assert_called_with(client,
+                                              self.input_dataset,
+                                              datasets[consts.STAGING],
+                                              clone=False)
+        mock_create_schemaed_snapshot.assert_called_with(
+            self.project_id,
+            datasets[consts.STAGING],
+            final_dataset_name,
+            False,
+            clone_conforming=False)
 
     @mock.patch('tools.add_cdr_metadata.get_etl_version')
     @mock.patch('tools.create_tier.create_schemaed_snapshot_dataset')
@@ -1,7 +1,12 @@
 import datetime
+import gzip
+import hashlib
+import tempfile
 import unittest
+from pathlib import Path
 
 import mock
+from google.api_core.exceptions import BadRequest
 from google.cloud.bigquery import Dataset, DatasetReference, AccessEntry
 from google.cloud.storage import Blob
 
@@ -73,6 +78,92 @@ class LoadVocabTest(unittest.TestCase):
             self.assertIsInstance(c.exception, RuntimeError)
             self.assertEqual(str(c.exception), expected_msg)
 
+    def test_load_stage_prefers_latest_file(self):
+        blobs = [
+            Blob(f'{table}.csv', self.bucket_name)
+            for table in common.VOCABULARY_TABLES
+        ]
+        # a stale plain file listed before the gzip file just uploaded
+        stale_concept = Blob(f'{common.CONCEPT}.csv', self.bucket_name)
+        stale_concept._properties['updated'] = '2021-01-01T00:00:00.000Z'
+        fresh_concept = Blob(f'{common.CONCEPT}.csv.gz', self.bucket_name)
+        fresh_concept._properties['updated'] = '2021-02-10T00:00:00.000Z'
+        # without update times the gzip file is preferred
+        domain_gzip = Blob(f'{common.DOMAIN}.csv.gz', self.bucket_name)
+        blobs = [
+            blob for blob in blobs if blob.name != f'{common.CONCEPT}.csv'
+        ] + [stale_concept, fresh_concept, domain_gzip]
+        self.gcs_client.list_blobs.return_value = blobs
+
+        load_vocab.load_stage(self.dst_dataset, self.bq_client,
+                              self.bucket_name, self.gcs_client)
+
+        source_uris = {
+            destination.table_id: source_uri
+            for (source_uri, destination
+                ), _ in self.bq_client.load_table_from_uri.call_args_list
+        }
+        self.assertEqual(self.bq_client.load_table_from_uri.call_count,
+                         len(common.VOCABULARY_TABLES))
+        self.assertEqual(source_uris[common.CONCEPT],
+                         f'gs://{self.bucket_name}/{common.CONCEPT}.csv.gz')
+        self.assertEqual(source_uris[common.DOMAIN],
+                         f'gs://{self.bucket_name}/{common.DOMAIN}.csv.gz')
+
+    def test_load_stage_collects_errors(self):
+        self.gcs_client.list_blobs.return_value = self.all_blobs
+        load_jobs = dict()
+
+        def load_table_from_uri(source_uri, destination, job_config):
+            load_job = mock.MagicMock()
+            if destination.table_id == common.CONCEPT:
+                load_job.result.side_effect = BadRequest('bad concept')
+            load_jobs[destination.table_id] = load_job
+            return load_job
+
+        self.bq_client.load_table_from_uri.side_effect = load_table_from_uri
+        with self.assertRaises(RuntimeError) as c:
+            load_vocab.load_stage(self.dst_dataset, self.bq_client,
+                                  self.bucket_name, self.gcs_client)
+        self.assertIn(f"['{common.CONCEPT}']", str(c.exception))
+
+        # every job is submitted and waited on despite the failure
+        self.assertSetEqual(set(load_jobs), set(common.VOCABULARY_TABLES))
+        for load_job in load_jobs.values():
+            load_job.result.assert_called_once()
+
+    def test_load(self):
+        src_tables = [
+            mock.MagicMock(table_id=table) for table in common.VOCABULARY_TABLES
+        ]
+        self.bq_client.project = 'fake_project_id'
+        self.bq_client.list_tables.return_value = src_tables
+        dataset_props = {'access_entries': []}
+
+        query_jobs = load_vocab.load('fake_project_id', self.bq_client,
+                                     'fake_staging', 'fake_dataset_id',
+                                     dataset_props)
+        self.assertEqual(len(query_jobs), len(common.VOCABULARY_TABLES))
+        # each table has its own job config
+        job_configs = [
+            kwargs['job_config']
+            for _, kwargs in self.bq_client.query.call_args_list
+        ]
+        self.assertEqual(len(set(map(id, job_configs))), len(job_configs))
+        self.bq_client.update_dataset.assert_called_once()
+
+        # access policy is not set when a table fails to load
+        self.bq_client.reset_mock()
+        self.bq_client.list_tables.return_value = src_tables
+        self.bq_client.query.return_value.result.side_effect = BadRequest(
+            'bad query')
+        with self.assertRaises(RuntimeError):
+            load_vocab.load('fake_project_id', self.bq_client, 'fake_staging',
+                            'fake_dataset_id', dataset_props)
+        self.assertEqual(self.bq_client.query.return_value.result.call_count,
+                         len(common.VOCABULARY_TABLES))
+        self.bq_client.update_dataset.assert_not_called()
+
     def test_table_name_to_filename(self):
         expected = 'CONCEPT.csv'
         actual = load_vocab._table_name_to_filename('concept')
@@ -82,6 +173,46 @@ class LoadVocabTest(unittest.TestCase):
         expected = 'concept'
         actual = load_vocab._filename_to_table_name('CONCEPT.csv')
         self.assertEqual(expected, actual)
+        actual = load_vocab._filename_to_table_name('CONCEPT.csv.gz')
+        self.assertEqual(expected, actual)
+
+    def test_hash_dir(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vocab_file = Path(tmp_dir) / 'CONCEPT.csv'
+            content = b'concept_id\tconcept_name\n' * 1000
+            vocab_file.write_bytes(content)
+            with mock.patch('tools.load_vocab.HASH_CHUNK_SIZE', 7):
+                actual = load_vocab.hash_dir(Path(tmp_dir))
+        self.assertEqual(hashlib.sha256(content).hexdigest(), actual)
+
+    def test_upload_stage(self):
+        bucket = self.gcs_client.get_bucket.return_value
+        uploaded = dict()
+
+        def blob(file_name):
+            mock_blob = mock.MagicMock()
+
+            def upload_from_filename(path):
+                with gzip.open(path, 'rb') as fp:
+                    uploaded[file_name] = fp.read()
+
+            mock_blob.upload_from_filename.side_effect = upload_from_filename
+            return mock_blob
+
+        bucket.blob.side_effect = blob
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for table in common.VOCABULARY_TABLES:
+                file_path = Path(tmp_dir) / load_vocab._table_name_to_filename(
+                    table)
+                file_path.write_text(f'{table}_id\n1\n')
+            load_vocab.upload_stage(self.bucket_name, Path(tmp_dir),
+                                    self.gcs_client)
+
+        expected = {
+            f'{table.upper()}.csv.gz': f'{table}_id\n1\n'.encode()
+            for table in common.VOCABULARY_TABLES
+        }
+        self.assertDictEqual(expected, uploaded)
 
     def test_dataset_properties_from_file(self):
         mock_json = '''{
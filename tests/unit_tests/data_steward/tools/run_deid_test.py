@@ -5,6 +5,7 @@ test_parse_args -- ensures the output dataset name includes _deid
 test_main -- ensures the parameter list contains the output dataset command line argument
 test_known_tables -- ensures all table names known to curation are returned
 test_get_output_table_schemas -- ensures only table schemas for suppressed tables are copied
+test_main_workers -- ensures tables are de-identified concurrently with shared rules
 
 Original Issue: DC-744
 """
@@ -14,6 +15,7 @@ import os
 import unittest
 
 # Third party imports
+import google
 from mock import patch
 
 from resources import DEID_PATH
@@ -80,6 +82,10 @@ class RunDeidTest(unittest.TestCase):
         # setting correct_parameter_dict values not set in setUp function
         correct_parameter_dict['console_log'] = False
         correct_parameter_dict['interactive_mode'] = False
+        correct_parameter_dict['workers'] = 1
+        correct_parameter_dict['pipelined_jobs'] = False
+        correct_parameter_dict['plan_cache'] = False
+        correct_parameter_dict['fuse_segments'] = False
         correct_parameter_dict['input_dataset'] = self.input_dataset
 
         # need to delete idataset argument from correct_parameter_dict because input_dataset argument is returned
@@ -93,6 +99,8 @@ class RunDeidTest(unittest.TestCase):
         # Post conditions
         self.assertEqual(correct_parameter_dict, results_dict)
 
+    @patch('tools.run_deid.pipeline_logging.configure_tracing')
+    @patch('tools.run_deid.load_rules')
     @patch('tools.run_deid.fields_for')
     @patch('tools.run_deid.copy_suppressed_table_schemas')
     @patch('deid.aou.main')
@@ -100,7 +108,7 @@ class RunDeidTest(unittest.TestCase):
     @patch('tools.run_deid.load_deid_map_table')
     @patch('tools.run_deid.get_output_tables')
     def test_main(self, mock_tables, mock_load, mock_copy, mock_main,
-                  mock_suppressed, mock_fields):
+                  mock_suppressed, mock_fields, mock_rules, mock_tracing):
         # Tests if incorrect parameters are given
         self.assertRaises(SystemExit, run_deid.main,
                           self.incorrect_parameter_list)
@@ -119,8 +127,47 @@ class RunDeidTest(unittest.TestCase):
             '--private_key', self.private_key, '--table', 'fake1', '--action',
             self.action, '--idataset', self.input_dataset, '--log', 'LOGS',
             '--odataset', self.output_dataset, '--age-limit', self.max_age
-        ])
+        ],
+                                          deid_rules=mock_rules.return_value,
+                                          create_lookup_tables=True)
         self.assertEqual(mock_main.call_count, 1)
+        mock_rules.assert_called_once_with(
+            os.path.join(DEID_PATH, 'config', 'ids', 'config.json'))
+        mock_tracing.assert_called_once()
+
+    @patch('tools.run_deid.pipeline_logging.configure_tracing')
+    @patch('tools.run_deid.create_shared_lookup_tables')
+    @patch('tools.run_deid.load_rules')
+    @patch('tools.run_deid.fields_for')
+    @patch('tools.run_deid.copy_suppressed_table_schemas')
+    @patch('deid.aou.main')
+    @patch('tools.run_deid.load_deid_map_table')
+    @patch('tools.run_deid.get_output_tables')
+    def test_main_workers(self, mock_tables, mock_load, mock_main,
+                          mock_suppressed, mock_fields, mock_rules,
+                          mock_lookups, mock_tracing):
+        # Preconditions
+        mock_tables.return_value = ['fake1', 'fake2', 'fake3']
+        mock_fields.return_value = [{'name': 'person_id'}]
+        mock_main.side_effect = [
+            None, google.api_core.exceptions.BadRequest('bad sql'), None
+        ]
+
+        # Tests if correct parameters are given
+        with self.assertLogs(run_deid.LOGGER, level='ERROR') as logs:
+            run_deid.main(self.correct_parameter_list + ['--workers', '2'])
+
+        # Post conditions
+        mock_rules.assert_called_once()
+        mock_lookups.assert_called_once_with(self.input_dataset,
+                                             self.private_key)
+        self.assertEqual(mock_main.call_count, 3)
+        for call in mock_main.call_args_list:
+            self.assertIs(call[1]['deid_rules'], mock_rules.return_value)
+            self.assertFalse(call[1]['create_lookup_tables'])
+            self.assertIn('--cluster', call[0][0])
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(mock_suppressed.call_count, 1)
 
     @patch('tools.run_deid.os.walk')
     def test_known_tables(self, mock_walk):
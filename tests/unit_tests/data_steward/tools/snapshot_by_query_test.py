@@ -1,6 +1,9 @@
 import re
 import unittest
 
+import mock
+
+import resources
 from tools import snapshot_by_query
 
 WHITESPACE = '[\t\n\\s]+'
@@ -47,3 +50,121 @@ FROM
             'test-project', 'test-dataset', 'non_cdm_table')
         expected_query = '''SELECT * FROM `test-project.test-dataset.non_cdm_table`'''
         self.assertEqual(actual_query, expected_query)
+
+    @mock.patch('tools.snapshot_by_query.get_table_info')
+    def test_is_schema_conforming(self, mock_table_info):
+        fields = resources.fields_for('person')
+        # standard sql type names and missing descriptions still conform
+        table_fields = [{
+            'name': field['name'],
+            'type': 'INT64' if field['type'] == 'integer' else field['type'],
+            'mode': field['mode']
+        } for field in fields]
+        mock_table_info.return_value = {'schema': {'fields': table_fields}}
+        self.assertTrue(
+            snapshot_by_query.is_schema_conforming('test-project',
+                                                   'test-dataset', 'person'))
+        mock_table_info.assert_called_once_with('person', 'test-dataset',
+                                                'test-project')
+
+        table_fields[0]['type'] = 'STRING'
+        self.assertFalse(
+            snapshot_by_query.is_schema_conforming('test-project',
+                                                   'test-dataset', 'person'))
+
+        table_fields[0]['type'] = 'INTEGER'
+        table_fields[0]['mode'] = 'NULLABLE'
+        self.assertFalse(
+            snapshot_by_query.is_schema_conforming('test-project',
+                                                   'test-dataset', 'person'))
+
+        mock_table_info.reset_mock()
+        self.assertTrue(
+            snapshot_by_query.is_schema_conforming('test-project',
+                                                   'test-dataset',
+                                                   'non_cdm_table'))
+        mock_table_info.assert_not_called()
+
+    @mock.patch('tools.snapshot_by_query.bq.get_client')
+    @mock.patch('tools.snapshot_by_query.wait_on_jobs')
+    @mock.patch('tools.snapshot_by_query.query')
+    @mock.patch('tools.snapshot_by_query.is_schema_conforming')
+    @mock.patch('tools.snapshot_by_query.list_all_table_ids')
+    def test_copy_tables_to_new_dataset(self, mock_table_ids, mock_conforming,
+                                        mock_query, mock_wait, mock_client):
+        mock_table_ids.return_value = ['person', 'observation']
+        mock_conforming.side_effect = lambda p, d, table_id: table_id == 'person'
+        mock_query.return_value = {'jobReference': {'jobId': 'fake_job'}}
+        mock_wait.return_value = []
+
+        snapshot_by_query.copy_tables_to_new_dataset('test-project',
+                                                     'test-dataset',
+                                                     'test-snapshot')
+
+        mock_client.assert_called_once_with('test-project')
+        client = mock_client.return_value
+        self.assertEqual(
+            client.query.call_args[0][0].strip(),
+            'CREATE OR REPLACE TABLE `test-project.test-snapshot.person`\n'
+            'CLONE `test-project.test-dataset.person`')
+        client.query.return_value.result.assert_called_once_with()
+        copy_call, = mock_query.call_args_list
+        self.assertEqual(copy_call[1]['destination_table_id'], 'observation')
+        self.assertIn('CAST(', copy_call[0][0])
+        mock_wait.assert_called_once_with(['fake_job'])
+
+        mock_query.reset_mock()
+        snapshot_by_query.copy_tables_to_new_dataset('test-project',
+                                                     'test-dataset',
+                                                     'test-snapshot',
+                                                     clone_conforming=False)
+        for _, kwargs in mock_query.call_args_list:
+            self.assertIn('destination_table_id', kwargs)
+
+    @mock.patch('tools.snapshot_by_query.copy_tables_to_new_dataset')
+    @mock.patch('tools.snapshot_by_query.create_empty_cdm_tables')
+    @mock.patch('tools.snapshot_by_query.is_schema_conforming')
+    @mock.patch('tools.snapshot_by_query.list_all_table_ids')
+    def test_create_schemaed_snapshot_dataset(self, mock_table_ids,
+                                              mock_conforming,
+                                              mock_create_tables, mock_copy):
+        mock_table_ids.return_value = ['person', 'observation']
+        mock_conforming.side_effect = lambda p, d, table_id: table_id == 'person'
+
+        snapshot_by_query.create_schemaed_snapshot_dataset(
+            'test-project',
+            'test-dataset',
+            'test-snapshot',
+            overwrite_existing=False)
+
+        # the cloned table is not created from its schema first
+        mock_create_tables.assert_called_once_with('test-snapshot',
+                                                   exclude=['person'])
+        mock_copy.assert_called_once_with('test-project',
+                                          'test-dataset',
+                                          'test-snapshot',
+                                          True,
+                                          clone_table_ids=['person'])
+
+        mock_create_tables.reset_mock()
+        snapshot_by_query.create_schemaed_snapshot_dataset(
+            'test-project',
+            'test-dataset',
+            'test-snapshot',
+            overwrite_existing=False,
+            clone_conforming=False)
+        mock_create_tables.assert_called_once_with('test-snapshot', exclude=[])
+
+    @mock.patch('tools.snapshot_by_query.cdm.create_table')
+    @mock.patch('tools.snapshot_by_query.create_standard_table')
+    def test_create_empty_cdm_tables(self, mock_standard_table,
+                                     mock_create_table):
+        snapshot_by_query.create_empty_cdm_tables('test-snapshot',
+                                                  exclude=['person', 'concept'])
+
+        created = [call[0][0] for call in mock_standard_table.call_args_list]
+        self.assertNotIn('person', created)
+        self.assertIn('observation', created)
+        vocabulary = [call[0][0] for call in mock_create_table.call_args_list]
+        self.assertNotIn('concept', vocabulary)
+        self.assertIn('vocabulary', vocabulary)
@@ -236,14 +236,27 @@ class BqTest(TestCase):
     @patch('utils.bq.bigquery.Client')
     def test_bq_client(self, mock_bq_client):
         credentials = MagicMock()
-        bq.get_client(self.project_id, credentials=credentials)
+        client = bq.get_client(self.project_id, credentials=credentials)
         mock_bq_client.assert_called_once_with(project=self.project_id,
                                                credentials=credentials)
+        # clients are reused within a thread
+        self.assertIs(client,
+                      bq.get_client(self.project_id, credentials=credentials))
+        mock_bq_client.assert_called_once()
+        client._http.mount.assert_called_once()
         bq.get_client(self.project_id, credentials=None)
         mock_bq_client.assert_called_with(project=self.project_id,
                                           credentials=None)
         self.assertRaises(TypeError, bq.get_client, project=None)
 
+        # credentials built anew for the same service account share a client
+        mock_bq_client.reset_mock()
+        for email in ['curation@example.com'] * 2 + ['other@example.com']:
+            bq.get_client(self.project_id,
+                          credentials=MagicMock(service_account_email=email,
+                                                scopes=None))
+        self.assertEqual(mock_bq_client.call_count, 2)
+
     @patch('utils.bq.bigquery.Client.copy_table')
     @patch('utils.bq.bigquery.Client.list_tables')
     @patch('utils.bq.bigquery.Client')
@@ -262,3 +275,103 @@ class BqTest(TestCase):
                          f'{self.dataset_id}_snapshot')
         mock_list_tables.assert_called_once_with(self.dataset_id)
         self.assertEqual(mock_copy_table.call_count, len(list_tables_results))
+
+    def test_copy_datasets_clone(self):
+        client = MagicMock(project=self.project_id)
+        client.list_tables.return_value = [
+            list_item_from_table_id(
+                f'{self.project_id}.{self.dataset_id}.{table_id}')
+            for table_id in CDM_TABLES
+        ]
+
+        bq.copy_datasets(client,
+                         self.dataset_id,
+                         f'{self.dataset_id}_snapshot',
+                         clone=True)
+
+        client.copy_table.assert_not_called()
+        self.assertEqual(client.query.call_count, len(CDM_TABLES))
+        clone_queries = [
+            args[0].strip() for args, _ in client.query.call_args_list
+        ]
+        for table_id in CDM_TABLES:
+            self.assertIn(
+                f'CREATE TABLE `{self.project_id}.{self.dataset_id}_snapshot.{table_id}`\n'
+                f'CLONE `{self.project_id}.{self.dataset_id}.{table_id}`',
+                clone_queries)
+
+    def test_run_copy_jobs(self):
+        client = MagicMock()
+        tables = {'src.a': 10, 'dest.a': 10, 'src.b': 5, 'dest.b': 4}
+        client.get_table.side_effect = lambda table: MagicMock(num_rows=tables[
+            table])
+        jobs = [MagicMock(), MagicMock()]
+        copies = [('src.a', 'dest.a', lambda: jobs[0]),
+                  ('src.b', 'dest.b', lambda: jobs[1])]
+
+        with self.assertRaises(RuntimeError) as c:
+            bq.run_copy_jobs(client, copies)
+        # only the table with mismatched row counts fails
+        self.assertIn("['dest.b']", str(c.exception))
+        for job in jobs:
+            job.result.assert_called_once()
+
+        tables['dest.b'] = 5
+        bq.run_copy_jobs(client, copies, max_concurrent_jobs=1)
+
+    def test_schema_signature(self):
+        fields = [{
+            'name': 'person_id',
+            'type': 'integer',
+            'mode': 'required',
+            'description': 'A unique identifier for each person.'
+        }, {
+            'name': 'gender_source_value',
+            'type': 'string'
+        }]
+        table_schema = [
+            bigquery.SchemaField('person_id', 'INT64', 'REQUIRED'),
+            bigquery.SchemaField('gender_source_value', 'STRING')
+        ]
+        self.assertEqual(bq.schema_signature(fields),
+                         bq.schema_signature(table_schema))
+        self.assertEqual(bq.schema_signature(table_schema),
+                         [('person_id', 'INTEGER', 'REQUIRED'),
+                          ('gender_source_value', 'STRING', 'NULLABLE')])
+
+        table_schema[0] = bigquery.SchemaField('person_id', 'INT64')
+        self.assertNotEqual(bq.schema_signature(fields),
+                            bq.schema_signature(table_schema))
+
+    @patch('utils.bq.get_table_schema')
+    def test_build_and_copy_contents(self, mock_schema):
+        client = MagicMock(project=self.project_id)
+        client.list_tables.return_value = [
+            list_item_from_table_id(f'{self.project_id}.{self.dataset_id}.{t}')
+            for t in ['person', 'observation']
+        ]
+        mock_schema.return_value = [
+            bigquery.SchemaField('person_id', 'integer', 'required',
+                                 'A unique identifier for each person.')
+        ]
+        # person already has the expected fields, without their descriptions,
+        # observation does not
+        client.get_table.side_effect = lambda table: MagicMock(
+            schema=[bigquery.SchemaField('person_id', 'INT64', 'REQUIRED')]
+            if getattr(table, 'table_id', None) == 'person' else [],
+            num_rows=1)
+
+        bq.build_and_copy_contents(client,
+                                   self.dataset_id,
+                                   'dest_dataset',
+                                   clone=True)
+
+        client.create_table.assert_called_once()
+        queries = [args[0].strip() for args, _ in client.query.call_args_list]
+        self.assertEqual(len(queries), 2)
+        self.assertIn(
+            f'CREATE TABLE `{self.project_id}.dest_dataset.person`\n'
+            f'CLONE `{self.project_id}.{self.dataset_id}.person`', queries)
+        self.assertIn(
+            f'SELECT person_id FROM `{self.project_id}.{self.dataset_id}.observation`',
+            queries)
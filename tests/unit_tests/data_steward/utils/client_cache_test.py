@@ -0,0 +1,98 @@
+import threading
+import unittest
+from unittest import mock
+
+from utils import client_cache
+
+
+class ClientCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        client_cache.clear()
+        client_cache.reset_stats()
+
+    def test_get_or_build(self):
+        build = mock.MagicMock(side_effect=lambda: object())
+
+        client = client_cache.get_or_build('fake_client', ('project', None),
+                                           build)
+        self.assertIs(
+            client,
+            client_cache.get_or_build('fake_client', ('project', None), build))
+        self.assertIsNot(
+            client,
+            client_cache.get_or_build('fake_client', ('other', None), build))
+        self.assertEqual(build.call_count, 2)
+
+        # each thread builds its own client
+        thread_clients = []
+        thread = threading.Thread(target=lambda: thread_clients.append(
+            client_cache.get_or_build('fake_client', ('project', None), build)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(client, thread_clients[0])
+
+        self.assertDictEqual(client_cache.get_stats(),
+                             {'fake_client': {
+                                 'built': 3,
+                                 'reused': 1
+                             }})
+
+        client_cache.clear()
+        self.assertIsNot(
+            client,
+            client_cache.get_or_build('fake_client', ('project', None), build))
+        self.assertEqual(build.call_count, 4)
+
+    @mock.patch('utils.client_cache.MAX_CACHED_PER_THREAD', 2)
+    def test_get_or_build_evicts(self):
+        build = mock.MagicMock(side_effect=lambda: object())
+
+        first = client_cache.get_or_build('fake_client', ('first',), build)
+        second = client_cache.get_or_build('fake_client', ('second',), build)
+        # the least recently used object is discarded
+        self.assertIs(
+            first, client_cache.get_or_build('fake_client', ('first',), build))
+        client_cache.get_or_build('fake_client', ('third',), build)
+        self.assertIs(
+            first, client_cache.get_or_build('fake_client', ('first',), build))
+        self.assertIsNot(
+            second, client_cache.get_or_build('fake_client', ('second',),
+                                              build))
+        self.assertEqual(build.call_count, 4)
+
+    def test_refuse_services(self):
+        build = mock.MagicMock(side_effect=lambda: object())
+
+        with client_cache.refuse_services('offline'):
+            with client_cache.refuse_services('nested'):
+                self.assertRaises(client_cache.ServiceRefusedError,
+                                  client_cache.check_allowed, 'fake_client')
+            # refused to other threads as well
+            errors = []
+
+            def check():
+                try:
+                    client_cache.check_allowed('fake_client')
+                except client_cache.ServiceRefusedError as exc:
+                    errors.append(exc)
+
+            thread = threading.Thread(target=check)
+            thread.start()
+            thread.join()
+            self.assertEqual(len(errors), 1)
+            self.assertIn('offline', str(errors[0]))
+
+        client_cache.check_allowed('fake_client')
+        client_cache.get_or_build('fake_client', ('project', None), build)
+        build.assert_called_once_with()
+
+    def tearDown(self):
+        client_cache.clear()
+        client_cache.reset_stats()
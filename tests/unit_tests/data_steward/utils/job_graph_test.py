@@ -0,0 +1,59 @@
+import threading
+import unittest
+
+from utils import job_graph
+
+
+class JobGraphTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.order = []
+        self.lock = threading.Lock()
+
+    def step(self, name):
+
+        def run():
+            with self.lock:
+                self.order.append(name)
+
+        return run
+
+    def test_run_job_graph(self):
+        steps = {
+            'load_a': (self.step('load_a'), {'mapping_a'}),
+            'mapping_a': (self.step('mapping_a'), set()),
+            'mapping_b': (self.step('mapping_b'), set()),
+            'load_b': (self.step('load_b'), {'mapping_a', 'mapping_b'}),
+            'person': (self.step('person'), {'load_a', 'load_b'})
+        }
+        timings = job_graph.run_job_graph(steps, max_workers=3)
+
+        self.assertSetEqual(set(self.order), set(steps))
+        self.assertSetEqual(set(timings), set(steps))
+        for name, (_, dependencies) in steps.items():
+            for dependency in dependencies:
+                self.assertLess(self.order.index(dependency),
+                                self.order.index(name))
+
+        # steps depending on a failed step are not run
+        self.order.clear()
+
+        def fail():
+            raise ValueError('fake failure')
+
+        steps['mapping_b'] = (fail, set())
+        with self.assertRaises(ValueError):
+            job_graph.run_job_graph(steps, max_workers=3)
+        self.assertNotIn('load_b', self.order)
+        self.assertNotIn('person', self.order)
+
+        # unknown dependencies are reported instead of hanging
+        with self.assertRaises(RuntimeError):
+            job_graph.run_job_graph(
+                {'load_a': (self.step('load_a'), {'missing'})})
@@ -13,8 +13,13 @@ The intent of this module is to check that GCR access token is generated properl
 """
 
 # Python imports
+import json
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
+from urllib.parse import parse_qs, urlparse
 from numpy.core.numeric import NaN
 
 # Third Party imports
@@ -63,7 +68,7 @@ class ParticipantSummaryRequestsTest(TestCase):
             333, 'foo_first', 'foo_middle', 'foo_last', 'foo_street_address',
             'foo_street_address_2', 'foo_city', 'foo_state', '12345',
             '1112223333', 'foo_email', '1900-01-01', 'SexAtBirth_Male'
-        ], [444, 'bar_first', 'bar_last']]
+        ], [444, 'bar_first', np.nan, 'bar_last']]
 
         self.updated_org_participant_information = [[
             333, 'foo_first', 'foo_middle', 'foo_last', 'foo_street_address',
@@ -166,8 +171,9 @@ class ParticipantSummaryRequestsTest(TestCase):
 
         self.assertEqual(mock_auth.delegated_credentials().token, actual_token)
 
-    @patch('utils.participant_summary_requests.requests.get')
-    def test_get_participant_data(self, mock_get):
+    @patch('utils.participant_summary_requests.get_session')
+    def test_get_participant_data(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
         mock_get.return_value.status_code = 200
         mock_get.return_value.json.return_value = self.json_response_entry
 
@@ -205,7 +211,7 @@ class ParticipantSummaryRequestsTest(TestCase):
         self.assertEqual(expected_response, dataset_response)
 
     @patch('utils.participant_summary_requests.get_access_token')
-    @patch('utils.participant_summary_requests.get_participant_data')
+    @patch('utils.participant_summary_requests.iter_participant_data')
     def test_get_site_participant_information(self, mock_get_participant_data,
                                               mock_token):
 
@@ -242,7 +248,7 @@ class ParticipantSummaryRequestsTest(TestCase):
         pandas.testing.assert_frame_equal(expected_dataframe, actual_dataframe)
 
     @patch('utils.participant_summary_requests.get_access_token')
-    @patch('utils.participant_summary_requests.get_participant_data')
+    @patch('utils.participant_summary_requests.iter_participant_data')
     def test_get_org_participant_information(self, mock_get_participant_data,
                                              mock_token):
 
@@ -346,7 +352,7 @@ class ParticipantSummaryRequestsTest(TestCase):
         self.assertEqual(actual_job_id, fake_job_id)
 
     @patch('utils.participant_summary_requests.get_access_token')
-    @patch('utils.participant_summary_requests.get_participant_data')
+    @patch('utils.participant_summary_requests.iter_participant_data')
     def test_get_deactivated_participants_parameters(self, mock_data,
                                                      mock_token):
         """
@@ -357,3 +363,121 @@ class ParticipantSummaryRequestsTest(TestCase):
                           self.columns)
         self.assertRaises(RuntimeError, psr.get_deactivated_participants,
                           self.project_id, None)
+
+
+class StubParticipantSummaryHandler(BaseHTTPRequestHandler):
+    """
+    Serves one participant per page for each organization
+
+    Organization FLAKY fails its first request and BROKEN fails every request.
+    """
+    pages = {
+        'ORG_A': ['P1', 'P2', 'P3'],
+        'ORG_B': ['P4'],
+        'FLAKY': ['P5', 'P6'],
+        'BROKEN': ['P7']
+    }
+    lock = threading.Lock()
+    requests = []
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        org_id = params['organization'][0]
+        with self.lock:
+            self.requests.append(org_id)
+            failed = org_id == 'BROKEN' or (org_id == 'FLAKY' and
+                                            self.requests.count('FLAKY') == 1)
+        if failed:
+            self.send_response(503)
+            self.end_headers()
+            return
+        page = int(params.get('_token', ['0'])[0])
+        participant_ids = self.pages[org_id]
+        body = {
+            'entry': [{
+                'resource': {
+                    'participantId': participant_ids[page],
+                    'firstName': f'first_{page}',
+                    'lastName': f'last_{page}'
+                }
+            }]
+        }
+        if page + 1 < len(participant_ids):
+            body['link'] = [{
+                'relation': 'next',
+                'url': f'https://stub/ParticipantSummary?_token={page + 1}'
+            }]
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class ParticipantSummaryStubServerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                         StubParticipantSummaryHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever,
+                                             daemon=True)
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubParticipantSummaryHandler.requests.clear()
+        port = self.server.server_address[1]
+        self.url_patcher = patch(
+            'utils.participant_summary_requests.PS_API_URL',
+            f'http://127.0.0.1:{port}/{{project_id}}/ParticipantSummary')
+        self.url_patcher.start()
+        self.token_patcher = patch(
+            'utils.participant_summary_requests.get_access_token',
+            return_value='fake_token')
+        self.token_patcher.start()
+        self.session_patcher = patch(
+            'utils.participant_summary_requests.get_session',
+            partial(psr.get_session, backoff_factor=0))
+        self.session_patcher.start()
+
+    def test_get_orgs_participant_information(self):
+        dfs = psr.get_orgs_participant_information('foo_project',
+                                                   ['ORG_A', 'ORG_B', 'FLAKY'],
+                                                   max_workers=3)
+
+        self.assertListEqual(list(dfs), ['ORG_A', 'ORG_B', 'FLAKY'])
+        self.assertListEqual(dfs['ORG_A']['person_id'].tolist(), [1, 2, 3])
+        self.assertListEqual(dfs['ORG_A']['last_name'].tolist(),
+                             ['last_0', 'last_1', 'last_2'])
+        self.assertTrue(dfs['ORG_A']['middle_name'].isna().all())
+        self.assertListEqual(dfs['ORG_B']['person_id'].tolist(), [4])
+        # the failed request is retried
+        self.assertListEqual(dfs['FLAKY']['person_id'].tolist(), [5, 6])
+        self.assertEqual(StubParticipantSummaryHandler.requests.count('FLAKY'),
+                         3)
+
+    def test_get_participant_data_retries_are_bounded(self):
+        session = psr.get_session(max_retries=2, backoff_factor=0)
+        with self.assertRaises(RuntimeError):
+            psr.get_org_participant_information('foo_project',
+                                                'BROKEN',
+                                                session=session)
+        self.assertEqual(StubParticipantSummaryHandler.requests.count('BROKEN'),
+                         3)
+
+    def tearDown(self):
+        self.session_patcher.stop()
+        self.token_patcher.stop()
+        self.url_patcher.stop()
@@ -10,9 +10,13 @@ Original Issue = DC-637
 """
 
 # Python imports
+import io
+import json
 import os
 import unittest
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
 import mock
 
 # Project imports
@@ -150,5 +154,90 @@ class PipelineLoggingTest(unittest.TestCase):
         self.assert_logs_handled(logging.CRITICAL, mock_file_emit,
                                  mock_stream_emit)
 
+    def trace_spans(self, func):
+        """
+        Run func with spans written to a stream
+
+        :param func: callable without arguments which opens spans
+        :return: list of span dicts in the order they ended
+        """
+        stream = io.StringIO()
+        handler = pl.configure_tracing(stream=stream)
+        self.addCleanup(pl.TRACE_LOGGER.removeHandler, handler)
+        func()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_span(self):
+
+        @pl.traced()
+        def load_table():
+            with pl.span('query', table='person') as query_span:
+                query_span.set_attribute('rows', 3)
+
+        def run():
+            with pl.span('stage'):
+                load_table()
+            with self.assertRaises(ValueError):
+                with pl.span('failing'):
+                    raise ValueError('bad')
+
+        spans = self.trace_spans(run)
+
+        self.assertEqual([span['path'] for span in spans], [
+            'stage;PipelineLoggingTest.test_span.<locals>.load_table;query',
+            'stage;PipelineLoggingTest.test_span.<locals>.load_table', 'stage',
+            'failing'
+        ])
+        query, load, stage, failing = spans
+        self.assertEqual(query['parent_id'], load['span_id'])
+        self.assertEqual(load['parent_id'], stage['span_id'])
+        self.assertIsNone(stage['parent_id'])
+        self.assertEqual([span['depth'] for span in spans], [2, 1, 0, 0])
+        self.assertEqual(query['attributes'], {'table': 'person', 'rows': 3})
+        self.assertEqual(stage['status'], 'ok')
+        self.assertEqual(failing['status'], 'error')
+        self.assertLessEqual(stage['self_seconds'], stage['duration_seconds'])
+
+    def test_bind_span(self):
+
+        def step(name):
+            with pl.span(name):
+                pass
+
+        def run():
+            with pl.span('union'):
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(pl.bind_span(step), ['a', 'b']))
+            # threads without a bound span start their own root spans
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(step, 'c').result()
+
+        spans = self.trace_spans(run)
+        self.assertCountEqual([span['path'] for span in spans],
+                              ['union;a', 'union;b', 'union', 'c'])
+
+    def test_fold_spans(self):
+        spans = [{
+            'path': 'stage;rule',
+            'self_seconds': 1.5
+        }, {
+            'path': 'stage;rule',
+            'self_seconds': 0.5
+        }, {
+            'path': 'stage',
+            'self_seconds': 0.25
+        }]
+        self.assertDictEqual(pl.fold_spans(spans), {
+            'stage;rule': 2.0,
+            'stage': 0.25
+        })
+
+    def test_spans_not_written_without_tracing(self):
+        with mock.patch.object(pl, '_emit_span') as mock_emit:
+            with mock.patch.object(pl.TRACE_LOGGER, 'handlers', []):
+                with pl.span('untraced'):
+                    pass
+        mock_emit.assert_not_called()
+
     def tearDown(self):
         pass
@@ -2,6 +2,7 @@ import unittest
 from unittest import mock
 
 import bq_utils
+import common
 from validation import ehr_union as eu
 from constants.validation import ehr_union as eu_constants
 
@@ -255,5 +256,21 @@ class EhrUnionTest(unittest.TestCase):
                                       dataset_id,
                                       write_disposition='WRITE_APPEND')
 
+    def test_load_dependencies(self):
+        mapped_tables = [
+            common.VISIT_OCCURRENCE, common.MEASUREMENT, common.OBSERVATION,
+            common.CARE_SITE, common.LOCATION
+        ]
+        self.assertSetEqual(
+            eu.load_dependencies(common.MEASUREMENT, mapped_tables),
+            {common.MEASUREMENT, common.VISIT_OCCURRENCE})
+        self.assertSetEqual(eu.load_dependencies(common.PERSON, mapped_tables),
+                            {common.CARE_SITE, common.LOCATION})
+        self.assertSetEqual(eu.load_dependencies(common.DEATH, mapped_tables),
+                            set())
+        self.assertSetEqual(
+            eu.load_dependencies(common.FACT_RELATIONSHIP, mapped_tables),
+            {common.MEASUREMENT, common.OBSERVATION})
+
     def tearDown(self):
         pass